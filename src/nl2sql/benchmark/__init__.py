@@ -0,0 +1,3 @@
+from .server import FakeOpenAIServer, fake_embedding
+from .schema import SyntheticQuestion, create_synthetic_schema, synthetic_questions
+from .runner import BenchmarkConfig, BenchmarkReport, run_benchmark, arun_benchmark
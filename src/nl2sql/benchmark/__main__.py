@@ -0,0 +1,61 @@
+import sys
+import argparse
+
+from nl2sql.benchmark.runner import BenchmarkConfig, BenchmarkReport, run_benchmark
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m nl2sql.benchmark",
+        description="Offline benchmark of Text2SQLAssembly.generate with a fake LLM and a synthetic schema."
+    )
+    parser.add_argument("--db-uri", help="database to create the schema in, a temporary SQLite file by default")
+    parser.add_argument("--tables", type=int, default=100)
+    parser.add_argument("--columns", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=50)
+    parser.add_argument("--references", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", default="1,4,16", help="comma separated concurrency levels")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first completion token")
+    parser.add_argument("--token-rate", type=float, default=100.0, help="completion tokens per second")
+    parser.add_argument("--embedding-latency", type=float, default=0.01)
+    parser.add_argument("--cold-metadata", action="store_true", help="describe tables on every request")
+    parser.add_argument(
+        "--coalesce-requests", action="store_true", help="let identical concurrent questions share one generation"
+    )
+    parser.add_argument("--trace-memory", action="store_true", help="report the peak of traced Python allocations")
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--baseline", help="JSON report to compare with, exits with 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(BenchmarkConfig(
+        db_uri=args.db_uri,
+        tables=args.tables,
+        columns=args.columns,
+        rows=args.rows,
+        references=args.references,
+        requests=args.requests,
+        concurrency=[int(x) for x in args.concurrency.split(",")],
+        latency=args.latency,
+        token_rate=args.token_rate,
+        embedding_latency=args.embedding_latency,
+        cold_metadata=args.cold_metadata,
+        coalesce_requests=args.coalesce_requests,
+        trace_memory=args.trace_memory
+    ))
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report.model_dump_json(indent=2))
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = report.regressions(BenchmarkReport.model_validate_json(f.read()), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+import sys
+import time
+import asyncio
+import tempfile
+import tracemalloc
+
+import numpy as np
+import sqlalchemy
+from pydantic import BaseModel
+from typing import (
+    Optional
+)
+
+from nl2sql.benchmark.server import FakeOpenAIServer, fake_embedding
+from nl2sql.benchmark.schema import create_synthetic_schema, synthetic_questions
+from nl2sql.tools.database.catalog import MetadataCatalog
+from nl2sql.tools.database.embedding import EmbeddingCache
+from nl2sql.tools.database.references import LocalReferenceStore
+from nl2sql.tools.text2sql.assembly import Text2SQLAssembly
+
+# report stage -> span of `NL2SQLResult.timings`
+STAGES = {
+    "linking": "link_tables",
+    "metadata": "query_tables_metadata",
+    "references": "query_similar_questions",
+    "llm": "chat_completion",
+    "total": "generate"
+}
+
+
+class BenchmarkConfig(BaseModel):
+    db_uri: Optional[str] = None  # a temporary SQLite file when None
+    tables: int = 100
+    columns: int = 8
+    rows: int = 50
+    references: int = 5000
+    requests: int = 64
+    concurrency: list[int] = [1, 4, 16]
+    latency: float = 0.2
+    token_rate: float = 100.0
+    embedding_latency: float = 0.01
+    embedding_dim: int = 256
+    cold_metadata: bool = False
+    # identical concurrent questions share one generation, off so that every request is measured
+    coalesce_requests: bool = False
+    trace_memory: bool = False
+    seed: int = 0
+
+
+class StageStats(BaseModel):
+    """
+    Latencies in milliseconds.
+    """
+    count: int
+    p50: float
+    p95: float
+    mean: float
+
+
+class LevelReport(BaseModel):
+    concurrency: int
+    requests: int
+    errors: int
+    # requests answered by an identical concurrent request's generation
+    coalesced: int = 0
+    seconds: float
+    throughput: float
+    stages: dict[str, StageStats]
+    first_error: Optional[str] = None
+    peak_traced_mb: Optional[float] = None
+
+
+class BenchmarkReport(BaseModel):
+    config: BenchmarkConfig
+    levels: list[LevelReport]
+    peak_rss_mb: float
+
+    def regressions(self, baseline: "BenchmarkReport", tolerance: float = 0.2) -> list[str]:
+        """
+        Stages whose p95 grew, and levels whose throughput dropped, by more than `tolerance` against the baseline.
+        """
+        found = []
+        baseline_levels = {x.concurrency: x for x in baseline.levels}
+        for level in self.levels:
+            before = baseline_levels.get(level.concurrency)
+            if before is None:
+                continue
+            for stage, stats in level.stages.items():
+                if stage in before.stages and stats.p95 > before.stages[stage].p95 * (1 + tolerance):
+                    found.append(
+                        f"concurrency {level.concurrency}: {stage} p95 "
+                        f"{before.stages[stage].p95:.1f}ms -> {stats.p95:.1f}ms"
+                    )
+            if level.throughput < before.throughput * (1 - tolerance):
+                found.append(
+                    f"concurrency {level.concurrency}: throughput "
+                    f"{before.throughput:.2f}/s -> {level.throughput:.2f}/s"
+                )
+        return found
+
+    def __str__(self):
+        lines = [f"{'concurrency':>11} {'stage':>10} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9}"]
+        for level in self.levels:
+            for stage, stats in level.stages.items():
+                lines.append(
+                    f"{level.concurrency:>11} {stage:>10} {stats.count:>6} "
+                    f"{stats.p50:>9.1f} {stats.p95:>9.1f} {stats.mean:>9.1f}"
+                )
+            traced = f", peak traced {level.peak_traced_mb:.1f}MB" if level.peak_traced_mb is not None else ""
+            coalesced = f", {level.coalesced} coalesced" if self.config.coalesce_requests else ""
+            lines.append(
+                f"{level.concurrency:>11} {level.throughput:.2f} req/s, "
+                f"{level.errors} errors{coalesced} in {level.requests} requests{traced}"
+            )
+        lines.append(f"peak rss {self.peak_rss_mb:.1f}MB")
+        return "\n".join(lines)
+
+
+def run_benchmark(config: BenchmarkConfig) -> BenchmarkReport:
+    return asyncio.run(arun_benchmark(config))
+
+
+async def arun_benchmark(config: BenchmarkConfig) -> BenchmarkReport:
+    """
+    Run `Text2SQLAssembly.generate` against the fake LLM server, a synthetic schema and an in-process reference
+    store, once per concurrency level with cleared caches.
+    """
+    with tempfile.TemporaryDirectory() as workdir, FakeOpenAIServer(
+            latency=config.latency,
+            token_rate=config.token_rate,
+            embedding_latency=config.embedding_latency,
+            embedding_dim=config.embedding_dim
+    ) as server:
+        db_uri = config.db_uri or f"sqlite:///{workdir}/benchmark.db"
+        engine = sqlalchemy.create_engine(db_uri)
+        names = create_synthetic_schema(engine, config.tables, config.columns, config.rows, seed=config.seed)
+        engine.dispose()
+
+        references = synthetic_questions(names, config.references, config.seed + 1)
+        store = LocalReferenceStore.build(f"{workdir}/references", [
+            {"query": x.question, "sql": x.sql, "tags": [], "vector": fake_embedding(x.question, config.embedding_dim)}
+            for x in references
+        ])
+        catalog = MetadataCatalog(ddl_ttl=0, sample_ttl=0) if config.cold_metadata else MetadataCatalog()
+        embeddings = EmbeddingCache()
+        text2sql = Text2SQLAssembly(
+            db_uri=db_uri,
+            openai_baseurl=server.base_url,
+            openai_apikey="benchmark",
+            llm_model="fake-llm",
+            embedding_model="fake-embedding",
+            reference_store=store,
+            metadata_catalog=catalog,
+            embedding_cache=embeddings,
+            coalesce_requests=config.coalesce_requests
+        )
+        questions = synthetic_questions(names, config.requests, config.seed)
+
+        if config.trace_memory:
+            tracemalloc.start()
+        levels = []
+        try:
+            for concurrency in config.concurrency:
+                catalog.clear()
+                embeddings.clear()
+                if config.trace_memory:
+                    tracemalloc.reset_peak()
+                levels.append(await _run_level(text2sql, questions, concurrency))
+                if config.trace_memory:
+                    levels[-1].peak_traced_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            if config.trace_memory:
+                tracemalloc.stop()
+            text2sql.close()
+        return BenchmarkReport(config=config, levels=levels, peak_rss_mb=_peak_rss_mb())
+
+
+async def _run_level(text2sql: Text2SQLAssembly, questions: list, concurrency: int) -> LevelReport:
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = {x: [] for x in STAGES}
+    errors, first_error = 0, None
+    coalesced = text2sql.coalesced_requests
+
+    async def one(question) -> None:
+        nonlocal errors, first_error
+        async with semaphore:
+            try:
+                result = await text2sql.generate(question.question, question.tables)
+            except Exception as e:
+                errors += 1
+                first_error = first_error or f"{type(e).__name__}: {e}"
+                return
+            for stage, name in STAGES.items():
+                if name in result.timings:
+                    samples[stage].append(result.timings[name] * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(x) for x in questions])
+    seconds = time.perf_counter() - start
+    return LevelReport(
+        concurrency=concurrency,
+        requests=len(questions),
+        errors=errors,
+        coalesced=text2sql.coalesced_requests - coalesced,
+        seconds=seconds,
+        throughput=(len(questions) - errors) / seconds if seconds else 0.0,
+        first_error=first_error,
+        stages={
+            stage: StageStats(
+                count=len(x),
+                p50=float(np.percentile(x, 50)),
+                p95=float(np.percentile(x, 95)),
+                mean=float(np.mean(x))
+            ) for stage, x in samples.items() if x
+        }
+    )
+
+
+def _peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
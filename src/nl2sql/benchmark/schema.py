@@ -0,0 +1,123 @@
+import random
+import datetime
+
+from pydantic import BaseModel
+from sqlalchemy import (
+    Engine,
+    MetaData,
+    Table,
+    Column,
+    Integer,
+    String,
+    Numeric,
+    Date,
+    ForeignKey
+)
+
+_ENTITIES = [
+    "customer", "order", "product", "invoice", "employee", "asset", "project", "ticket",
+    "shipment", "payment", "supplier", "contract", "department", "warehouse", "campaign", "device"
+]
+_STATUSES = ["active", "pending", "closed", "archived"]
+
+
+class SyntheticQuestion(BaseModel):
+    question: str
+    tables: list[str]
+    sql: str
+
+
+def synthetic_table_names(tables: int, prefix: str = "bench_") -> list[str]:
+    return [f"{prefix}{_ENTITIES[i % len(_ENTITIES)]}_{i:04d}" for i in range(tables)]
+
+
+def create_synthetic_schema(
+        engine: Engine,
+        tables: int = 100,
+        columns: int = 8,
+        rows: int = 50,
+        prefix: str = "bench_",
+        seed: int = 0
+) -> list[str]:
+    """
+    Create `tables` commented tables of `columns` columns and `rows` rows, each referencing the previous table.
+    Existing tables with the same prefix are dropped first. Returns the table names.
+    """
+    rng = random.Random(seed)
+    metadata = MetaData()
+    names = synthetic_table_names(tables, prefix)
+    for i, name in enumerate(names):
+        entity = _entity(name)
+        fixed = [
+            Column("id", Integer, primary_key=True, comment=f"{entity} id"),
+            Column("name", String(64), nullable=False, comment=f"{entity} name"),
+            Column("status", String(16), comment=f"{entity} status: {', '.join(_STATUSES)}"),
+            Column("amount", Numeric(12, 2), comment=f"{entity} amount in CNY"),
+            Column("created_on", Date, comment=f"date the {entity} was created"),
+        ]
+        if i > 0:
+            fixed.append(Column(
+                "parent_id", Integer, ForeignKey(f"{names[i - 1]}.id"), comment=f"referenced {names[i - 1]}"
+            ))
+        extra = [
+            Column(f"attr_{j}", String(32), comment=f"{entity} attribute {j}")
+            for j in range(max(columns - len(fixed), 0))
+        ]
+        Table(name, metadata, *fixed, *extra, comment=f"{entity}s of business unit {i}")
+
+    existing = MetaData()
+    existing.reflect(engine, only=lambda name, _: name.startswith(prefix))
+    existing.drop_all(engine)
+    metadata.create_all(engine)
+    start = datetime.date(2024, 1, 1)
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            entity = _entity(table.name)
+            values = []
+            for row in range(1, rows + 1):
+                value = {
+                    "id": row,
+                    "name": f"{entity} {row}",
+                    "status": rng.choice(_STATUSES),
+                    "amount": round(rng.uniform(1, 10_000), 2),
+                    "created_on": start + datetime.timedelta(days=rng.randrange(365))
+                }
+                if "parent_id" in table.c:
+                    value["parent_id"] = rng.randint(1, rows)
+                for column in table.c:
+                    if column.name.startswith("attr_"):
+                        value[column.name] = f"{column.name} {rng.randrange(1000)}"
+                values.append(value)
+            if values:
+                conn.execute(table.insert(), values)
+    return names
+
+
+def synthetic_questions(names: list[str], count: int, seed: int = 0) -> list[SyntheticQuestion]:
+    """
+    Questions about one table, or a table and the one it references, with a matching SQL.
+    """
+    rng = random.Random(seed)
+    questions = []
+    for _ in range(count):
+        i = rng.randrange(len(names))
+        status = rng.choice(_STATUSES)
+        entity = _entity(names[i])
+        if i > 0 and rng.random() < 0.5:
+            questions.append(SyntheticQuestion(
+                question=f"total amount of {status} {entity}s of unit {i} by referenced record",
+                tables=[names[i], names[i - 1]],
+                sql=f"SELECT p.name, SUM(t.amount) FROM {names[i]} t JOIN {names[i - 1]} p ON t.parent_id = p.id "
+                    f"WHERE t.status = '{status}' GROUP BY p.name;"
+            ))
+        else:
+            questions.append(SyntheticQuestion(
+                question=f"list the {status} {entity}s of unit {i} created this year",
+                tables=[names[i]],
+                sql=f"SELECT * FROM {names[i]} WHERE status = '{status}' AND created_on >= '2024-01-01';"
+            ))
+    return questions
+
+
+def _entity(name: str) -> str:
+    return _ENTITIES[int(name.rsplit("_", 1)[-1]) % len(_ENTITIES)]
@@ -0,0 +1,196 @@
+import sys
+import json
+import math
+import time
+import zlib
+import base64
+import threading
+
+import numpy as np
+from http.server import (
+    ThreadingHTTPServer,
+    BaseHTTPRequestHandler
+)
+from pydantic import (
+    BaseModel,
+    PrivateAttr
+)
+from typing import (
+    Any,
+    Optional
+)
+
+
+class FakeOpenAIServer(BaseModel):
+    """
+    Local OpenAI-compatible stand-in serving `/v1/chat/completions` (plain and streamed) and `/v1/embeddings`.
+    A completion waits `latency` seconds before its first token and then emits `token_rate` tokens per second,
+    embeddings are deterministic hashed bags of words so that similar texts get similar vectors.
+    """
+    host: str = "127.0.0.1"
+    port: int = 0
+    latency: float = 0.2
+    token_rate: float = 100.0
+    embedding_latency: float = 0.01
+    embedding_dim: int = 256
+    reply: str = "SELECT * FROM {table} LIMIT 10;"
+
+    _server: Optional[ThreadingHTTPServer] = PrivateAttr(None)
+    _thread: Optional[threading.Thread] = PrivateAttr(None)
+    _requests: dict[str, int] = PrivateAttr(default_factory=lambda: {"chat": 0, "embeddings": 0})
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def requests(self) -> dict[str, int]:
+        return dict(self._requests)
+
+    def start(self) -> "FakeOpenAIServer":
+        self._server = _Server((self.host, self.port), _handler(self))
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def completion(self, messages: list[dict]) -> str:
+        prompt = "\n".join(str(x.get("content", "")) for x in messages)
+        marker = prompt.find("CREATE TABLE ")
+        table = prompt[marker + 13:].split(" ", 1)[0].strip('"`(') if marker >= 0 else "dual"
+        return self.reply.format(table=table)
+
+    def _count(self, kind: str) -> None:
+        with self._lock:
+            self._requests[kind] += 1
+
+
+def fake_embedding(text: str, dim: int = 256) -> list[float]:
+    """
+    Hashed bag of words (and of characters for CJK text), L2-normalized.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    words = text.lower().split()
+    words += [x for x in text if ord(x) >= 0x2E80]
+    for word in words:
+        h = zlib.crc32(word.encode("utf-8"))
+        vector[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = float(np.linalg.norm(vector))
+    return (vector / norm if norm else vector).tolist()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # the default backlog of 5 drops connections under concurrency, stalling clients for a SYN retry
+    request_queue_size = 1024
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        # clients hang up on cancelled and early closed requests
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def _handler(fake: FakeOpenAIServer) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # headers and body are separate writes, avoid the delayed ACK stall on keep-alive connections
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+        def do_POST(self) -> None:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path.endswith("/chat/completions"):
+                fake._count("chat")
+                self._chat(body)
+            elif self.path.endswith("/embeddings"):
+                fake._count("embeddings")
+                self._embeddings(body)
+            else:
+                self._json({"error": {"message": f"Unknown path {self.path}"}}, 404)
+
+        def _chat(self, body: dict) -> None:
+            content = fake.completion(body.get("messages", []))
+            pieces = [content[i:i + 4] for i in range(0, len(content), 4)]
+            prompt_tokens = sum(math.ceil(len(str(x.get("content", ""))) / 4) for x in body.get("messages", []))
+            head = {"id": "chatcmpl-fake", "created": int(time.time()), "model": body.get("model", "")}
+            time.sleep(fake.latency)
+            if not body.get("stream"):
+                time.sleep(len(pieces) / fake.token_rate)
+                self._json({
+                    **head,
+                    "object": "chat.completion",
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop"
+                    }],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": len(pieces),
+                        "total_tokens": prompt_tokens + len(pieces)
+                    }
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for i, piece in enumerate(pieces + [None]):
+                choice = {"index": 0, "delta": {"content": piece} if piece else {}, "finish_reason": None}
+                if piece is None:
+                    choice["finish_reason"] = "stop"
+                elif i:
+                    time.sleep(1 / fake.token_rate)
+                chunk = {**head, "object": "chat.completion.chunk", "choices": [choice]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+
+        def _embeddings(self, body: dict) -> None:
+            inputs = body.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            time.sleep(fake.embedding_latency)
+            tokens = sum(math.ceil(len(x) / 4) for x in inputs)
+            self._json({
+                "object": "list",
+                "model": body.get("model", ""),
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": self._encode(x, body.get("encoding_format"))}
+                    for i, x in enumerate(inputs)
+                ],
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+            })
+
+        @staticmethod
+        def _encode(text: str, encoding_format: Optional[str]) -> list[float] | str:
+            embedding = fake_embedding(text, fake.embedding_dim)
+            if encoding_format == "base64":
+                return base64.b64encode(np.asarray(embedding, dtype=np.float32).tobytes()).decode("ascii")
+            return embedding
+
+        def _json(self, payload: dict, status: int = 200) -> None:
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
@@ -0,0 +1,292 @@
+import time
+import inspect
+import weakref
+import threading
+import contextlib
+
+from collections import OrderedDict
+from pydantic import (
+    BaseModel,
+    ConfigDict,
+    PrivateAttr
+)
+from sqlalchemy import (
+    Engine,
+    Connection
+)
+from typing import (
+    Any,
+    Callable,
+    Optional,
+    Iterable
+)
+
+from nl2sql.tools.database.data import SampleStrategy
+from nl2sql.tools.database.metadata import Metadata, query_schema_fingerprints
+
+
+class _Entry(BaseModel):
+    value: Any
+    expires_at: float
+
+
+class MetadataCatalog(BaseModel):
+    """
+    Process-wide cache of table metadata keyed by (engine url, schema, table).
+    DDL and sample values are cached separately because samples go stale faster,
+    samples are also keyed by their limit and sampling strategy.
+    A TTL of 0 disables the corresponding cache.
+    `refresh` rebuilds only the tables whose schema fingerprint changed since it was recorded, by the previous
+    refresh or, with `track_schema`, when the DDL was fetched. Tracking costs an extra query per DDL miss
+    and catches changes made before the first refresh.
+    """
+    ddl_ttl: float = 3600
+    sample_ttl: float = 600
+    max_entries: int = 4096
+    track_schema: bool = False
+
+    _ddls: OrderedDict = PrivateAttr(default_factory=OrderedDict)
+    _samples: OrderedDict = PrivateAttr(default_factory=OrderedDict)
+    _fingerprints: dict[tuple, str] = PrivateAttr(default_factory=dict)
+    # callables returning the listener, or None once a listening object is garbage collected
+    _listeners: list[Callable[[], Optional[Callable]]] = PrivateAttr(default_factory=list)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def query_many(
+            self,
+            conn: Connection,
+            tables: Iterable[str],
+            schema: str = None,
+            sample_limit: int = 3,
+            sample_strategy: SampleStrategy = SampleStrategy.AUTO
+    ) -> list[Metadata]:
+        url = engine_key(conn.engine)
+        tables = list(tables)
+        ddls, samples = {}, {}
+        for table in tables:
+            ddl = self._get(self._ddls, (url, schema, table))
+            if ddl is not None:
+                ddls[table] = ddl
+            sample = self._get(self._samples, (url, schema, table, sample_limit, sample_strategy))
+            if sample is not None:
+                samples[table] = sample
+
+        fetched = {}
+        # refresh everything for tables with stale ddl, only samples for the rest
+        stale_ddls = [x for x in dict.fromkeys(tables) if x not in ddls]
+        stale_samples = [x for x in dict.fromkeys(tables) if x in ddls and x not in samples]
+        fingerprints = {}
+        if stale_ddls and self.track_schema:
+            # probed before reflecting, a change in between is caught by the next refresh
+            fingerprints = query_schema_fingerprints(conn, stale_ddls, schema)
+        if stale_ddls:
+            fetched.update({
+                x.table_name: x for x in Metadata.query_many(
+                    conn, stale_ddls, schema, sample_limit, True, sample_strategy
+                )
+            })
+        if stale_samples:
+            fetched.update({
+                x.table_name: x for x in Metadata.query_many(
+                    conn, stale_samples, schema, sample_limit, False, sample_strategy
+                )
+            })
+        for table, metadata in fetched.items():
+            if metadata.error is not None:
+                continue
+            if table not in ddls:
+                ddls[table] = (metadata.description, metadata.ddl)
+                self._put(self._ddls, (url, schema, table), ddls[table], self.ddl_ttl)
+                if table in fingerprints:
+                    with self._lock:
+                        self._fingerprints[(url, schema, table)] = fingerprints[table]
+            samples[table] = metadata.samples
+            self._put(
+                self._samples, (url, schema, table, sample_limit, sample_strategy), samples[table], self.sample_ttl
+            )
+
+        results = []
+        for table in tables:
+            if table in ddls and table in samples:
+                description, ddl = ddls[table]
+                results.append(Metadata(table_name=table, description=description, ddl=ddl, samples=samples[table]))
+            else:
+                results.append(fetched[table])
+        return results
+
+    def refresh(self, conn: Connection) -> list[tuple[Optional[str], str]]:
+        """
+        Compare the schema fingerprints of the tables cached for the connection's engine with the recorded ones,
+        drop the changed tables and fetch their DDL again; dropped tables are only invalidated.
+        The fingerprints of tables cached without one are recorded, not counted as changes.
+        Returns the (schema, table) pairs that changed.
+        """
+        url = engine_key(conn.engine)
+        with self._lock:
+            tracked = {}
+            for key in self._ddls:
+                if key[0] == url:
+                    tracked.setdefault(key[1], []).append(key[2])
+            # forget the fingerprints of evicted entries
+            for key in [x for x in self._fingerprints if x not in self._ddls]:
+                del self._fingerprints[key]
+
+        changed = []
+        for schema, tables in tracked.items():
+            fingerprints = query_schema_fingerprints(conn, tables, schema)
+            with self._lock:
+                recorded = {x: self._fingerprints.get((url, schema, x)) for x in tables}
+                for table, fingerprint in fingerprints.items():
+                    if recorded.get(table) is None:
+                        self._fingerprints[(url, schema, table)] = fingerprint
+            stale = [
+                x for x in tables
+                if x not in fingerprints or recorded[x] is not None and recorded[x] != fingerprints[x]
+            ]
+            for table in stale:
+                self.invalidate(table, schema, url)
+            existing = [x for x in stale if x in fingerprints]
+            if existing:
+                for metadata in Metadata.query_many(conn, existing, schema, 0, True):
+                    if metadata.error is not None:
+                        continue
+                    key = (url, schema, metadata.table_name)
+                    self._put(self._ddls, key, (metadata.description, metadata.ddl), self.ddl_ttl)
+                    with self._lock:
+                        self._fingerprints[key] = fingerprints[metadata.table_name]
+            changed.extend((schema, x) for x in stale)
+        if changed:
+            for listener in self._live_listeners():
+                # a failing listener must not stop the refresh of the others
+                with contextlib.suppress(Exception):
+                    listener(url, changed)
+        return changed
+
+    def add_listener(self, listener: Callable[[str, list[tuple[Optional[str], str]]], None]) -> None:
+        """
+        Call `listener` with the engine url and the changed (schema, table) pairs after each `refresh`
+        finding changes, e.g. to update indexes built from the DDL. Remove it with `remove_listener`.
+        A bound method is only weakly referenced, the catalog doesn't keep its object alive.
+        """
+        reference = weakref.WeakMethod(listener) if inspect.ismethod(listener) else lambda: listener
+        with self._lock:
+            self._listeners.append(reference)
+
+    def remove_listener(self, listener: Callable[[str, list[tuple[Optional[str], str]]], None]) -> None:
+        with self._lock:
+            self._listeners = [x for x in self._listeners if x() is not None and x() != listener]
+
+    def _live_listeners(self) -> list[Callable[[str, list[tuple[Optional[str], str]]], None]]:
+        with self._lock:
+            listeners = [x() for x in self._listeners]
+            # drop the listeners of collected objects
+            self._listeners = [x for x, listener in zip(self._listeners, listeners) if listener is not None]
+        return [x for x in listeners if x is not None]
+
+    def invalidate(self, table: str = None, schema: str = None, url: str = None) -> int:
+        """
+        Drop cached entries matching the given table, schema and engine url; None matches anything.
+        Returns the number of tables whose DDL was dropped.
+        """
+
+        def matched(key: tuple) -> bool:
+            return ((url is None or key[0] == url)
+                    and (schema is None or key[1] == schema)
+                    and (table is None or key[2] == table))
+
+        with self._lock:
+            dropped = [x for x in self._ddls if matched(x)]
+            for key in dropped:
+                del self._ddls[key]
+            for key in [x for x in self._samples if matched(x)]:
+                del self._samples[key]
+            for key in [x for x in self._fingerprints if matched(x)]:
+                del self._fingerprints[key]
+        return len(dropped)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ddls.clear()
+            self._samples.clear()
+            self._fingerprints.clear()
+
+    def __len__(self) -> int:
+        return len(self._ddls)
+
+    def _get(self, cache: OrderedDict, key: tuple) -> Optional[Any]:
+        with self._lock:
+            entry = cache.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.monotonic():
+                del cache[key]
+                return None
+            cache.move_to_end(key)
+            return entry.value
+
+    def _put(self, cache: OrderedDict, key: tuple, value: Any, ttl: float) -> None:
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            cache[key] = _Entry(value=value, expires_at=time.monotonic() + ttl)
+            cache.move_to_end(key)
+            while len(cache) > self.max_entries:
+                cache.popitem(last=False)
+
+
+class SchemaRefresher(BaseModel):
+    """
+    Background thread refreshing the catalog's tables of an engine every `interval` seconds,
+    so that a shared catalog does not serve DDL of altered tables until its TTL expires.
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    catalog: MetadataCatalog
+    engine: Engine
+    interval: float = 60
+
+    _thread: Optional[threading.Thread] = PrivateAttr(None)
+    _stopped: threading.Event = PrivateAttr(default_factory=threading.Event)
+    _last_error: Optional[Exception] = PrivateAttr(None)
+
+    @property
+    def last_error(self) -> Optional[Exception]:
+        return self._last_error
+
+    def refresh(self) -> list[tuple[Optional[str], str]]:
+        with self.engine.connect() as conn:
+            return self.catalog.refresh(conn)
+
+    def start(self) -> "SchemaRefresher":
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="nl2sql-schema-refresher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> "SchemaRefresher":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self.refresh()
+                self._last_error = None
+            except Exception as e:
+                # the database may be briefly unreachable, try again at the next interval
+                self._last_error = e
+
+
+def engine_key(engine: Engine) -> str:
+    return engine.url.render_as_string(hide_password=True)
+
+
+shared_catalog = MetadataCatalog()
@@ -1,16 +1,28 @@
+import re
+import json
+import random
 import records
+import contextlib
+from os import sep
+from enum import Enum
 from pydantic import BaseModel
 from typing import (
+    Callable,
     Optional,
     Sequence
 )
 from sqlalchemy import (
-    Table,
+    TableClause,
     Connection,
     func,
+    text,
     select,
+    bindparam,
 )
 
+from nl2sql.utils.path import fpd
+from nl2sql.utils.strings import read_file_to_str, find_statement_end, skip_comments
+
 
 class AmbiguousResult(BaseModel):
     sql: str
@@ -19,42 +31,407 @@ class AmbiguousResult(BaseModel):
     error: Optional[str] = None
 
 
-def sample_table(conn: Connection, table: Table, limit: int = 3) -> Sequence:
+class SampleStrategy(str, Enum):
+    AUTO = "auto"
+    RANDOM = "random"
+    BERNOULLI = "bernoulli"
+    SYSTEM = "system"
+    PK_RANGE = "pk_range"
+    HEAD = "head"
+
+
+class CostAction(str, Enum):
+    ALLOW = "allow"
+    LIMIT = "limit"
+    REJECT = "reject"
+
+
+class CostVerdict(BaseModel):
+    """
+    Decision of a `CostGuard`, `sql` is what to execute (with a LIMIT added when the action is LIMIT),
+    `cost` and `rows` are the planner's estimates for the SQL as given.
+    """
+    action: CostAction
+    sql: str
+    cost: Optional[float] = None
+    rows: Optional[float] = None
+    reason: Optional[str] = None
+
+    @property
+    def allowed(self) -> bool:
+        return self.action != CostAction.REJECT
+
+
+class CostGuard(BaseModel):
+    """
+    Pre-execution guard comparing the planner's estimates (EXPLAIN) against thresholds.
+    A query over a threshold is wrapped with a LIMIT of `limit` rows when that brings it within the thresholds,
+    otherwise it is rejected. `None` disables a threshold, or the rewrite.
+    """
+    max_cost: Optional[float] = 1_000_000
+    max_rows: Optional[float] = 100_000
+    limit: Optional[int] = 1000
+
+    def check(self, conn: Connection, sql: str) -> CostVerdict:
+        """
+        EXPLAIN doesn't execute the statement, but a failing EXPLAIN aborts the current PostgreSQL transaction.
+        """
+        end = find_statement_end(sql, conn.dialect.name)
+        # whitespace and comments after the final `;` are not another statement
+        if end >= 0 and skip_comments(sql, end + 1) < len(sql):
+            return CostVerdict(action=CostAction.REJECT, sql=sql, reason="Only a single statement is allowed.")
+        sql = sql[:end] if end >= 0 else sql.strip()
+        try:
+            cost, rows = explain_cost(conn, sql)
+        except NotImplementedError:
+            raise
+        except Exception as e:
+            return CostVerdict(action=CostAction.REJECT, sql=sql, reason=f"EXPLAIN failed: {getattr(e, 'orig', e)}")
+
+        exceeded = self._exceeded(cost, rows)
+        if not exceeded:
+            return CostVerdict(action=CostAction.ALLOW, sql=sql, cost=cost, rows=rows)
+        if self.limit is not None and _is_query(sql):
+            limited = f"SELECT * FROM (\n{sql}\n) AS limited LIMIT {self.limit}"
+            try:
+                if not self._exceeded(*explain_cost(conn, limited)):
+                    return CostVerdict(
+                        action=CostAction.LIMIT,
+                        sql=limited,
+                        cost=cost,
+                        rows=rows,
+                        reason=f"{exceeded}, the result is limited to {self.limit} rows."
+                    )
+            except Exception:
+                pass
+        return CostVerdict(
+            action=CostAction.REJECT,
+            sql=sql,
+            cost=cost,
+            rows=rows,
+            reason=f"{exceeded}, add selective predicates, join conditions or aggregations."
+        )
+
+    def _exceeded(self, cost: float, rows: float) -> Optional[str]:
+        if self.max_cost is not None and cost > self.max_cost:
+            return f"Estimated cost {cost:.0f} exceeds {self.max_cost:.0f}"
+        if self.max_rows is not None and rows > self.max_rows:
+            return f"Estimated {rows:.0f} rows exceed {self.max_rows:.0f}"
+        return None
+
+
+# rows fetched from the server per round trip by execute_sql
+FETCH_BATCH_SIZE = 500
+TRUNCATED_KEY = "__truncated__"
+_QUERY_RE = re.compile(r"\s*(\(\s*)*(SELECT|WITH|VALUES|TABLE)\b", re.IGNORECASE)
+
+# tables estimated up to these sizes are sampled with the cheaper-but-better strategy
+RANDOM_SAMPLE_MAX_ROWS = 10_000
+BERNOULLI_SAMPLE_MAX_ROWS = 1_000_000
+# factor of extra rows asked from TABLESAMPLE so that the LIMIT is usually filled
+_SAMPLE_OVERSAMPLING = 4
+# SYSTEM picks whole pages, ask for about 10 pages assuming ~100 rows per page
+_SYSTEM_SAMPLE_MIN_ROWS = 1_000
+
+
+def estimate_table_rows(conn: Connection, tables: list[str], schema: str = None) -> dict[str, Optional[float]]:
+    """
+    Read planner row estimates of the given tables, None if the planner has no estimate.
+    """
+    dialect = conn.engine.dialect.name
+    if dialect == 'postgresql':
+        query = text(read_file_to_str(f"{fpd(__file__, 2)}{sep}resources{sep}sqls{sep}rows_postgres.sql"))
+    elif dialect == 'mysql':
+        query = text(read_file_to_str(f"{fpd(__file__, 2)}{sep}resources{sep}sqls{sep}rows_mysql.sql"))
+        query = query.bindparams(bindparam("tables", expanding=True))
+    elif dialect == 'sqlite':
+        # sqlite keeps no row estimates
+        return {name: None for name in tables}
+    else:
+        raise NotImplementedError(f"Unsupported dialect: {dialect}")
+    result = conn.execute(query, {"tables": tables, "schema": schema})
+    return {name: float(rows) if rows is not None and rows >= 0 else None for name, rows in result}
+
+
+def choose_sample_strategy(dialect: str, rows: Optional[float], pk_column: str = None) -> SampleStrategy:
+    if rows is None:
+        return SampleStrategy.PK_RANGE if pk_column else SampleStrategy.HEAD
+    if rows <= RANDOM_SAMPLE_MAX_ROWS:
+        return SampleStrategy.RANDOM
+    if rows <= BERNOULLI_SAMPLE_MAX_ROWS:
+        return SampleStrategy.BERNOULLI
+    if dialect == 'postgresql':
+        return SampleStrategy.SYSTEM
+    return SampleStrategy.PK_RANGE if pk_column else SampleStrategy.HEAD
+
+
+def sample_table(
+        conn: Connection,
+        table: TableClause,
+        limit: int = 3,
+        strategy: SampleStrategy = SampleStrategy.RANDOM,
+        rows: Optional[float] = None,
+        pk_column: str = None
+) -> Sequence:
+    """
+    Sample rows of a table.
+
+    Args:
+        conn (Connection): Database connection.
+        table (TableClause): Table to sample, its columns are selected.
+        limit (int, optional): Max number of rows. Defaults to 3.
+        strategy (SampleStrategy, optional): How to pick rows. Defaults to `RANDOM`, which sorts the whole table.
+        rows (float, optional): Estimated row count, used by `AUTO`, `BERNOULLI` and `SYSTEM`.
+        pk_column (str, optional): Integer primary key column, required by `PK_RANGE`.
+    """
     dialect = conn.engine.dialect.name
-    if dialect not in ('postgresql', 'mysql'):
+    if dialect not in ('postgresql', 'mysql', 'sqlite'):
         raise NotImplementedError(f"Unsupported dialect: {dialect}")
-    rand_func = func.random if dialect == 'postgresql' else func.rand
-    stmt = select(table).order_by(rand_func()).limit(limit)
+    if strategy is SampleStrategy.AUTO:
+        strategy = choose_sample_strategy(dialect, rows, pk_column)
+    if strategy is SampleStrategy.PK_RANGE and not pk_column:
+        strategy = SampleStrategy.HEAD
+
+    if strategy is SampleStrategy.RANDOM:
+        rand_func = func.rand if dialect == 'mysql' else func.random
+        stmt = select(table).order_by(rand_func()).limit(limit)
+    elif strategy in (SampleStrategy.BERNOULLI, SampleStrategy.SYSTEM):
+        wanted = limit * _SAMPLE_OVERSAMPLING
+        if strategy is SampleStrategy.SYSTEM:
+            wanted = max(wanted, _SYSTEM_SAMPLE_MIN_ROWS)
+        percent = min(100.0, wanted * 100 / rows) if rows else 100.0
+        if dialect == 'postgresql':
+            method = func.bernoulli if strategy is SampleStrategy.BERNOULLI else func.system
+            stmt = select(table.tablesample(method(percent))).limit(limit)
+        elif dialect == 'mysql':
+            stmt = select(table).where(func.rand() < percent / 100).limit(limit)
+        else:
+            # sqlite's random() is a signed 64-bit integer
+            stmt = select(table).where(func.abs(func.random() % 10_000) < percent * 100).limit(limit)
+    elif strategy is SampleStrategy.PK_RANGE:
+        return _sample_pk_range(conn, table, limit, pk_column)
+    else:
+        stmt = select(table).limit(limit)
+
     result = conn.execute(stmt).fetchall()
+    if not result and strategy is not SampleStrategy.HEAD:
+        result = conn.execute(select(table).limit(limit)).fetchall()
+    return result
+
+
+def _sample_pk_range(conn: Connection, table: TableClause, limit: int, pk_column: str) -> Sequence:
+    pk = table.c[pk_column]
+    low, high = conn.execute(select(func.min(pk), func.max(pk))).one()
+    if low is None:
+        return []
+    start = random.randint(low, high)
+    result = conn.execute(select(table).where(pk >= start).order_by(pk).limit(limit)).fetchall()
+    if len(result) < limit:
+        result += conn.execute(select(table).where(pk < start).order_by(pk).limit(limit - len(result))).fetchall()
     return result
 
 
 def execute_sql(
-        db: records.Database,
+        db: Connection | records.Database,
         sql: str,
-        fmt: Optional[str] = "markdown"
-) -> str | list[dict] | dict:
-    data = db.query(sql)
+        fmt: Optional[str] = "markdown",
+        max_rows: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        timeout: Optional[float] = None
+) -> str | list[dict] | dict | bytes:
+    """
+    Execute the SQL and render the result as "markdown", "columnar" (a list of values per column),
+    "arrow" (Arrow IPC stream bytes, requires pyarrow) or a list of row dicts for any other format.
+    Rows are read in batches from a server-side cursor and reading stops after `max_rows` rows or `max_bytes`
+    bytes of values, a truncated result is marked: a trailing line in markdown, a `truncated` reason in columnar
+    and arrow (schema metadata), a trailing `{"__truncated__": reason}` item in row dicts.
+    `timeout` (seconds) bounds the statement on the server, it is set for the rest of the current transaction.
+    """
+    if isinstance(db, records.Database):
+        with db.get_connection() as conn:
+            return execute_sql(_sqlalchemy_connection(conn), sql, fmt, max_rows, max_bytes, timeout)
+
+    keys, rows, truncated = _fetch_bounded(db, sql, max_rows, max_bytes, timeout)
     if fmt == "markdown":
-        return str(data.dataset)
+        data = str(records.RecordCollection(records.Record(keys, x) for x in rows).dataset)
+        return f"{data}\n... truncated, {truncated}" if truncated else data
+    elif fmt == "columnar":
+        return {
+            "columns": keys,
+            "values": [list(x) for x in zip(*rows)] if rows else [[] for _ in keys],
+            "truncated": truncated
+        }
+    elif fmt == "arrow":
+        return _to_arrow_ipc(keys, rows, truncated)
     else:
-        return data.as_dict()
+        data = [dict(zip(keys, x)) for x in rows]
+        return data + [{TRUNCATED_KEY: truncated}] if truncated else data
+
+
+def explain_cost(conn: Connection, sql: str) -> tuple[float, float]:
+    """
+    The planner's estimated total cost and number of result rows of the SQL, without executing it.
+    MySQL doesn't estimate the result rows, the largest number of rows produced by a join step is used.
+    """
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+        plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+        return float(plan["Total Cost"]), float(plan["Plan Rows"])
+    elif dialect == "mysql":
+        plan = json.loads(conn.execute(text(f"EXPLAIN FORMAT=JSON {sql}")).scalar())["query_block"]
+        cost = float(plan.get("cost_info", {}).get("query_cost", 0))
+        rows = [float(x) for x in _find_values(plan, "rows_produced_per_join")]
+        return cost, max(rows, default=1.0)
+    else:
+        raise NotImplementedError(f"Unsupported dialect: {dialect}")
 
 
 def find_ambiguous_entities(
-        db: records.Database,
+        db: Connection | records.Database,
         keyword: str,
         table: str,
         ambiguous_at: list[str],
-        display_columns: list[str] = None
+        display_columns: list[str] = None,
+        trigram: bool = False
 ) -> AmbiguousResult:
+    """
+    Find the rows whose `ambiguous_at` columns contain the keyword, case-insensitively.
+    The keyword is bound as a parameter, the table and column names are trusted.
+    With `trigram` (PostgreSQL with pg_trgm) the columns are matched with `ILIKE`, which trigram indexes can serve.
+    """
     display_columns = display_columns or ["*"]
-    params = [f"UPPER({column}) LIKE '%{keyword.upper()}%'" for column in ambiguous_at]
+    if trigram:
+        params = [f"{column} ILIKE :keyword" for column in ambiguous_at]
+        pattern = f"%{_escape_like(keyword)}%"
+    else:
+        params = [f"UPPER({column}) LIKE :keyword" for column in ambiguous_at]
+        pattern = f"%{_escape_like(keyword.upper())}%"
     sql = f"SELECT {','.join(display_columns)} FROM {table} WHERE {' OR '.join(params)}"
 
     try:
-        results = execute_sql(db, sql, "dict")
+        results = _query(db, sql, keyword=pattern).as_dict()
         return AmbiguousResult(is_ambiguous=len(results) > 1, results=results, sql=sql)
     except Exception as e:
         return AmbiguousResult(is_ambiguous=False, results=[], error=str(e), sql=sql)
 
+
+def has_trigram_extension(conn: Connection) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    return conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first() is not None
+
+
+def _fetch_bounded(
+        conn: Connection,
+        sql: str,
+        max_rows: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        timeout: Optional[float] = None
+) -> tuple[list[str], list[tuple], Optional[str]]:
+    reset = _set_statement_timeout(conn, timeout) if timeout is not None else None
+    try:
+        fetched = _fetch(conn, sql, max_rows, max_bytes)
+    except Exception:
+        if reset is not None:
+            # e.g. an aborted transaction refuses the reset, the query's error is the one to report
+            with contextlib.suppress(Exception):
+                reset()
+        raise
+    if reset is not None:
+        reset()
+    return fetched
+
+
+def _fetch(
+        conn: Connection,
+        sql: str,
+        max_rows: Optional[int] = None,
+        max_bytes: Optional[int] = None
+) -> tuple[list[str], list[tuple], Optional[str]]:
+    # server-side cursors only work for queries, other statements are executed as usual
+    options = {"stream_results": True, "max_row_buffer": FETCH_BATCH_SIZE} if _is_query(sql) else {}
+    cursor = conn.execution_options(**options).execute(text(sql))
+    if not cursor.returns_rows:
+        return [], [], None
+    keys, rows, size, truncated = list(cursor.keys()), [], 0, None
+    try:
+        while truncated is None and (batch := cursor.fetchmany(FETCH_BATCH_SIZE)):
+            for row in batch:
+                if max_rows is not None and len(rows) >= max_rows:
+                    truncated = f"more than {max_rows} rows"
+                    break
+                size += sum(len(str(x).encode("utf-8")) for x in row)
+                if max_bytes is not None and size > max_bytes:
+                    truncated = f"more than {max_bytes} bytes"
+                    break
+                rows.append(tuple(row))
+    finally:
+        cursor.close()
+    return keys, rows, truncated
+
+
+def _is_query(sql: str) -> bool:
+    # LLM output often starts with a comment
+    return _QUERY_RE.match(sql, skip_comments(sql)) is not None
+
+
+def _set_statement_timeout(conn: Connection, timeout: float) -> Optional[Callable[[], None]]:
+    milliseconds = max(int(timeout * 1000), 1)
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        conn.execute(text(f"SET LOCAL statement_timeout = {milliseconds}"))
+        return None
+    elif dialect == "mysql":
+        conn.execute(text(f"SET SESSION MAX_EXECUTION_TIME = {milliseconds}"))
+        return lambda: conn.execute(text("SET SESSION MAX_EXECUTION_TIME = DEFAULT"))
+    else:
+        raise NotImplementedError(f"Unsupported dialect: {dialect}")
+
+
+def _to_arrow_ipc(keys: list[str], rows: list[tuple], truncated: Optional[str] = None) -> bytes:
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError("The arrow format requires pyarrow, install it with `pip install pyarrow`.") from e
+    columns = list(zip(*rows)) if rows else [() for _ in keys]
+    table = pyarrow.Table.from_arrays(
+        [pyarrow.array(list(x)) for x in columns],
+        names=keys,
+        metadata={"truncated": truncated} if truncated else None
+    )
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _sqlalchemy_connection(conn: records.Connection) -> Connection:
+    """
+    The SQLAlchemy connection wrapped by a records connection. records has no public accessor for it,
+    this is the one place relying on its `_conn` attribute (records 0.6).
+    """
+    return conn._conn
+
+
+def _query(db: Connection | records.Database, sql: str, **params) -> records.RecordCollection:
+    if isinstance(db, records.Database):
+        return db.query(sql, **params)
+    cursor = db.execute(text(sql), params)
+    if not cursor.returns_rows:
+        return records.RecordCollection(iter([]))
+    return records.RecordCollection(records.Record(list(cursor.keys()), x) for x in cursor)
+
+
+def _find_values(node, key: str) -> list:
+    if isinstance(node, dict):
+        found = [node[key]] if key in node else []
+        return found + [x for v in node.values() for x in _find_values(v, key)]
+    if isinstance(node, list):
+        return [x for v in node for x in _find_values(v, key)]
+    return []
+
+
+def _escape_like(value: str) -> str:
+    # backslash is the default LIKE escape character of both PostgreSQL and MySQL
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
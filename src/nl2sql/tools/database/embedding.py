@@ -0,0 +1,188 @@
+import array
+import sqlite3
+import threading
+import unicodedata
+
+import openai
+from collections import OrderedDict
+from pydantic import (
+    BaseModel,
+    PrivateAttr
+)
+from typing import (
+    Any,
+    Optional,
+    Iterable
+)
+
+from nl2sql.utils.executor import run_blocking
+from nl2sql.utils.tracing import span, record_usage
+
+# bound parameters of one lookup in the persistent tier, under SQLite's limit
+_SQLITE_BATCH = 500
+
+
+class EmbeddingCacheStats(BaseModel):
+    hits: int = 0
+    persistent_hits: int = 0
+    misses: int = 0
+
+    @property
+    def requests(self) -> int:
+        return self.hits + self.persistent_hits + self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        return (self.hits + self.persistent_hits) / self.requests if self.requests else 0.0
+
+
+class EmbeddingCache(BaseModel):
+    """
+    Two-tier cache of embeddings keyed by (embedding model, normalized text).
+    The in-memory tier is an LRU bounded by `max_entries`,
+    the optional persistent tier is a SQLite file at `path` that survives restarts,
+    `embed` and `embed_many` read and write it in the shared executor, one commit per call.
+    """
+    max_entries: int = 4096
+    path: Optional[str] = None
+
+    _memory: OrderedDict = PrivateAttr(default_factory=OrderedDict)
+    _stats: EmbeddingCacheStats = PrivateAttr(default_factory=EmbeddingCacheStats)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _db: Optional[sqlite3.Connection] = PrivateAttr(None)
+
+    def model_post_init(self, context: Any, /) -> None:
+        if self.path:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text TEXT NOT NULL, vector BLOB NOT NULL, PRIMARY KEY (model, text))"
+            )
+            self._db.commit()
+
+    @property
+    def stats(self) -> EmbeddingCacheStats:
+        return self._stats.model_copy()
+
+    def get(self, model: str, text: str) -> Optional[list[float]]:
+        return self.get_many(model, [text])[0]
+
+    def get_many(self, model: str, texts: list[str]) -> list[Optional[list[float]]]:
+        """
+        Cached embeddings of the texts, None for the misses. The persistent tier is looked up in batches.
+        """
+        keys = [(model, normalize_text(x)) for x in texts]
+        embeddings = [None] * len(keys)
+        with self._lock:
+            missing = []
+            for i, key in enumerate(keys):
+                embedding = self._memory.get(key)
+                if embedding is None:
+                    missing.append(i)
+                    continue
+                self._memory.move_to_end(key)
+                self._stats.hits += 1
+                embeddings[i] = embedding
+            stored = self._select(model, list(dict.fromkeys(keys[i][1] for i in missing))) if missing else {}
+            for i in missing:
+                embedding = stored.get(keys[i][1])
+                if embedding is None:
+                    self._stats.misses += 1
+                    continue
+                self._remember(keys[i], embedding)
+                self._stats.persistent_hits += 1
+                embeddings[i] = embedding
+        return embeddings
+
+    def put(self, model: str, text: str, embedding: list[float]) -> None:
+        self.put_many(model, [(text, embedding)])
+
+    def put_many(self, model: str, embeddings: Iterable[tuple[str, list[float]]]) -> None:
+        """
+        Cache (text, embedding) pairs, written to the persistent tier in one transaction.
+        """
+        rows = [(normalize_text(text), embedding) for text, embedding in embeddings]
+        with self._lock:
+            for text, embedding in rows:
+                self._remember((model, text), embedding)
+            if self._db is not None and rows:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, text, vector) VALUES (?, ?, ?)",
+                    [(model, text, array.array("f", embedding).tobytes()) for text, embedding in rows]
+                )
+                self._db.commit()
+
+    async def embed(self, openai_service: openai.AsyncOpenAI, model: str, text: str) -> list[float]:
+        embedding = (await self._aget_many(model, [text]))[0]
+        if embedding is None:
+            with span("embedding", texts=1, model=model) as current:
+                response = await openai_service.embeddings.create(input=text, model=model)
+                record_usage(current, response, "embedding_")
+            embedding = response.data[0].embedding
+            await self._aput_many(model, [(text, embedding)])
+        return embedding
+
+    async def embed_many(self, openai_service: openai.AsyncOpenAI, model: str, texts: list[str]) -> list[list[float]]:
+        """
+        Embed several texts, requesting all cache misses in one batched call.
+        """
+        embeddings = await self._aget_many(model, texts)
+        missing = list(dict.fromkeys(x for x, e in zip(texts, embeddings) if e is None))
+        if missing:
+            with span("embedding", texts=len(missing), model=model) as current:
+                response = await openai_service.embeddings.create(input=missing, model=model)
+                record_usage(current, response, "embedding_")
+            created = {text: x.embedding for text, x in zip(missing, sorted(response.data, key=lambda x: x.index))}
+            await self._aput_many(model, created.items())
+            embeddings = [e if e is not None else created[x] for x, e in zip(texts, embeddings)]
+        return embeddings
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    async def _aget_many(self, model: str, texts: list[str]) -> list[Optional[list[float]]]:
+        # the memory tier alone is cheaper than a thread hop
+        if self._db is None:
+            return self.get_many(model, texts)
+        return await run_blocking(self.get_many, model, texts)
+
+    async def _aput_many(self, model: str, embeddings: Iterable[tuple[str, list[float]]]) -> None:
+        if self._db is None:
+            return self.put_many(model, embeddings)
+        await run_blocking(self.put_many, model, list(embeddings))
+
+    def _select(self, model: str, texts: list[str]) -> dict[str, list[float]]:
+        if self._db is None:
+            return {}
+        found = {}
+        for i in range(0, len(texts), _SQLITE_BATCH):
+            batch = texts[i:i + _SQLITE_BATCH]
+            rows = self._db.execute(
+                f"SELECT text, vector FROM embeddings WHERE model = ? AND text IN ({', '.join('?' * len(batch))})",
+                (model, *batch)
+            )
+            found.update((text, array.array("f", vector).tolist()) for text, vector in rows)
+        return found
+
+    def _remember(self, key: tuple[str, str], embedding: list[float]) -> None:
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+shared_embedding_cache = EmbeddingCache()
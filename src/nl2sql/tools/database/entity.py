@@ -0,0 +1,220 @@
+import bisect
+import threading
+
+from collections import defaultdict
+from pydantic import (
+    BaseModel,
+    PrivateAttr
+)
+from typing import (
+    Any,
+    Optional
+)
+from sqlalchemy import (
+    Connection,
+    func,
+    table as sql_table,
+    column as sql_column,
+    select,
+    literal_column,
+    false,
+    or_
+)
+
+from nl2sql.tools.database.data import AmbiguousResult
+
+# appended to the values before splitting them into n-grams
+_PAD = "\x00"
+
+
+class EntityColumn(BaseModel):
+    """
+    A column whose distinct values are indexed.
+    With a monotonic `watermark` column (an id or a modification time) refreshes only read the rows added since
+    the last one, deleted values are then only dropped by a full refresh.
+    """
+    table: str
+    column: str
+    watermark: Optional[str] = None
+
+
+class _Postings:
+    def __init__(self, n: int):
+        self.n = n
+        self.values: dict[int, str] = {}
+        self.folded: dict[int, str] = {}
+        self.ids: dict[str, int] = {}
+        self.grams: defaultdict[str, set[int]] = defaultdict(set)
+        # the gram keys in order for the prefix lookups of short keywords, rebuilt when keys come or go
+        self.sorted_grams: Optional[list[str]] = None
+        self.mark: Any = None
+        self.next_id = 0
+
+    def add(self, value: str) -> bool:
+        if value in self.ids:
+            return False
+        value_id = self.next_id
+        self.next_id += 1
+        self.ids[value] = value_id
+        self.values[value_id] = value
+        self.folded[value_id] = value.upper()
+        for gram in _value_grams(self.folded[value_id], self.n):
+            if gram not in self.grams:
+                self.sorted_grams = None
+            self.grams[gram].add(value_id)
+        return True
+
+    def remove(self, value: str) -> None:
+        value_id = self.ids.pop(value)
+        del self.values[value_id]
+        for gram in _value_grams(self.folded.pop(value_id), self.n):
+            ids = self.grams[gram]
+            ids.discard(value_id)
+            if not ids:
+                del self.grams[gram]
+                self.sorted_grams = None
+
+    def match(self, keyword: str, limit: int) -> list[str]:
+        keyword = keyword.upper()
+        if not keyword:
+            return []
+        if len(keyword) < self.n:
+            return self._match_prefix(keyword, limit)
+        grams = sorted((self.grams.get(x, set()) for x in _ngrams(keyword, self.n)), key=len)
+        candidates = set(grams[0]).intersection(*grams[1:])
+        matches = []
+        for value_id in candidates:
+            if keyword in self.folded[value_id]:
+                matches.append(self.values[value_id])
+                if len(matches) >= limit:
+                    break
+        return matches
+
+    def _match_prefix(self, keyword: str, limit: int) -> list[str]:
+        # values are padded, each occurrence of a short keyword starts one of their grams
+        if self.sorted_grams is None:
+            self.sorted_grams = sorted(self.grams)
+        found = {}
+        for i in range(bisect.bisect_left(self.sorted_grams, keyword), len(self.sorted_grams)):
+            gram = self.sorted_grams[i]
+            if not gram.startswith(keyword):
+                break
+            for value_id in self.grams[gram]:
+                found[value_id] = self.values[value_id]
+                if len(found) >= limit:
+                    return list(found.values())
+        return list(found.values())
+
+
+class EntityIndex(BaseModel):
+    """
+    In-memory character n-gram inverted index over the distinct values of the configured columns,
+    so that entity ambiguity checks don't scan the tables with `LIKE '%keyword%'`.
+    Matching is case-insensitive substring matching, the same as the SQL fallback.
+    Columns with more than `max_values` distinct values are left out and answered by the database.
+    A keyword matches at most `max_matches` values per column, more are as ambiguous and would only
+    lengthen the `IN` lists of the row lookup.
+    """
+    columns: list[EntityColumn]
+    db_schema: Optional[str] = None
+    ngram: int = 3
+    max_values: int = 200_000
+    max_matches: int = 100
+
+    _postings: dict[tuple[str, str], _Postings] = PrivateAttr(default_factory=dict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def covers(self, table: str, columns: list[str]) -> bool:
+        with self._lock:
+            return all((table, x) in self._postings for x in columns)
+
+    def refresh(self, conn: Connection, full: bool = False) -> int:
+        """
+        Load new distinct values, and with `full` (or for columns without a watermark) drop the removed ones.
+        Returns the number of added and removed values.
+        """
+        changed = 0
+        for entity in self.columns:
+            key = (entity.table, entity.column)
+            with self._lock:
+                postings = self._postings.get(key)
+            incremental = postings is not None and entity.watermark and not full
+            mark = postings.mark if incremental else None
+
+            table = sql_table(
+                entity.table,
+                *[sql_column(x) for x in {entity.column, entity.watermark} if x],
+                schema=self.db_schema
+            )
+            target = table.c[entity.column]
+            stmt = select(target).distinct().where(target.is_not(None)).limit(self.max_values + 1)
+            if entity.watermark:
+                # read the high mark first so rows committed meanwhile are picked up by the next refresh
+                high = conn.execute(select(func.max(table.c[entity.watermark]))).scalar()
+                if high is not None:
+                    stmt = stmt.where(table.c[entity.watermark] <= high)
+                if mark is not None:
+                    stmt = stmt.where(table.c[entity.watermark] > mark)
+            else:
+                high = None
+            values = {str(x) for x in conn.execute(stmt).scalars()}
+
+            with self._lock:
+                if not incremental:
+                    if len(values) > self.max_values:
+                        self._postings.pop(key, None)
+                        continue
+                    postings = self._postings.get(key) or _Postings(self.ngram)
+                    removed = [x for x in postings.ids if x not in values]
+                    for value in removed:
+                        postings.remove(value)
+                    changed += len(removed)
+                changed += sum(postings.add(x) for x in values)
+                if len(postings.ids) > self.max_values:
+                    self._postings.pop(key, None)
+                    continue
+                postings.mark = high if high is not None else postings.mark
+                self._postings[key] = postings
+        return changed
+
+    def match(self, keyword: str, table: str, column: str) -> list[str]:
+        with self._lock:
+            return self._postings[(table, column)].match(keyword, self.max_matches)
+
+    def find(
+            self,
+            conn: Connection,
+            keyword: str,
+            table: str,
+            ambiguous_at: list[str],
+            display_columns: list[str] = None
+    ) -> AmbiguousResult:
+        """
+        Same as `find_ambiguous_entities`, but the matching values are looked up in memory
+        and the rows are fetched by equality, which the columns' regular indexes can serve.
+        """
+        matches = {x: self.match(keyword, table, x) for x in ambiguous_at}
+        display_columns = display_columns or ["*"]
+        entities = sql_table(table, *[sql_column(x) for x in ambiguous_at], schema=self.db_schema)
+        stmt = select(
+            *[literal_column("*") if x == "*" else sql_column(x) for x in display_columns]
+        ).select_from(entities).where(
+            or_(false(), *[entities.c[x].in_(values) for x, values in matches.items() if values])
+        )
+        if not any(matches.values()):
+            return AmbiguousResult(is_ambiguous=False, results=[], sql=str(stmt))
+
+        try:
+            results = [dict(x._mapping) for x in conn.execute(stmt)]
+            return AmbiguousResult(is_ambiguous=len(results) > 1, results=results, sql=str(stmt))
+        except Exception as e:
+            return AmbiguousResult(is_ambiguous=False, results=[], error=str(e), sql=str(stmt))
+
+
+def _ngrams(text: str, n: int) -> set[str]:
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def _value_grams(folded: str, n: int) -> set[str]:
+    # values shorter than n and the ends of values get grams too
+    return _ngrams(folded + _PAD * (n - 1), n)
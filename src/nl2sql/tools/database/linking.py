@@ -0,0 +1,162 @@
+import os
+import asyncio
+import hashlib
+import threading
+
+import numpy as np
+from pydantic import (
+    BaseModel,
+    PrivateAttr
+)
+from typing import (
+    Any,
+    Optional,
+    Callable,
+    Awaitable
+)
+
+from nl2sql.utils.vectors import normalize
+from nl2sql.tools.database.metadata import Metadata
+
+EMBEDDING_BATCH_SIZE = 256
+
+
+class SchemaIndex(BaseModel):
+    """
+    Local embedding index over table documents (name, comment, columns and column comments),
+    used to pick the tables relevant to a question when the caller doesn't name them.
+    The index is persisted to `path` as a `.npz` file and only changed tables are re-embedded on refresh.
+    Tables marked stale, e.g. after a schema change, are left out of the searches until they are updated.
+    """
+    path: Optional[str] = None
+    top_k: int = 8
+
+    _key: str = PrivateAttr("")
+    _tables: list[str] = PrivateAttr(default_factory=list)
+    _digests: list[str] = PrivateAttr(default_factory=list)
+    _vectors: np.ndarray = PrivateAttr(default_factory=lambda: np.empty((0, 0), dtype=np.float32))
+    _stale: set[str] = PrivateAttr(default_factory=set)
+    _builds: dict[tuple, asyncio.Future] = PrivateAttr(default_factory=dict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def model_post_init(self, context: Any, /) -> None:
+        if self.path and os.path.exists(self.path):
+            self.load()
+
+    @property
+    def tables(self) -> list[str]:
+        return list(self._tables)
+
+    def is_built_for(self, key: str) -> bool:
+        return self._key == key and len(self._tables) > 0 and not self._stale
+
+    def stale_tables(self, key: str) -> list[str]:
+        with self._lock:
+            return sorted(self._stale) if self._key == key else []
+
+    def mark_stale(self, key: str, tables: list[str]) -> None:
+        """
+        Drop the tables from the searches until the next `update` of them, e.g. when they were altered or dropped.
+        """
+        with self._lock:
+            if self._key != key:
+                return
+            kept = [i for i, x in enumerate(self._tables) if x not in tables]
+            self._stale.update(tables)
+            self._tables = [self._tables[i] for i in kept]
+            self._digests = [self._digests[i] for i in kept]
+            self._vectors = self._vectors[kept] if len(self._vectors) else self._vectors
+
+    async def ensure_built(self, key: str, build: Callable[[], Awaitable[Any]]) -> None:
+        """
+        Run `build` unless the index is built for `key`, concurrent callers wait for the same build.
+        """
+        if self.is_built_for(key):
+            return
+        flight = (asyncio.get_running_loop(), key)
+        task = self._builds.get(flight)
+        if task is None:
+            task = asyncio.ensure_future(build())
+            self._builds[flight] = task
+            task.add_done_callback(lambda _: self._builds.pop(flight, None))
+        # a cancelled caller must not cancel the build the others wait for
+        await asyncio.shield(task)
+
+    async def update(
+            self,
+            key: str,
+            tables_metadata: list[Metadata],
+            embed: Callable[[list[str]], Awaitable[list[list[float]]]],
+            partial: bool = False
+    ) -> int:
+        """
+        Sync the index with the given tables, embedding only new or changed documents.
+        With `partial` only the given tables are replaced, or removed if they failed to be described,
+        and the other tables are kept. Returns the number of embedded documents.
+        """
+        updated = {x.table_name for x in tables_metadata}
+        tables_metadata = [x for x in tables_metadata if x.error is None]
+        docs = [_table_document(x) for x in tables_metadata]
+        digests = [hashlib.sha256(x.encode("utf-8")).hexdigest() for x in docs]
+        with self._lock:
+            known = dict(zip(self._digests, self._vectors)) if self._key == key else {}
+            kept = []
+            if partial and self._key == key:
+                kept = [i for i, x in enumerate(self._tables) if x not in updated]
+            kept_tables = [self._tables[i] for i in kept]
+            kept_digests = [self._digests[i] for i in kept]
+
+        changed = list(dict.fromkeys(doc for doc, digest in zip(docs, digests) if digest not in known))
+        for i in range(0, len(changed), EMBEDDING_BATCH_SIZE):
+            batch = changed[i:i + EMBEDDING_BATCH_SIZE]
+            for doc, embedding in zip(batch, await embed(batch)):
+                known[hashlib.sha256(doc.encode("utf-8")).hexdigest()] = normalize(embedding)
+
+        digests = kept_digests + digests
+        vectors = np.stack([known[x] for x in digests]) if digests else np.empty((0, 0), dtype=np.float32)
+        with self._lock:
+            if partial and self._key == key:
+                self._stale -= updated
+            else:
+                self._stale.clear()
+            self._key = key
+            self._tables = kept_tables + [x.table_name for x in tables_metadata]
+            self._digests = digests
+            self._vectors = vectors
+        if self.path:
+            self.save()
+        return len(changed)
+
+    def search(self, embedding: list[float], limit: int = None) -> list[tuple[str, float]]:
+        with self._lock:
+            tables, vectors = self._tables, self._vectors
+        if not tables:
+            return []
+        scores = vectors @ normalize(embedding)
+        limit = min(limit or self.top_k, len(tables))
+        top = np.argsort(-scores)[:limit]
+        return [(tables[i], float(scores[i])) for i in top]
+
+    def save(self) -> None:
+        with self._lock:
+            with open(self.path, "wb") as f:
+                np.savez(
+                    f,
+                    key=np.array(self._key),
+                    tables=np.array(self._tables, dtype=str),
+                    digests=np.array(self._digests, dtype=str),
+                    vectors=self._vectors
+                )
+
+    def load(self) -> None:
+        with np.load(self.path, allow_pickle=False) as data:
+            with self._lock:
+                self._key = str(data["key"])
+                self._tables = data["tables"].tolist()
+                self._digests = data["digests"].tolist()
+                self._vectors = data["vectors"].astype(np.float32)
+
+
+def _table_document(metadata: Metadata) -> str:
+    return f"-- {metadata.table_name}: {metadata.description}\n{metadata.ddl}"
+
@@ -1,21 +1,38 @@
+import hashlib
 from os.path import sep
-from typing import Any
+from typing import (
+    Any,
+    Optional,
+    Iterable,
+    Collection
+)
 from os import sep
 from pydantic import (
     BaseModel,
     PrivateAttr
 )
 from sqlalchemy import (
-    MetaData,
     Inspector,
     Connection,
     text,
-    inspect
+    inspect,
+    Integer,
+    Dialect,
+    bindparam,
+    table as sql_table,
+    column as sql_column
 )
+from sqlalchemy.exc import NoSuchTableError
+from sqlalchemy.types import NullType
 
 from nl2sql.utils.path import fpd
 from nl2sql.utils.strings import read_file_to_str
-from nl2sql.tools.database.data import sample_table
+from nl2sql.utils.tracing import span
+from nl2sql.tools.database.data import (
+    SampleStrategy,
+    sample_table,
+    estimate_table_rows
+)
 
 
 class Metadata(BaseModel):
@@ -23,6 +40,7 @@ class Metadata(BaseModel):
     description: str
     ddl: str
     samples: list[str]
+    error: Optional[str] = None
     _doc: str = PrivateAttr("")
 
     def model_post_init(self, context: Any, /) -> None:
@@ -37,22 +55,40 @@ class Metadata(BaseModel):
     def doc(self):
         return self._doc
 
-    @classmethod
-    def query(cls, conn: Connection, table_name: str, schema: str = None, sample_limit: int = 3) -> "Metadata":
-        inspector = inspect(conn.engine)
-        metadata = MetaData()
-        metadata.reflect(bind=inspector.engine)
-        table = metadata.tables.get(table_name)
-        comment = inspector.get_table_comment(table_name).get("text") or ""
-        ddl = _query_ddl_with_inline_comment(conn, inspector, table_name, schema)
-        samples = sample_table(conn, table, limit=sample_limit)
-        table_context = cls(
-            table_name=table_name,
-            description=comment,
+    def trimmed(
+            self,
+            drop_samples: bool = False,
+            drop_comments: bool = False,
+            keep_columns: Optional[Collection[str]] = None
+    ) -> "Metadata":
+        """
+        Copy without sample values, inline column comments or columns outside `keep_columns`.
+        Primary and foreign key columns are always kept.
+        """
+        ddl = self.ddl
+        if drop_comments or keep_columns is not None:
+            ddl = _trim_ddl_string(ddl, drop_comments, keep_columns)
+        return Metadata(
+            table_name=self.table_name,
+            description=self.description,
             ddl=ddl,
-            samples=map(str, map(tuple, samples))
+            samples=[] if drop_samples else self.samples,
+            error=self.error
         )
-        return table_context
+
+    @classmethod
+    def query(
+            cls,
+            conn: Connection,
+            table_name: str,
+            schema: str = None,
+            sample_limit: int = 3,
+            sample_strategy: SampleStrategy = SampleStrategy.AUTO
+    ) -> "Metadata":
+        metadata = cls._query_many(conn, [table_name], schema, sample_limit, True, sample_strategy)[0]
+        if isinstance(metadata, Exception):
+            raise metadata
+        return metadata
 
     @classmethod
     def query_or_default(
@@ -60,17 +96,252 @@ class Metadata(BaseModel):
             conn: Connection,
             table_name: str,
             schema: str = None,
-            sample_limit: int = 3
+            sample_limit: int = 3,
+            sample_strategy: SampleStrategy = SampleStrategy.AUTO
     ) -> "Metadata":
         try:
-            return cls.query(conn, table_name, schema, sample_limit)
+            return cls.query(conn, table_name, schema, sample_limit, sample_strategy)
+        except Exception as e:
+            return cls.default(table_name, e)
+
+    @classmethod
+    def query_many(
+            cls,
+            conn: Connection,
+            tables: Iterable[str],
+            schema: str = None,
+            sample_limit: int = 3,
+            include_ddl: bool = True,
+            sample_strategy: SampleStrategy = SampleStrategy.AUTO
+    ) -> list["Metadata"]:
+        """
+        Describe several tables with set-based catalog queries sharing one inspector.
+        Tables that can't be described are returned as `Metadata.default`.
+        Set `include_ddl` to False to only refresh the sample values.
+        With `SampleStrategy.AUTO` the sampling strategy of each table follows its planner row estimate.
+        """
+        tables = list(tables)
+        return [
+            cls.default(name, x) if isinstance(x, Exception) else x
+            for name, x in zip(tables, cls._query_many(conn, tables, schema, sample_limit, include_ddl, sample_strategy))
+        ]
+
+    @classmethod
+    def default(cls, table_name: str, error: Exception) -> "Metadata":
+        return cls(
+            table_name=table_name,
+            description=f"Can't get schema info for table {table_name}: {error}",
+            ddl="",
+            samples=[],
+            error=str(error)
+        )
+
+    @classmethod
+    def _query_many(
+            cls,
+            conn: Connection,
+            tables: list[str],
+            schema: str = None,
+            sample_limit: int = 3,
+            include_ddl: bool = True,
+            sample_strategy: SampleStrategy = SampleStrategy.AUTO
+    ) -> list["Metadata | Exception"]:
+        try:
+            with span("metadata.ddl", tables=len(tables), include_ddl=include_ddl):
+                inspector = inspect(conn)
+                columns = _query_columns(conn, inspector, tables, schema)
+                descriptions, ddls = {}, {}
+                if include_ddl:
+                    descriptions = _query_table_comments(conn, inspector, tables, schema)
+                    ddls = _query_ddls_with_inline_comment(conn, inspector, tables, schema, columns)
+                rows, pks = {}, {}
+                if sample_limit > 0 and sample_strategy in (
+                        SampleStrategy.AUTO, SampleStrategy.BERNOULLI, SampleStrategy.SYSTEM
+                ):
+                    rows = estimate_table_rows(conn, tables, schema)
+                if sample_limit > 0 and sample_strategy in (SampleStrategy.AUTO, SampleStrategy.PK_RANGE):
+                    pks = _query_integer_pks(conn, inspector, tables, schema, columns)
         except Exception as e:
-            return cls(
-                table_name=table_name,
-                description=f"Can't get schema info for table {table_name}: {e}",
-                ddl="",
-                samples=[]
-            )
+            return [e] * len(tables)
+
+        results = []
+        for table_name in tables:
+            try:
+                if table_name not in columns:
+                    raise NoSuchTableError(table_name)
+                table = sql_table(table_name, *[sql_column(x["name"]) for x in columns[table_name]], schema=schema)
+                samples = []
+                if sample_limit > 0:
+                    with span("metadata.samples", table=table_name):
+                        samples = sample_table(
+                            conn, table, sample_limit, sample_strategy, rows.get(table_name), pks.get(table_name)
+                        )
+                results.append(cls(
+                    table_name=table_name,
+                    description=descriptions.get(table_name, ""),
+                    ddl=ddls.get(table_name, ""),
+                    samples=map(str, map(tuple, samples))
+                ))
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+def query_schema_fingerprints(conn: Connection, tables: list[str], schema: str = None) -> dict[str, str]:
+    """
+    A cheap hash of each table's columns, comments and constraints, which changes with its DDL.
+    Tables that do not exist are left out.
+    """
+    if not tables:
+        return {}
+    dialect = conn.engine.dialect.name
+    if dialect == 'postgresql':
+        query = text(read_file_to_str(f"{fpd(__file__, 2)}{sep}resources{sep}sqls{sep}fingerprint_postgres.sql"))
+    elif dialect == 'mysql':
+        query = text(read_file_to_str(f"{fpd(__file__, 2)}{sep}resources{sep}sqls{sep}fingerprint_mysql.sql"))
+        query = query.bindparams(bindparam("tables", expanding=True))
+    elif dialect == 'sqlite':
+        # the CREATE statement is the whole schema of a sqlite table
+        master = f'"{schema}".sqlite_master' if schema else "sqlite_master"
+        query = text(f"SELECT name, sql FROM {master} WHERE type IN ('table', 'view') AND name IN :tables")
+        query = query.bindparams(bindparam("tables", expanding=True))
+        result = conn.execute(query, {"tables": tables})
+        return {name: hashlib.md5((sql or "").encode("utf-8")).hexdigest() for name, sql in result}
+    else:
+        raise NotImplementedError(f"Unsupported dialect: {dialect}")
+    result = conn.execute(query, {"tables": tables, "schema": schema})
+    return {name: str(fingerprint) for name, fingerprint in result}
+
+
+def _trim_ddl_string(ddl: str, drop_comments: bool, keep_columns: Optional[Collection[str]] = None) -> str:
+    lines = ddl.split("\n")
+    if len(lines) < 3 or not lines[0].startswith("CREATE TABLE"):
+        return ddl
+    constraints = ("    PRIMARY KEY (", "    FOREIGN KEY (")
+    keys = set()
+    for line in lines[1:-1]:
+        if line.startswith(constraints):
+            keys.update(x.strip().lower() for x in line.split("(", 1)[1].split(")", 1)[0].split(","))
+    keep_columns = None if keep_columns is None else {x.lower() for x in keep_columns} | keys
+
+    body = []
+    for line in lines[1:-1]:
+        definition, _, comment = line.partition(" -- ")
+        if not line.startswith(constraints):
+            if keep_columns is not None and definition.split()[0].lower() not in keep_columns:
+                continue
+            if drop_comments:
+                comment = ""
+        body.append((definition.rstrip(","), comment))
+
+    body = [
+        f"{definition}{',' if i < len(body) - 1 else ''}{f' -- {comment}' if comment else ''}"
+        for i, (definition, comment) in enumerate(body)
+    ]
+    return "\n".join([lines[0], *body, lines[-1]])
+
+
+def _query_mysql(conn: Connection, name: str, tables: list[str], schema: str = None) -> list[tuple]:
+    # the mysql dialect reflects table by table, information_schema describes all the tables in one query
+    query = text(read_file_to_str(f"{fpd(__file__, 2)}{sep}resources{sep}sqls{sep}{name}_mysql.sql"))
+    query = query.bindparams(bindparam("tables", expanding=True))
+    return [tuple(x) for x in conn.execute(query, {"tables": tables, "schema": schema})]
+
+
+def _mysql_columns(dialect: Dialect, rows: Iterable[tuple]) -> dict[str, list[dict]]:
+    """
+    Columns in the shape of `Inspector.get_multi_columns` from rows of information_schema.COLUMNS.
+    """
+    columns = {}
+    for table_name, name, data_type, column_type, nullable, default, extra, comment in rows:
+        if default is not None and dialect.is_mariadb:
+            # mariadb already quotes literal defaults and reports a NULL default as 'NULL'
+            default = None if default == "NULL" else default
+        elif default is not None and "DEFAULT_GENERATED" not in (extra or "") \
+                and not default.upper().startswith("CURRENT_TIMESTAMP"):
+            default = "'{}'".format(default.replace("'", "''"))
+        columns.setdefault(table_name, []).append({
+            "name": name,
+            "type": dialect.ischema_names.get(data_type.lower(), NullType)(),
+            # the full declared type, with lengths and enum values, written in the DDL
+            "column_type": _upper_type_name(column_type),
+            "nullable": nullable == "YES",
+            "default": default,
+            "comment": comment or None
+        })
+    return columns
+
+
+def _upper_type_name(column_type: str) -> str:
+    # keep the case of the enum and set values
+    name, paren, rest = column_type.partition("(")
+    return f"{name.upper()}{paren}{rest}"
+
+
+def _mysql_keys(rows: Iterable[tuple]) -> tuple[dict[str, dict], dict[str, list[dict]]]:
+    """
+    Primary keys and foreign keys in the shape of `Inspector.get_multi_pk_constraint` and
+    `Inspector.get_multi_foreign_keys` from rows of information_schema.KEY_COLUMN_USAGE.
+    """
+    pks, fks = {}, {}
+    for table_name, constraint, name, referred_table, referred_column in rows:
+        if constraint == "PRIMARY":
+            pk = pks.setdefault(table_name, {"name": constraint, "constrained_columns": []})
+            pk["constrained_columns"].append(name)
+            continue
+        fk = fks.setdefault(table_name, {}).setdefault(constraint, {
+            "name": constraint, "constrained_columns": [], "referred_table": referred_table, "referred_columns": []
+        })
+        fk["constrained_columns"].append(name)
+        fk["referred_columns"].append(referred_column)
+    return pks, {name: list(x.values()) for name, x in fks.items()}
+
+
+def _query_keys(
+        conn: Connection, inspector: Inspector, tables: list[str], schema: str = None
+) -> tuple[dict[str, dict], dict[str, list[dict]]]:
+    if inspector.dialect.name == 'mysql':
+        # shared by the DDL and the primary key sampling through the inspector's cache
+        key = ("nl2sql_keys", schema, tuple(tables))
+        if key not in inspector.info_cache:
+            inspector.info_cache[key] = _mysql_keys(_query_mysql(conn, "keys", tables, schema))
+        return inspector.info_cache[key]
+    pks = {name: x for (_, name), x in inspector.get_multi_pk_constraint(schema, filter_names=tables).items()}
+    fks = {name: x for (_, name), x in inspector.get_multi_foreign_keys(schema, filter_names=tables).items()}
+    return pks, fks
+
+
+def _query_columns(
+        conn: Connection, inspector: Inspector, tables: list[str], schema: str = None
+) -> dict[str, list[dict]]:
+    if inspector.dialect.name == 'mysql':
+        return _mysql_columns(inspector.dialect, _query_mysql(conn, "columns", tables, schema))
+    columns = inspector.get_multi_columns(schema, filter_names=tables)
+    return {name: cols for (_, name), cols in columns.items()}
+
+
+def _query_integer_pks(
+        conn: Connection, inspector: Inspector, tables: list[str], schema: str = None,
+        columns: dict[str, list[dict]] = None
+) -> dict[str, str]:
+    pks = {}
+    for name, pk_info in _query_keys(conn, inspector, tables, schema)[0].items():
+        constrained = pk_info.get("constrained_columns") or []
+        types = {x["name"]: x["type"] for x in columns.get(name, [])}
+        if len(constrained) == 1 and isinstance(types.get(constrained[0]), Integer):
+            pks[name] = constrained[0]
+    return pks
+
+
+def _query_table_comments(
+        conn: Connection, inspector: Inspector, tables: list[str], schema: str = None
+) -> dict[str, str]:
+    if not inspector.dialect.supports_comments:
+        return {}
+    if inspector.dialect.name == 'mysql':
+        return {name: comment or "" for name, comment in _query_mysql(conn, "comments", tables, schema)}
+    comments = inspector.get_multi_table_comment(schema, filter_names=tables)
+    return {name: comment.get("text") or "" for (_, name), comment in comments.items()}
 
 
 def _build_ddl_string(
@@ -84,7 +355,7 @@ def _build_ddl_string(
 
     for col in columns:
         name = col["name"]
-        col_type = str(col["type"])
+        col_type = col.get("column_type") or str(col["type"])
         nullable = col.get("nullable", True)
         default = col.get("default", None)
         comment = comments.get(name, "")
@@ -117,48 +388,44 @@ def _build_ddl_string(
     return "\n".join(ddl_lines)
 
 
-def _generate_postgres_ddl(
-        conn: Connection, inspector: Inspector,
-        table_name: str, schema: str = None
-) -> str:
-    columns = inspector.get_columns(table_name, schema)
-    pk_info = inspector.get_pk_constraint(table_name, schema)
-    fk_info = inspector.get_foreign_keys(table_name, schema)
-
-    query = text(read_file_to_str(f"{fpd(__file__, 2)}{sep}resources{sep}sqls{sep}ddl_postgres.sql"))
-    result = conn.execute(query, {"table_name": table_name, "schema": schema or "public"})
-
-    comments = {name: comment for name, comment in result if comment}
-
-    return _build_ddl_string(table_name, columns, pk_info, fk_info, comments)
-
-
-def _generate_mysql_ddl(
-        conn: Connection, inspector: Inspector,
-        table_name: str, schema: str = None
-) -> str:
-    columns = inspector.get_columns(table_name, schema)
-    pk_info = inspector.get_pk_constraint(table_name, schema)
-    fk_info = inspector.get_foreign_keys(table_name, schema)
-
-    query = text(read_file_to_str(f"{fpd(__file__, 4)}{sep}resources{sep}sqls{sep}ddl_mysql.sql"))
-    result = conn.execute(query, {"table": table_name})
-
-    comments = {name: comment for name, comment in result if comment}
+def _query_column_comments(
+        conn: Connection, dialect: str,
+        tables: list[str], schema: str = None
+) -> dict[str, dict[str, str]]:
+    if dialect == 'postgresql':
+        query = text(read_file_to_str(f"{fpd(__file__, 2)}{sep}resources{sep}sqls{sep}ddl_postgres.sql"))
+    elif dialect == 'mysql':
+        query = text(read_file_to_str(f"{fpd(__file__, 2)}{sep}resources{sep}sqls{sep}ddl_mysql.sql"))
+        query = query.bindparams(bindparam("tables", expanding=True))
+    elif dialect == 'sqlite':
+        # sqlite has no comments
+        return {}
+    else:
+        raise NotImplementedError(f"Unsupported dialect: {dialect}")
+    result = conn.execute(query, {"tables": tables, "schema": schema})
 
-    return _build_ddl_string(table_name, columns, pk_info, fk_info, comments)
+    comments = {}
+    for table_name, name, comment in result:
+        if comment:
+            comments.setdefault(table_name, {})[name] = comment
+    return comments
 
 
-def _query_ddl_with_inline_comment(
+def _query_ddls_with_inline_comment(
         conn: Connection, inspector: Inspector,
-        table_name: str, schema: str = None
-) -> str:
-    dialect = inspector.dialect.name
+        tables: list[str], schema: str = None,
+        columns: dict[str, list[dict]] = None
+) -> dict[str, str]:
+    """
+    Build DDLs of several tables, fetching columns, keys and comments for all of them at once.
+    """
+    comments = _query_column_comments(conn, inspector.dialect.name, tables, schema)
+    columns = columns if columns is not None else _query_columns(conn, inspector, tables, schema)
+    pk_infos, fk_infos = _query_keys(conn, inspector, tables, schema)
 
-    if dialect == 'postgresql':
-        return _generate_postgres_ddl(conn, inspector, table_name, schema)
-    elif dialect == 'mysql':
-        return _generate_mysql_ddl(conn, inspector, table_name, schema)
-    else:
-        raise NotImplementedError(f"Unsupported dialect: {dialect}")
+    return {
+        table_name: _build_ddl_string(
+            table_name, cols, pk_infos.get(table_name, {}), fk_infos.get(table_name, []), comments.get(table_name, {})
+        ) for table_name, cols in columns.items()
+    }
 
@@ -0,0 +1,200 @@
+import abc
+import os
+import json
+
+import numpy as np
+import pymilvus
+from concurrent.futures import Executor
+from pydantic import (
+    BaseModel,
+    ConfigDict,
+    PrivateAttr
+)
+from typing import (
+    Any,
+    Optional,
+    Iterable
+)
+
+from nl2sql.utils.vectors import normalize
+from nl2sql.utils.executor import MAX_MILVUS_WORKERS, run_blocking, shared_executor
+
+
+class ReferenceStore(BaseModel, abc.ABC, metaclass=abc.ABCMeta):
+    """
+    Where SQL references are searched: entries of a question, its SQL, tags and the question's embedding.
+    """
+
+    @abc.abstractmethod
+    async def search(
+            self,
+            embeddings: list[list[float]],
+            limit: int = 3,
+            tags: Iterable[str] = None
+    ) -> list[dict[str, str]]:
+        """
+        References (question -> sql) most similar to each embedding,
+        with tags only the entries having any of them or no tags at all are searched.
+        """
+
+
+class MilvusReferenceStore(ReferenceStore):
+    """
+    References in a Milvus collection. An `AsyncMilvusClient` is awaited on the event loop,
+    searches of a `MilvusClient` run in the `executor`, by default a thread pool dedicated to Milvus.
+    `timeout` bounds each search on the Milvus side.
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    milvus_client: pymilvus.MilvusClient | pymilvus.AsyncMilvusClient
+    collection_name: str
+    executor: Optional[Executor] = None
+    timeout: Optional[float] = None
+
+    async def search(
+            self,
+            embeddings: list[list[float]],
+            limit: int = 3,
+            tags: Iterable[str] = None
+    ) -> list[dict[str, str]]:
+        tags = list(tags or [])
+        expr = f"ARRAY_LENGTH(tags) == 0 || ARRAY_CONTAINS_ANY(tags, {tags})" if tags else ""
+        options = dict(output_fields=["query", "sql"], limit=limit, filter=expr, timeout=self.timeout)
+        if isinstance(self.milvus_client, pymilvus.AsyncMilvusClient):
+            searched = await self.milvus_client.search(self.collection_name, embeddings, **options)
+        else:
+            searched = await run_blocking(
+                self.milvus_client.search,
+                self.collection_name,
+                embeddings,
+                executor=self.executor or shared_executor("milvus", MAX_MILVUS_WORKERS),
+                **options
+            )
+        references = []
+        for i in range(len(embeddings)):
+            hits = map(lambda x: x["entity"], searched[i]) if i < len(searched) else []
+            references.append({x["query"]: x["sql"] for x in hits})
+        return references
+
+
+class LocalReferenceStore(ReferenceStore):
+    """
+    In-process store for small reference sets, searched by brute force.
+    The directory at `path` holds the normalized embeddings (`vectors.npy`, memory-mapped),
+    a bitmap of each entry's tags (`tags.npy`, one bit per known tag) and the questions and SQLs (`entries.json`).
+    """
+    path: str
+
+    _queries: list[str] = PrivateAttr(default_factory=list)
+    _sqls: list[str] = PrivateAttr(default_factory=list)
+    _vocabulary: dict[str, int] = PrivateAttr(default_factory=dict)
+    _vectors: np.ndarray = PrivateAttr(default_factory=lambda: np.empty((0, 0), dtype=np.float32))
+    _tags: np.ndarray = PrivateAttr(default_factory=lambda: np.empty((0, 0), dtype=np.uint8))
+
+    def model_post_init(self, context: Any, /) -> None:
+        if os.path.exists(os.path.join(self.path, "entries.json")):
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._queries)
+
+    @classmethod
+    def build(cls, path: str, entries: Iterable[dict], vector_field: str = "vector") -> "LocalReferenceStore":
+        """
+        Write a store from entries having `query`, `sql`, optional `tags` and the embedding in `vector_field`.
+        """
+        entries = list(entries)
+        vocabulary = sorted({tag for x in entries for tag in x.get("tags") or []})
+        index = {tag: i for i, tag in enumerate(vocabulary)}
+        bits = np.zeros((len(entries), max(len(vocabulary), 1)), dtype=bool)
+        for i, entry in enumerate(entries):
+            bits[i, [index[x] for x in entry.get("tags") or []]] = True
+        vectors = np.empty((0, 0), dtype=np.float32)
+        if entries:
+            vectors = np.stack([normalize(x[vector_field]) for x in entries])
+
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "vectors.npy"), vectors)
+        np.save(os.path.join(path, "tags.npy"), np.packbits(bits, axis=1))
+        with open(os.path.join(path, "entries.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "queries": [x["query"] for x in entries],
+                "sqls": [x["sql"] for x in entries],
+                "tags": vocabulary
+            }, f, ensure_ascii=False)
+        return cls(path=path)
+
+    @classmethod
+    def from_milvus_export(cls, path: str, export_file: str, vector_field: str = "vector") -> "LocalReferenceStore":
+        """
+        Build a store from a Milvus export, a JSON array of rows, a JSON object with `rows` or JSON lines.
+        """
+        with open(export_file, encoding="utf-8") as f:
+            content = f.read()
+        try:
+            rows = json.loads(content)
+        except json.JSONDecodeError:
+            rows = [json.loads(x) for x in content.splitlines() if x.strip()]
+        if isinstance(rows, dict):
+            rows = rows["rows"] if "rows" in rows else [rows]
+        return cls.build(path, rows, vector_field)
+
+    @classmethod
+    def from_milvus(
+            cls,
+            path: str,
+            milvus_client: pymilvus.MilvusClient,
+            collection_name: str,
+            vector_field: str = "vector",
+            batch_size: int = 1000
+    ) -> "LocalReferenceStore":
+        """
+        Build a store from all entries of a Milvus collection.
+        """
+        iterator = milvus_client.query_iterator(
+            collection_name,
+            batch_size=batch_size,
+            output_fields=["query", "sql", "tags", vector_field]
+        )
+        rows = []
+        try:
+            while batch := iterator.next():
+                rows.extend(batch)
+        finally:
+            iterator.close()
+        return cls.build(path, rows, vector_field)
+
+    def load(self) -> None:
+        with open(os.path.join(self.path, "entries.json"), encoding="utf-8") as f:
+            entries = json.load(f)
+        self._queries = entries["queries"]
+        self._sqls = entries["sqls"]
+        self._vocabulary = {tag: i for i, tag in enumerate(entries["tags"])}
+        self._vectors = np.load(os.path.join(self.path, "vectors.npy"), mmap_mode="r")
+        self._tags = np.load(os.path.join(self.path, "tags.npy"))
+
+    async def search(
+            self,
+            embeddings: list[list[float]],
+            limit: int = 3,
+            tags: Iterable[str] = None
+    ) -> list[dict[str, str]]:
+        if not self._queries or limit <= 0:
+            return [{} for _ in embeddings]
+        scores = self._vectors @ np.stack([normalize(x) for x in embeddings]).T
+        if tags:
+            scores[~self._tags_mask(tags)] = -np.inf
+        limit = min(limit, len(self._queries))
+        references = []
+        for column in scores.T:
+            top = np.argpartition(-column, limit - 1)[:limit]
+            top = top[np.argsort(-column[top])]
+            references.append({self._queries[i]: self._sqls[i] for i in top if column[i] > -np.inf})
+        return references
+
+    def _tags_mask(self, tags: Iterable[str]) -> np.ndarray:
+        wanted = np.zeros(self._tags.shape[1] * 8, dtype=bool)
+        wanted[[self._vocabulary[x] for x in tags if x in self._vocabulary]] = True
+        wanted = np.packbits(wanted)
+        # entries without tags match any tags, like the Milvus filter
+        return (self._tags & wanted).any(axis=1) | ~self._tags.any(axis=1)
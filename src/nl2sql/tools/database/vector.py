@@ -1,35 +1,69 @@
 import openai
 import pymilvus
+from concurrent.futures import Executor
 from typing import (
+    Optional,
     Iterable
 )
 
+from nl2sql.tools.database.embedding import EmbeddingCache
+from nl2sql.tools.database.references import ReferenceStore, MilvusReferenceStore
+from nl2sql.utils.tracing import span, record_usage
+
 
 async def query_sql_references_by_similar_question(
         question: str,
-        milvus_client: pymilvus.MilvusClient,
-        collection_name: str,
+        milvus_client: Optional[pymilvus.MilvusClient | pymilvus.AsyncMilvusClient],
+        collection_name: Optional[str],
         openai_service: openai.AsyncOpenAI,
         embedding_model: str,
         limit: int = 3,
-        tags: Iterable[str] = None
+        tags: Iterable[str] = None,
+        executor: Executor = None,
+        embedding_cache: EmbeddingCache = None,
+        reference_store: ReferenceStore = None
 ) -> dict:
-    embedding = (await openai_service.embeddings.create(
-        input=question,
-        model=embedding_model
-    )).data[0].embedding
-    expr = f"ARRAY_LENGTH(tags) == 0 || ARRAY_CONTAINS_ANY(tags, {tags})" if tags else ""
-    searched = milvus_client.search(
-        collection_name,
-        [embedding],
-        output_fields=["query", "sql"],
-        limit=limit,
-        filter=expr
-    )
-    if len(searched) > 0:
-        references = map(lambda x: x["entity"], searched[0])
-        references = {x["query"]: x["sql"] for x in references}
-    else:
-        references = {}
+    return (await query_sql_references_by_similar_questions(
+        [question],
+        milvus_client, collection_name,
+        openai_service, embedding_model,
+        limit, tags, executor, embedding_cache, reference_store
+    ))[0]
 
-    return references
+
+async def query_sql_references_by_similar_questions(
+        questions: list[str],
+        milvus_client: Optional[pymilvus.MilvusClient | pymilvus.AsyncMilvusClient],
+        collection_name: Optional[str],
+        openai_service: openai.AsyncOpenAI,
+        embedding_model: str,
+        limit: int = 3,
+        tags: Iterable[str] = None,
+        executor: Executor = None,
+        embedding_cache: EmbeddingCache = None,
+        reference_store: ReferenceStore = None
+) -> list[dict]:
+    """
+    Search references of several questions with one embedding request and one multi-vector search,
+    in the given reference store or else in the Milvus collection.
+    """
+    if not questions:
+        return []
+    if embedding_cache is not None:
+        embeddings = await embedding_cache.embed_many(openai_service, embedding_model, questions)
+    else:
+        with span("embedding", texts=len(questions), model=embedding_model) as current:
+            response = await openai_service.embeddings.create(
+                input=questions,
+                model=embedding_model
+            )
+            record_usage(current, response, "embedding_")
+        embeddings = [x.embedding for x in sorted(response.data, key=lambda x: x.index)]
+    if reference_store is None:
+        reference_store = MilvusReferenceStore(
+            milvus_client=milvus_client,
+            collection_name=collection_name,
+            executor=executor
+        )
+    with span("vector_search", queries=len(embeddings), store=type(reference_store).__name__):
+        return await reference_store.search(embeddings, limit, tags)
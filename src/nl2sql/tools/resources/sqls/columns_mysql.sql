@@ -0,0 +1,5 @@
+SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE, COLUMN_TYPE, IS_NULLABLE, COLUMN_DEFAULT, EXTRA, COLUMN_COMMENT
+FROM information_schema.COLUMNS
+WHERE TABLE_SCHEMA = COALESCE(:schema, DATABASE())
+  AND TABLE_NAME IN :tables
+ORDER BY TABLE_NAME, ORDINAL_POSITION
\ No newline at end of file
@@ -0,0 +1,4 @@
+SELECT TABLE_NAME, TABLE_COMMENT
+FROM information_schema.TABLES
+WHERE TABLE_SCHEMA = COALESCE(:schema, DATABASE())
+  AND TABLE_NAME IN :tables
\ No newline at end of file
@@ -1,4 +1,4 @@
-SELECT COLUMN_NAME, COLUMN_COMMENT
+SELECT TABLE_NAME, COLUMN_NAME, COLUMN_COMMENT
 FROM information_schema.COLUMNS
-WHERE TABLE_SCHEMA = DATABASE()
-  AND TABLE_NAME = :table
\ No newline at end of file
+WHERE TABLE_SCHEMA = COALESCE(:schema, DATABASE())
+  AND TABLE_NAME IN :tables
\ No newline at end of file
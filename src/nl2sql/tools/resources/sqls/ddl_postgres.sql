@@ -1,9 +1,9 @@
-SELECT a.attname, d.description
+SELECT c.relname, a.attname, d.description
 FROM pg_class c
          JOIN pg_namespace n ON n.oid = c.relnamespace
          JOIN pg_attribute a ON a.attrelid = c.oid
          LEFT JOIN pg_description d ON d.objoid = c.oid AND d.objsubid = a.attnum
-WHERE c.relname = :table_name
-  AND n.nspname = :schema
+WHERE c.relname = ANY(:tables)
+  AND n.nspname = COALESCE(:schema, current_schema())
   AND a.attnum > 0
   AND NOT a.attisdropped
\ No newline at end of file
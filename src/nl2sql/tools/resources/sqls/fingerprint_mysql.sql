@@ -0,0 +1,22 @@
+SELECT t.TABLE_NAME,
+       CONCAT_WS(':', t.CREATE_TIME, MD5(t.TABLE_COMMENT), c.columns, c.checksum, c.parity, k.checksum)
+FROM information_schema.TABLES t
+         JOIN (SELECT TABLE_NAME,
+                      COUNT(*) AS columns,
+                      SUM(CRC32(CONCAT_WS('|', ORDINAL_POSITION, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE,
+                                          COLUMN_KEY, COLUMN_COMMENT))) AS checksum,
+                      BIT_XOR(CRC32(CONCAT_WS('|', ORDINAL_POSITION, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE,
+                                              COLUMN_KEY, COLUMN_COMMENT))) AS parity
+               FROM information_schema.COLUMNS
+               WHERE TABLE_SCHEMA = COALESCE(:schema, DATABASE())
+                 AND TABLE_NAME IN :tables
+               GROUP BY TABLE_NAME) c ON c.TABLE_NAME = t.TABLE_NAME
+         LEFT JOIN (SELECT TABLE_NAME,
+                           SUM(CRC32(CONCAT_WS('|', CONSTRAINT_NAME, COLUMN_NAME,
+                                               REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME))) AS checksum
+                    FROM information_schema.KEY_COLUMN_USAGE
+                    WHERE TABLE_SCHEMA = COALESCE(:schema, DATABASE())
+                      AND TABLE_NAME IN :tables
+                    GROUP BY TABLE_NAME) k ON k.TABLE_NAME = t.TABLE_NAME
+WHERE t.TABLE_SCHEMA = COALESCE(:schema, DATABASE())
+  AND t.TABLE_NAME IN :tables
\ No newline at end of file
@@ -0,0 +1,18 @@
+SELECT c.relname,
+       md5(concat_ws('|',
+                     c.relkind,
+                     obj_description(c.oid, 'pg_class'),
+                     (SELECT string_agg(concat_ws(',', a.attnum, a.attname, format_type(a.atttypid, a.atttypmod),
+                                                  a.attnotnull, col_description(c.oid, a.attnum)),
+                                        ';' ORDER BY a.attnum)
+                      FROM pg_attribute a
+                      WHERE a.attrelid = c.oid
+                        AND a.attnum > 0
+                        AND NOT a.attisdropped),
+                     (SELECT string_agg(pg_get_constraintdef(o.oid), ';' ORDER BY o.conname)
+                      FROM pg_constraint o
+                      WHERE o.conrelid = c.oid)))
+FROM pg_class c
+         JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relname = ANY(:tables)
+  AND n.nspname = COALESCE(:schema, current_schema())
\ No newline at end of file
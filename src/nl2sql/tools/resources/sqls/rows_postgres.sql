@@ -0,0 +1,5 @@
+SELECT c.relname, c.reltuples
+FROM pg_class c
+         JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relname = ANY(:tables)
+  AND n.nspname = COALESCE(:schema, current_schema())
\ No newline at end of file
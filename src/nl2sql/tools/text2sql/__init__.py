@@ -1,3 +1,28 @@
-from .oneshot import Text2SQL
-from .agent import Text2SQLAgent
-from .assembly import Text2SQLAssembly
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .oneshot import Text2SQL
+    from .agent import Text2SQLAgent
+    from .assembly import Text2SQLAssembly
+
+# exports are imported on first access, oneshot loads langchain and agent loads openai-agents
+_EXPORTS = {
+    "Text2SQL": ".oneshot",
+    "Text2SQLAgent": ".agent",
+    "Text2SQLAssembly": ".assembly"
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(__all__))
@@ -1,13 +1,14 @@
 import json
 import agents
-import records
 
 from os import sep
 from deprecated import deprecated
 
 from nl2sql.utils.path import fpd
+from nl2sql.utils.executor import run_blocking
 from nl2sql.utils.strings import read_file_to_str
-from nl2sql.tools.database.data import execute_sql
+from nl2sql.utils.tracing import span
+from nl2sql.tools.database.data import CostAction
 from nl2sql.tools.text2sql.base import NL2SQLResult, Text2SQLBase
 
 from typing import (
@@ -60,7 +61,8 @@ class Text2SQLAgent(Text2SQLBase):
             name="simple-nl2sql-agent",
             model=agents.OpenAIChatCompletionsModel(
                 model=self.llm_model,
-                openai_client=self._openai_service
+                # the agents SDK needs a real client, agent runs stay on the first endpoint
+                openai_client=self._openai_clients[0]
             ),
             model_settings=agents.ModelSettings(
                 parallel_tool_calls=True
@@ -97,7 +99,7 @@ class Text2SQLAgent(Text2SQLBase):
                 db_schema (str, optional): Database schema, use `public` if None.
                 sample_limit (int, optional): Limit for sample values. Defaults to 3.
             """
-            return "\n".join(map(str, self.query_tables_metadata(tables, db_schema, sample_limit)))
+            return "\n".join(map(str, await self.aquery_tables_metadata(tables, db_schema, sample_limit)))
 
         if create_tool:
             return agents.function_tool()(search_tables_metadata)
@@ -138,14 +140,17 @@ class Text2SQLAgent(Text2SQLBase):
         ) -> str | list[dict] | dict:
             """
             Execute the SQL and return the result.
+            Expensive SQL is rejected or limited before execution, the result then comes with the verdict.
 
             Args:
                 sql (str): SQL string that can be executed directly.
-                fmt (str, optional): Format of the result. Defaults to "markdown". Supported formats: "markdown", "json"
+                fmt (str, optional): Format of the result. Defaults to "markdown". Supported formats: "markdown", "json", "columnar"
             """
-            return execute_sql(db, sql, fmt)
-
-        db = records.Database(self.db_uri)
+            verdict = await run_blocking(self.guard_sql, sql)
+            if verdict.action == CostAction.ALLOW:
+                return await run_blocking(self.execute_sql, verdict.sql, fmt)
+            result = await run_blocking(self.execute_sql, verdict.sql, fmt) if verdict.allowed else None
+            return {"verdict": verdict.model_dump(mode="json"), "result": result}
 
         if create_tool:
             return agents.function_tool()(sql_executor)
@@ -170,13 +175,27 @@ class Text2SQLAgent(Text2SQLBase):
                 tags=tags
             )
 
-        answer = (await agents.Runner.run(
-            self._agent,
-            [
-                {"role": "system", "content": context_prompt},
-                {"role": "user", "content": question}
-            ]
-        ))
+        with self._trace() as trace, span("generate"):
+            with span("agent_run", model=self.llm_model) as current:
+                answer = (await agents.Runner.run(
+                    self._agent,
+                    [
+                        {"role": "system", "content": context_prompt},
+                        {"role": "user", "content": question}
+                    ]
+                ))
+                usage = answer.context_wrapper.usage
+                if current is not None:
+                    current.attributes.update(
+                        requests=usage.requests,
+                        prompt_tokens=usage.input_tokens,
+                        completion_tokens=usage.output_tokens,
+                        total_tokens=usage.total_tokens
+                    )
+        return self._traced(self._answer(question, tables, context_prompt, answer), trace)
+
+    @staticmethod
+    def _answer(question: str, tables: list[str], context_prompt: str, answer: Any) -> AgentResult:
         try:
             answer = json.loads(answer.final_output)
 
@@ -0,0 +1,144 @@
+import json
+import time
+import hashlib
+import threading
+
+import numpy as np
+from collections import OrderedDict
+from pydantic import (
+    BaseModel,
+    PrivateAttr
+)
+from typing import (
+    Optional,
+    Iterable
+)
+
+from nl2sql.utils.vectors import normalize
+from nl2sql.tools.database.metadata import Metadata
+from nl2sql.tools.text2sql.base import NL2SQLResult
+
+
+class AnswerCacheStats(BaseModel):
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+
+class _Bucket:
+    def __init__(self, dim: int):
+        self.ids: list[int] = []
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.results: list[NL2SQLResult] = []
+        self.expires: list[float] = []
+
+    def append(self, entry_id: int, vector: np.ndarray, result: NL2SQLResult, expires_at: float) -> None:
+        self.ids.append(entry_id)
+        self.vectors = np.vstack([self.vectors, vector])
+        self.results.append(result)
+        self.expires.append(expires_at)
+
+    def remove(self, entry_id: int) -> None:
+        i = self.ids.index(entry_id)
+        del self.ids[i], self.results[i], self.expires[i]
+        self.vectors = np.delete(self.vectors, i, axis=0)
+
+
+class AnswerCache(BaseModel):
+    """
+    In-process semantic cache of generated answers.
+    Answers are grouped by a fingerprint of the tables, DDLs and hints they were generated with,
+    a question hits when its embedding is at least `threshold` cosine-similar to a cached one.
+    Entries expire after `ttl` seconds and the least recently used are evicted beyond `max_entries`.
+    """
+    threshold: float = 0.95
+    max_entries: int = 1024
+    ttl: float = 86400
+
+    _buckets: dict[str, _Bucket] = PrivateAttr(default_factory=dict)
+    _order: OrderedDict = PrivateAttr(default_factory=OrderedDict)
+    _next_id: int = PrivateAttr(0)
+    _stats: AnswerCacheStats = PrivateAttr(default_factory=AnswerCacheStats)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def stats(self) -> AnswerCacheStats:
+        return self._stats.model_copy()
+
+    def lookup(self, embedding: list[float], fingerprint: str) -> Optional[NL2SQLResult]:
+        vector = normalize(embedding)
+        with self._lock:
+            bucket = self._buckets.get(fingerprint)
+            if bucket is not None and bucket.ids and bucket.vectors.shape[1] == vector.shape[0]:
+                scores = bucket.vectors @ vector
+                i = int(np.argmax(scores))
+                if scores[i] >= self.threshold:
+                    entry_id = bucket.ids[i]
+                    if bucket.expires[i] > time.monotonic():
+                        self._order.move_to_end(entry_id)
+                        self._stats.hits += 1
+                        return bucket.results[i].model_copy()
+                    self._remove(entry_id)
+            self._stats.misses += 1
+            return None
+
+    def store(self, embedding: list[float], fingerprint: str, result: NL2SQLResult) -> None:
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        vector = normalize(embedding)
+        with self._lock:
+            bucket = self._buckets.get(fingerprint)
+            if bucket is None or bucket.vectors.shape[1] != vector.shape[0]:
+                bucket = self._buckets[fingerprint] = _Bucket(vector.shape[0])
+            elif bucket.ids:
+                # replace the answer of a question that is already cached
+                scores = bucket.vectors @ vector
+                i = int(np.argmax(scores))
+                if scores[i] >= self.threshold:
+                    self._remove(bucket.ids[i])
+                    bucket = self._buckets.setdefault(fingerprint, bucket)
+            entry_id = self._next_id
+            self._next_id += 1
+            bucket.append(entry_id, vector, result.model_copy(), time.monotonic() + self.ttl)
+            self._order[entry_id] = fingerprint
+            while len(self._order) > self.max_entries:
+                self._remove(next(iter(self._order)))
+                self._stats.evictions += 1
+
+    def invalidate(self, fingerprint: str = None) -> None:
+        with self._lock:
+            for entry_id in [x for x, fp in self._order.items() if fingerprint is None or fp == fingerprint]:
+                self._remove(entry_id)
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def _remove(self, entry_id: int) -> None:
+        fingerprint = self._order.pop(entry_id)
+        bucket = self._buckets[fingerprint]
+        bucket.remove(entry_id)
+        if not bucket.ids:
+            del self._buckets[fingerprint]
+
+
+def answer_fingerprint(
+        db_url: str,
+        llm_model: str,
+        tables_metadata: Iterable[Metadata],
+        db_schema: str = None,
+        columns: Iterable[str] = None,
+        expressions: Iterable[str] = None
+) -> str:
+    """
+    Fingerprint what an answer depends on besides the question, sample values are left out on purpose.
+    """
+    payload = json.dumps([
+        db_url,
+        llm_model,
+        db_schema,
+        sorted((x.table_name, x.ddl, x.error is None) for x in tables_metadata),
+        sorted(columns or []),
+        sorted(expressions or [])
+    ], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
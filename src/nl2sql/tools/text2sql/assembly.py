@@ -1,22 +1,77 @@
+import time
+import asyncio
 from os import sep
+from collections import deque
+from pydantic import (
+    BaseModel,
+    ConfigDict,
+    PrivateAttr
+)
+from sqlalchemy.exc import NoSuchTableError
 
+from nl2sql.tools.database.metadata import Metadata
+from nl2sql.tools.database.catalog import engine_key
 from nl2sql.tools.text2sql.base import NL2SQLResult, Text2SQLBase
+from nl2sql.tools.text2sql.answers import AnswerCache, answer_fingerprint
+from nl2sql.tools.text2sql.prompt import PromptLayout, estimate_tokens, compact_tables_metadata, shared_prefix_length
 from nl2sql.utils.path import fpd
-from nl2sql.utils.strings import read_file_to_str
+from nl2sql.utils.strings import read_file_to_str, find_statement_end, strip_code_fence
+from nl2sql.utils.tracing import span, record_usage, usage_attributes
 
 from typing import (
     Any,
-    Iterable
+    Optional,
+    Iterable,
+    AsyncIterator
 )
 
 
+class NL2SQLRequest(BaseModel):
+    question: str
+    tables: Optional[list[str]] = None
+    columns: Optional[list[str]] = None
+    expressions: Optional[list[str]] = None
+
+
+class SQLDelta(BaseModel):
+    content: str
+
+
+class SQLStatementComplete(BaseModel):
+    sql: str
+
+
 class Text2SQLAssembly(Text2SQLBase):
+    answer_cache: Optional[AnswerCache] = None
+    token_budget: Optional[int] = None
+    # concurrent identical generate calls share one generation
+    coalesce_requests: bool = True
+    prompt_layout: PromptLayout = PromptLayout.TEMPLATE
+    # recent system prompts compared to each new one to report the reused prefix, with the prefix cache layout
+    prefix_history: int = 32
+
+    _flights: dict[tuple, "_Flight"] = PrivateAttr(default_factory=dict)
+    _coalesced: int = PrivateAttr(0)
+    _prefixes: deque = PrivateAttr(None)
+
     def model_post_init(self, context: Any, /) -> None:
         # load prompt
         default_text2sql_prompt_file = f"{fpd(__file__, 2)}{sep}resources{sep}prompts{sep}text2sql{sep}text2sql_assembly.md"
         self.text2sql_prompt = self.text2sql_prompt or read_file_to_str(default_text2sql_prompt_file)
+        self._prefixes = deque(maxlen=self.prefix_history)
         super().model_post_init(context)
 
+    @property
+    def coalesced_requests(self) -> int:
+        """
+        Number of generate calls answered by the generation of an identical concurrent call.
+        """
+        return self._coalesced
+
+    @property
+    def is_answer_cache_enabled(self):
+        return self.answer_cache is not None and self._openai_service and self.embedding_model
+
     async def generate(
             self,
             question: str,
@@ -26,38 +81,431 @@ class Text2SQLAssembly(Text2SQLBase):
             db_schema: str = None,
             sample_limit: int = 3,
             ref_limit: int = 3,
-            tags: Iterable[str] = None
+            tags: Iterable[str] = None,
+            token_budget: int = None
     ) -> NL2SQLResult:
-        tables_metadata = self.query_tables_metadata(tables, db_schema, sample_limit)
-        db_ctxt = "\n\n".join(map(str, tables_metadata))
+        """
+        Generate the SQL of a question. While a generation with the same arguments is running,
+        the call waits for its result instead of starting another one, see `coalesce_requests`.
+        """
+        tags = tuple(tags) if tags is not None else None
+        arguments = (question, tables, columns, expressions, db_schema, sample_limit, ref_limit, tags, token_budget)
+        if not self.coalesce_requests:
+            return await self._generate(*arguments)
+
+        key = (asyncio.get_running_loop(), *(tuple(x) if isinstance(x, list) else x for x in arguments))
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(task=asyncio.ensure_future(self._generate(*arguments)))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._land(key, flight))
+        else:
+            self._coalesced += 1
+        flight.waiters += 1
+        try:
+            # a cancelled waiter must not cancel the generation the others wait for
+            result = await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # nobody waits anymore
+                self._land(key, flight)
+                flight.task.cancel()
+        return result.model_copy(deep=True)
+
+    def _land(self, key: tuple, flight: "_Flight") -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def _generate(
+            self,
+            question: str,
+            tables: list[str] = None,
+            columns: list[str] = None,
+            expressions: list[str] = None,
+            db_schema: str = None,
+            sample_limit: int = 3,
+            ref_limit: int = 3,
+            tags: Iterable[str] = None,
+            token_budget: int = None
+    ) -> NL2SQLResult:
+        with self._trace() as trace, span("generate"):
+            generation = await self._prepare(
+                question, tables, columns, expressions, db_schema, sample_limit, ref_limit, tags, token_budget
+            )
+            if not generation.cached:
+                generation.result.sql = await self._complete(generation.result.prompt, generation.message)
+                self._remember(generation)
+        return self._traced(generation.result, trace)
+
+    async def generate_stream(
+            self,
+            question: str,
+            tables: list[str] = None,
+            columns: list[str] = None,
+            expressions: list[str] = None,
+            db_schema: str = None,
+            sample_limit: int = 3,
+            ref_limit: int = 3,
+            tags: Iterable[str] = None,
+            token_budget: int = None,
+            stop_at_statement_end: bool = False
+    ) -> AsyncIterator[SQLDelta | SQLStatementComplete | NL2SQLResult]:
+        """
+        Stream the generated SQL: `SQLDelta` for each received token delta,
+        `SQLStatementComplete` as soon as a terminating `;` is received and the `NL2SQLResult` at last.
+        Breaking out of the iteration closes the completion request.
+
+        Args:
+            stop_at_statement_end (bool, optional): Close the completion once the first statement is complete
+                and return it as the result. Defaults to False.
+        """
+        # the trace must not stay active across yields, they run in the consumer's context
+        started_at, start = time.time(), time.perf_counter()
+        with self._trace() as trace:
+            generation = await self._prepare(
+                question, tables, columns, expressions, db_schema, sample_limit, ref_limit, tags, token_budget
+            )
+        result = generation.result
+        if generation.cached:
+            trace.record("generate", started_at, start)
+            yield SQLDelta(content=result.sql)
+            yield SQLStatementComplete(sql=result.sql)
+            yield self._traced(result, trace)
+            return
+
+        completion_started_at, completion_start = time.time(), time.perf_counter()
+        completion = {"model": self.llm_model, "stream": True}
+        stream = await self._openai_service.chat.completions.create(
+            model=self.llm_model,
+            messages=self._messages(result.prompt, generation.message),
+            stream=True
+        )
+        chunks, statement = [], None
+        try:
+            async for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    completion.update(usage_attributes(chunk.usage))
+                content = chunk.choices[0].delta.content if chunk.choices else None
+                if not content:
+                    continue
+                if not chunks:
+                    completion["first_token"] = time.perf_counter() - completion_start
+                chunks.append(content)
+                yield SQLDelta(content=content)
+                if statement is None:
+                    sql = "".join(chunks)
+                    end = find_statement_end(sql, self._sqlalchemy_engine.dialect.name)
+                    if end >= 0:
+                        statement = strip_code_fence(sql[:end + 1])
+                        yield SQLStatementComplete(sql=statement)
+                        if stop_at_statement_end:
+                            break
+        finally:
+            await stream.close()
+            trace.record("chat_completion", completion_started_at, completion_start, **completion)
+            trace.record("generate", started_at, start)
+
+        result.sql = statement if stop_at_statement_end and statement is not None else "".join(chunks)
+        self._remember(generation)
+        yield self._traced(result, trace)
+
+    async def generate_many(
+            self,
+            questions: Iterable[str | NL2SQLRequest],
+            tables: list[str] = None,
+            columns: list[str] = None,
+            expressions: list[str] = None,
+            db_schema: str = None,
+            sample_limit: int = 3,
+            ref_limit: int = 3,
+            tags: Iterable[str] = None,
+            concurrency: int = 8,
+            token_budget: int = None
+    ) -> list[NL2SQLResult]:
+        """
+        Generate SQLs for a batch of questions.
+        The union of their tables is described once, all questions are embedded in one request
+        and searched in one multi-vector search, then at most `concurrency` completions run at a time.
+        Results keep the input order, a failed item carries its `error` instead of failing the batch.
+
+        Args:
+            questions (list[str | NL2SQLRequest]): Questions, plain strings use the shared `tables`, `columns`
+                and `expressions`.
+            concurrency (int, optional): Max number of concurrent LLM requests. Defaults to 8.
+            token_budget (int, optional): Max estimated tokens of each prompt, see `compact_tables_metadata`.
+        """
+        requests = [
+            x if isinstance(x, NL2SQLRequest) else NL2SQLRequest(
+                question=x, tables=tables, columns=columns, expressions=expressions
+            ) for x in questions
+        ]
+        if not requests:
+            return []
+        # the shared stages are timed once and reported in the timings of every result
+        with self._trace() as batch:
+            if self.is_schema_linking_enabled:
+                unlinked = [x for x in requests if x.tables is None]
+                if unlinked:
+                    linked = await self.link_tables_many([x.question for x in unlinked], db_schema)
+                    for request, linked_tables in zip(unlinked, linked):
+                        request.tables = linked_tables
+            if any(x.tables is None for x in requests):
+                union = None
+            else:
+                union = list(dict.fromkeys(table for x in requests for table in x.tables))
+
+            async def describe() -> list[Metadata]:
+                # questions without tables describe none, an empty list would describe all of them
+                if union == []:
+                    return []
+                return await self.aquery_tables_metadata(union, db_schema, sample_limit)
+
+            try:
+                tables_metadata, references = await asyncio.gather(
+                    describe(),
+                    self.query_similar_questions_many([x.question for x in requests], ref_limit, tags)
+                )
+            except Exception as e:
+                return [
+                    NL2SQLResult(question=x.question, tables=x.tables or [], prompt="", error=str(e))
+                    for x in requests
+                ]
+        shared = batch.timings()
+        described = {x.table_name: x for x in tables_metadata}
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def generate_one(request: NL2SQLRequest, refs: dict) -> NL2SQLResult:
+            if request.tables is None:
+                selected = tables_metadata
+            else:
+                selected = [described.get(x) or Metadata.default(x, NoSuchTableError(x)) for x in request.tables]
+            result = NL2SQLResult(
+                question=request.question,
+                tables=request.tables or [x.table_name for x in selected],
+                prompt=""
+            )
+            with self._trace() as trace:
+                try:
+                    prompt = self._build_prompt(
+                        request.question, selected, request.columns, request.expressions, refs, token_budget
+                    )
+                    result.prompt = prompt.system
+                    result.prompt_tokens = prompt.tokens
+                    result.reused_prefix_bytes = prompt.reused_prefix_bytes
+                    async with semaphore:
+                        result.sql = await self._complete(prompt.system, prompt.message)
+                except Exception as e:
+                    result.error = str(e)
+            self._traced(result, trace)
+            result.timings = {**shared, **result.timings}
+            return result
+
+        return list(await asyncio.gather(*map(generate_one, requests, references)))
+
+    def _build_prompt(
+            self,
+            question: str,
+            tables_metadata: list[Metadata],
+            columns: list[str] = None,
+            expressions: list[str] = None,
+            references: dict = None,
+            token_budget: int = None
+    ) -> "_Prompt":
         required_columns = "\n".join(map(lambda x: f"- {x}", columns or []))
         cols_ctxt = f"# Required Columns\n{required_columns}" if columns else ""
-        expressions = "\n".join(map(lambda x: f"- {x}", expressions or []))
-        expr_ctxt = f"# Predicates References\n{expressions}" if expressions else ""
-        references = await self.query_similar_questions(question, ref_limit, tags)
-        refs = list(map(lambda x: f"Question: {x[0]}\nSQL: {x[1]}\n", references.items()))
+        predicates = "\n".join(map(lambda x: f"- {x}", expressions or []))
+        expr_ctxt = f"# Predicates References\n{predicates}" if expressions else ""
+        refs = list(map(lambda x: f"Question: {x[0]}\nSQL: {x[1]}\n", (references or {}).items()))
         similar_ctxt = f"# Similar Question&SQL References\n{"\n".join(refs)}" if len(refs) > 0 else ""
+        sections = {"cols_ctxt": cols_ctxt, "expr_ctxt": expr_ctxt, "similar_ctxt": similar_ctxt}
+        dialect = self._sqlalchemy_engine.dialect.name
+        instructions = self.text2sql_prompt.format(
+            dialect=dialect, db_ctxt="", cols_ctxt="", expr_ctxt="", similar_ctxt=""
+        )
+        token_budget = token_budget or self.token_budget
+        if self.prompt_layout == PromptLayout.PREFIX_CACHE:
+            return self._build_prefix_cache_prompt(question, tables_metadata, sections, instructions, token_budget)
+
+        if token_budget:
+            overhead = estimate_tokens(self.text2sql_prompt.format(dialect=dialect, db_ctxt="", **sections))
+            tables_metadata = compact_tables_metadata(
+                tables_metadata, token_budget - overhead - estimate_tokens(question), columns, expressions
+            )
+        db_ctxt = "\n\n".join(map(str, tables_metadata))
+        tokens = {
+            "instructions": estimate_tokens(instructions),
+            "db_ctxt": estimate_tokens(db_ctxt),
+            **{name: estimate_tokens(x) for name, x in sections.items()},
+            "question": estimate_tokens(question)
+        }
+        tokens["total"] = sum(tokens.values())
+        return _Prompt(
+            system=self.text2sql_prompt.format(dialect=dialect, db_ctxt=db_ctxt, **sections),
+            message=question,
+            tokens=tokens
+        )
 
+    def _build_prefix_cache_prompt(
+            self,
+            question: str,
+            tables_metadata: list[Metadata],
+            sections: dict[str, str],
+            instructions: str,
+            token_budget: int = None
+    ) -> "_Prompt":
+        """
+        The system prompt depends on the table set only: tables sorted by name, without the sampled rows,
+        which are random and expire, and compacted against the budget left by the instructions regardless
+        of the question. The samples and the per-question sections go to the user message.
+        """
+        dialect = self._sqlalchemy_engine.dialect.name
+        tables_metadata = sorted(tables_metadata, key=lambda x: x.table_name)
+        schema = [x.trimmed(drop_samples=True) for x in tables_metadata]
+        if token_budget:
+            schema = compact_tables_metadata(schema, token_budget - estimate_tokens(instructions))
+        db_ctxt = "\n\n".join(map(str, schema))
         system_prompt = self.text2sql_prompt.format(
-            dialect=self._sqlalchemy_engine.dialect.name,
-            db_ctxt=db_ctxt,
-            cols_ctxt=cols_ctxt,
-            expr_ctxt=expr_ctxt,
-            similar_ctxt=similar_ctxt
+            dialect=dialect, db_ctxt=db_ctxt, cols_ctxt="", expr_ctxt="", similar_ctxt=""
+        ).rstrip()
+
+        volatile = [x for x in sections.values() if x]
+        # the samples take what the budget leaves after the rest of the prompt
+        left = None
+        if token_budget:
+            left = token_budget - estimate_tokens(system_prompt) - estimate_tokens("\n\n".join([*volatile, question]))
+        samples = []
+        for table in tables_metadata:
+            sample = f"-- {table.table_name}:\n{"\n".join(table.samples)}"
+            if not table.samples:
+                continue
+            if left is not None:
+                if estimate_tokens(sample) > left:
+                    break
+                left -= estimate_tokens(sample)
+            samples.append(sample)
+        samples_ctxt = f"# Example Values\n{"\n\n".join(samples)}" if samples else ""
+        volatile = [x for x in (samples_ctxt, *volatile) if x]
+        message = "\n\n".join([*volatile, f"# Question\n{question}"]) if volatile else question
+
+        tokens = {
+            "instructions": estimate_tokens(instructions),
+            "db_ctxt": estimate_tokens(db_ctxt),
+            "samples": estimate_tokens(samples_ctxt),
+            **{name: estimate_tokens(x) for name, x in sections.items()},
+            "question": estimate_tokens(question)
+        }
+        tokens["total"] = sum(tokens.values())
+        return _Prompt(
+            system=system_prompt,
+            message=message,
+            tokens=tokens,
+            reused_prefix_bytes=self._reuse_prefix(system_prompt)
         )
 
-        return NL2SQLResult(
-            question=question,
-            tables=tables,
-            prompt=system_prompt,
-            sql=(await self._openai_service.chat.completions.create(
-                model=self.llm_model,
-                messages=[{
-                    "role": "system",
-                    "content": system_prompt
-                }, {
-                    "role": "user",
-                    "content": question
-                }],
-            )).choices[0].message.content
+    def _reuse_prefix(self, system_prompt: str) -> int:
+        """
+        Bytes of the system prompt shared with the recently built ones, the most a server-side
+        prefix cache can skip. The prompt becomes the most recent one.
+        """
+        encoded = system_prompt.encode()
+        reused = max((shared_prefix_length(encoded, x) for x in self._prefixes), default=0)
+        if encoded in self._prefixes:
+            self._prefixes.remove(encoded)
+        self._prefixes.append(encoded)
+        return reused
+
+    async def _prepare(
+            self,
+            question: str,
+            tables: list[str] = None,
+            columns: list[str] = None,
+            expressions: list[str] = None,
+            db_schema: str = None,
+            sample_limit: int = 3,
+            ref_limit: int = 3,
+            tags: Iterable[str] = None,
+            token_budget: int = None
+    ) -> "_Generation":
+        if tables is None and self.is_schema_linking_enabled:
+            tables = await self.link_tables(question, db_schema)
+        if self.is_answer_cache_enabled:
+            tables_metadata, embedding = await asyncio.gather(
+                self.aquery_tables_metadata(tables, db_schema, sample_limit),
+                self.embeddings.embed(self._openai_service, self.embedding_model, question)
+            )
+            fingerprint = answer_fingerprint(
+                engine_key(self._sqlalchemy_engine), self.llm_model, tables_metadata, db_schema, columns, expressions
+            )
+            cached = self.answer_cache.lookup(embedding, fingerprint)
+            if cached is not None:
+                return _Generation(
+                    result=cached.model_copy(update={"question": question, "reused_prefix_bytes": None}), cached=True
+                )
+            references = await self.query_similar_questions(question, ref_limit, tags)
+        else:
+            embedding, fingerprint = None, None
+            tables_metadata, references = await asyncio.gather(
+                self.aquery_tables_metadata(tables, db_schema, sample_limit),
+                self.query_similar_questions(question, ref_limit, tags)
+            )
+        prompt = self._build_prompt(question, tables_metadata, columns, expressions, references, token_budget)
+        return _Generation(
+            result=NL2SQLResult(
+                question=question,
+                tables=tables or [x.table_name for x in tables_metadata],
+                prompt=prompt.system,
+                prompt_tokens=prompt.tokens,
+                reused_prefix_bytes=prompt.reused_prefix_bytes
+            ),
+            message=prompt.message,
+            embedding=embedding,
+            fingerprint=fingerprint
         )
+
+    def _remember(self, generation: "_Generation") -> None:
+        if self.is_answer_cache_enabled and generation.fingerprint and generation.result.sql:
+            self.answer_cache.store(generation.embedding, generation.fingerprint, generation.result)
+
+    @staticmethod
+    def _messages(system_prompt: str, message: str) -> list[dict]:
+        return [{
+            "role": "system",
+            "content": system_prompt
+        }, {
+            "role": "user",
+            "content": message
+        }]
+
+    async def _complete(self, system_prompt: str, message: str) -> str:
+        with span("chat_completion", model=self.llm_model) as current:
+            response = await self._openai_service.chat.completions.create(
+                model=self.llm_model,
+                messages=self._messages(system_prompt, message),
+            )
+            record_usage(current, response)
+        return response.choices[0].message.content
+
+
+class _Flight(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    task: asyncio.Future
+    waiters: int = 0
+
+
+class _Prompt(BaseModel):
+    system: str
+    # the user message, the question alone or after the per-question sections
+    message: str
+    tokens: dict[str, int]
+    # reported by the prefix cache layout only
+    reused_prefix_bytes: Optional[int] = None
+
+
+class _Generation(BaseModel):
+    result: NL2SQLResult
+    cached: bool = False
+    message: str = ""
+    embedding: Optional[list[float]] = None
+    fingerprint: Optional[str] = None
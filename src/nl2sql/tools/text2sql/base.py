@@ -1,17 +1,36 @@
 import abc
+import asyncio
 import openai
-import records
 import pymilvus
 import sqlalchemy
 
 from nl2sql.tools.database.metadata import Metadata
-from nl2sql.tools.database.data import AmbiguousResult, find_ambiguous_entities
-from nl2sql.tools.database.vector import query_sql_references_by_similar_question
+from nl2sql.tools.database.catalog import MetadataCatalog, SchemaRefresher, engine_key, shared_catalog
+from nl2sql.tools.database.data import (
+    AmbiguousResult,
+    CostAction,
+    CostGuard,
+    CostVerdict,
+    SampleStrategy,
+    execute_sql,
+    find_ambiguous_entities,
+    has_trigram_extension
+)
+from nl2sql.tools.database.vector import query_sql_references_by_similar_questions
+from nl2sql.tools.database.embedding import EmbeddingCache, shared_embedding_cache
+from nl2sql.tools.database.linking import SchemaIndex
+from nl2sql.tools.database.references import ReferenceStore, MilvusReferenceStore
+from nl2sql.tools.database.entity import EntityIndex
+from nl2sql.utils.executor import run_blocking
+from nl2sql.utils.registry import ResourceRegistry, pool_counters
+from nl2sql.utils.routing import EndpointRouter, EndpointStats
+from nl2sql.utils.tracing import SpanHook, Trace, span, start_trace, record_usage
 
 from typing import (
     Any,
     Optional,
-    Iterable
+    Iterable,
+    ContextManager
 )
 from pydantic import (
     BaseModel,
@@ -24,6 +43,13 @@ class NL2SQLResult(BaseModel):
     tables: list[str]
     prompt: str
     sql: Optional[str] = ""
+    error: Optional[str] = None
+    prompt_tokens: Optional[dict[str, int]] = None
+    # seconds spent in each stage and the token usage reported by the APIs
+    timings: Optional[dict[str, float]] = None
+    usage: Optional[dict[str, int]] = None
+    # bytes of the system prompt shared with a recent prompt, reusable by the server's prefix cache
+    reused_prefix_bytes: Optional[int] = None
 
     def __str__(self):
         s = "=" * 37
@@ -33,47 +59,269 @@ class NL2SQLResult(BaseModel):
         return f"{s}\n{question}\n{tables}\n{sql}\n{s}\n"
 
 
+class PoolStats(BaseModel):
+    size: Optional[int] = None
+    checked_in: Optional[int] = None
+    checked_out: Optional[int] = None
+    overflow: Optional[int] = None
+    connects: int = 0
+    checkouts: int = 0
+    status: str = ""
+
+
 class Text2SQLBase(BaseModel, abc.ABC, metaclass=abc.ABCMeta):
     db_uri: str
     openai_baseurl: str
     openai_apikey: Optional[str] = ""
+    # more OpenAI-compatible endpoints serving the same models, requests are routed to the fastest healthy one
+    openai_baseurls: list[str] = []
+    # seconds before an unanswered request is duplicated to the next endpoint, None disables hedging
+    hedge_delay: Optional[float] = None
+    # consecutive failures taking an endpoint out of rotation, and for how many seconds
+    circuit_failures: int = 3
+    circuit_recovery: float = 30
     llm_model: str
 
     milvus_uri: Optional[str] = ""
     collection_name: Optional[str] = ""
+    # search with pymilvus' AsyncMilvusClient on the event loop instead of a thread pool
+    milvus_async: bool = False
     embedding_model: Optional[str] = ""
 
     text2sql_prompt: Optional[str] = ""
 
-    _sqlalchemy_engine: sqlalchemy.Engine = PrivateAttr()
-    _openai_service: openai.AsyncOpenAI = PrivateAttr()
-    _milvus_client: pymilvus.MilvusClient = PrivateAttr()
+    # connection pool of the database engine, None keeps SQLAlchemy's default for the dialect
+    pool_size: Optional[int] = None
+    max_overflow: Optional[int] = None
+    pool_pre_ping: Optional[bool] = None
+    pool_recycle: Optional[int] = None
+
+    # bounds of the results read by execute_sql, None is unbounded
+    sql_max_rows: Optional[int] = 1000
+    sql_max_bytes: Optional[int] = 1 << 20
+    sql_timeout: Optional[float] = None
+    cost_guard: Optional[CostGuard] = None
+
+    metadata_catalog: Optional[MetadataCatalog] = None
+    # seconds between schema fingerprint checks of the cached tables, None disables the background refresh;
+    # a `metadata_catalog` with `track_schema` also catches changes made before the first check
+    schema_refresh_interval: Optional[float] = None
+    embedding_cache: Optional[EmbeddingCache] = None
+    schema_index: Optional[SchemaIndex] = None
+    entity_index: Optional[EntityIndex] = None
+    # searched for SQL references instead of the Milvus collection
+    reference_store: Optional[ReferenceStore] = None
+    # seconds the reference lookup (embedding and search) may take, past it the prompt has no references
+    # or, without `reference_fallback`, the generation fails with TimeoutError
+    reference_timeout: Optional[float] = None
+    reference_fallback: bool = True
+    sample_strategy: Optional[SampleStrategy] = SampleStrategy.AUTO
+    # engines, Milvus and OpenAI clients are shared with the other instances using the registry,
+    # e.g. `shared_registry`; None keeps them private to this instance. The async clients are bound to the
+    # event loop they first run on, share a registry only between instances running on the same loop
+    registry: Optional[ResourceRegistry] = None
+
+    _registry: ResourceRegistry = PrivateAttr()
+    _sqlalchemy_engine: sqlalchemy.Engine = PrivateAttr(None)
+    _openai_service: openai.AsyncOpenAI | EndpointRouter = PrivateAttr(None)
+    _openai_clients: list[openai.AsyncOpenAI] = PrivateAttr(default_factory=list)
+    _milvus_client: pymilvus.MilvusClient | pymilvus.AsyncMilvusClient = PrivateAttr(None)
+    _milvus_store: Optional[MilvusReferenceStore] = PrivateAttr(None)
+    _trigram: Optional[bool] = PrivateAttr(None)
+    _hooks: list[SpanHook] = PrivateAttr(default_factory=list)
+    _schema_refresher: Optional[SchemaRefresher] = PrivateAttr(None)
+    _closed: bool = PrivateAttr(False)
 
     def model_post_init(self, context: Any, /) -> None:
-        # connect to database
-        self._sqlalchemy_engine = sqlalchemy.create_engine(self.db_uri)
-        self._sqlalchemy_engine.connect().close()
-        self._milvus_client = pymilvus.MilvusClient(self.milvus_uri) if self.milvus_uri else None
-        if self._milvus_client:
-            if self.collection_name and self.collection_name not in self._milvus_client.list_collections():
-                raise RuntimeError(f"Collection {self.collection_name} not found in Milvus server.")
-        # connect to llm
-        self._openai_service = openai.AsyncOpenAI(
-            base_url=self.openai_baseurl,
-            api_key=self.openai_apikey
-        )
+        self._registry = self.registry if self.registry is not None else ResourceRegistry()
+        try:
+            # connect to database
+            self._sqlalchemy_engine = self._registry.engine(self.db_uri, **self._pool_options())
+            if self.schema_index is not None:
+                self.catalog.add_listener(self._on_schema_change)
+            if self.milvus_uri:
+                self._milvus_client = self._registry.milvus(self.milvus_uri, self.collection_name, self.milvus_async)
+                if self.collection_name:
+                    self._milvus_store = MilvusReferenceStore(
+                        milvus_client=self._milvus_client,
+                        collection_name=self.collection_name,
+                        timeout=self.reference_timeout
+                    )
+            # connect to llm
+            for base_url in dict.fromkeys([self.openai_baseurl, *self.openai_baseurls]):
+                self._openai_clients.append(self._registry.openai(base_url, self.openai_apikey))
+            self._openai_service = self._openai_clients[0]
+            if len(self._openai_clients) > 1:
+                # latencies and open circuits are shared by the instances routing to the same endpoints
+                self._openai_service = self._registry.acquire(
+                    (
+                        "openai_router", tuple(str(x.base_url) for x in self._openai_clients), self.openai_apikey,
+                        self.hedge_delay, self.circuit_failures, self.circuit_recovery
+                    ),
+                    lambda: EndpointRouter(
+                        clients=self._openai_clients,
+                        hedge_delay=self.hedge_delay,
+                        failure_threshold=self.circuit_failures,
+                        recovery_time=self.circuit_recovery
+                    )
+                )
+            if self.schema_refresh_interval is not None:
+                # one refresher per engine and catalog, however many instances share them
+                self._schema_refresher = self._registry.acquire(
+                    ("schema_refresher", id(self._sqlalchemy_engine), id(self.catalog), self.schema_refresh_interval),
+                    lambda: SchemaRefresher(
+                        catalog=self.catalog,
+                        engine=self._sqlalchemy_engine,
+                        interval=self.schema_refresh_interval
+                    ).start(),
+                    lambda x: x.stop()
+                )
+        except Exception:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        """
+        Release the engine and clients, they are closed once no other instance of the registry uses them.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self.catalog.remove_listener(self._on_schema_change)
+        router = self._openai_service if isinstance(self._openai_service, EndpointRouter) else None
+        for resource in (
+                self._schema_refresher, router, *self._openai_clients, self._milvus_client, self._sqlalchemy_engine
+        ):
+            if resource is not None:
+                self._registry.release(resource)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
 
     @property
     def sqlalchemy_engine(self):
         return self._sqlalchemy_engine
 
+    @property
+    def pool_stats(self) -> PoolStats:
+        pool = self._sqlalchemy_engine.pool
+        stats = PoolStats(status=pool.status(), **pool_counters(self._sqlalchemy_engine))
+        if isinstance(pool, sqlalchemy.QueuePool):
+            stats.size = pool.size()
+            stats.checked_in = pool.checkedin()
+            stats.checked_out = pool.checkedout()
+            stats.overflow = pool.overflow()
+        return stats
+
+    def endpoint_stats(self) -> list[EndpointStats]:
+        """
+        Latency and health of the LLM endpoints, empty with a single endpoint.
+        """
+        return self._openai_service.stats if isinstance(self._openai_service, EndpointRouter) else []
+
+    def _pool_options(self) -> dict[str, Any]:
+        options = {
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "pool_pre_ping": self.pool_pre_ping,
+            "pool_recycle": self.pool_recycle
+        }
+        return {k: v for k, v in options.items() if v is not None}
+
+    def add_hook(self, hook: SpanHook) -> None:
+        """
+        Call `hook` with each finished span of the generations, e.g. to export them to OpenTelemetry,
+        observe Prometheus histograms or log slow stages. Hooks run inline and should be fast.
+        """
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook: SpanHook) -> None:
+        self._hooks.remove(hook)
+
+    def _trace(self) -> ContextManager[Trace]:
+        return start_trace(self._hooks)
+
+    @staticmethod
+    def _traced(result: NL2SQLResult, trace: Trace) -> NL2SQLResult:
+        result.timings = trace.timings()
+        result.usage = trace.usage()
+        return result
+
     @property
     def milvus_client(self):
         return self._milvus_client
 
+    @property
+    def catalog(self) -> MetadataCatalog:
+        return self.metadata_catalog if self.metadata_catalog is not None else shared_catalog
+
+    @property
+    def embeddings(self) -> EmbeddingCache:
+        return self.embedding_cache if self.embedding_cache is not None else shared_embedding_cache
+
     @property
     def is_references_enabled(self):
-        return self._milvus_client and self._openai_service and self.collection_name and self.embedding_model
+        store = self.reference_store is not None or (self._milvus_client and self.collection_name)
+        return store and self._openai_service and self.embedding_model
+
+    @property
+    def is_schema_linking_enabled(self):
+        return self.schema_index is not None and self._openai_service and self.embedding_model
+
+    def _schema_index_key(self, db_schema: str = None) -> str:
+        return f"{engine_key(self._sqlalchemy_engine)}|{db_schema or ''}|{self.embedding_model}"
+
+    def _on_schema_change(self, url: str, changed: list[tuple[Optional[str], str]]) -> None:
+        # called by the catalog's refresh, possibly from the refresher thread
+        if url != engine_key(self._sqlalchemy_engine):
+            return
+        for schema in dict.fromkeys(x for x, _ in changed):
+            self.schema_index.mark_stale(self._schema_index_key(schema), [t for x, t in changed if x == schema])
+
+    async def refresh_schema_index(self, db_schema: str = None, tables: list[str] = None) -> int:
+        """
+        Rebuild the schema linking index from the tables' DDL, only changed tables are embedded again.
+        Given `tables`, only these are described again and the rest of the index is kept.
+        """
+
+        def describe_tables() -> list[Metadata]:
+            with self._sqlalchemy_engine.connect() as db:
+                names = tables if tables else sqlalchemy.inspect(db).get_table_names(db_schema)
+                return Metadata.query_many(db, names, db_schema, sample_limit=0)
+
+        async def embed(docs: list[str]) -> list[list[float]]:
+            with span("embedding", texts=len(docs), model=self.embedding_model) as current:
+                response = await self._openai_service.embeddings.create(input=docs, model=self.embedding_model)
+                record_usage(current, response, "embedding_")
+            return [x.embedding for x in sorted(response.data, key=lambda x: x.index)]
+
+        tables_metadata = await run_blocking(describe_tables)
+        return await self.schema_index.update(
+            self._schema_index_key(db_schema), tables_metadata, embed, partial=bool(tables)
+        )
+
+    async def link_tables(self, question: str, db_schema: str = None, limit: int = None) -> list[str]:
+        return (await self.link_tables_many([question], db_schema, limit))[0]
+
+    async def link_tables_many(
+            self,
+            questions: list[str],
+            db_schema: str = None,
+            limit: int = None
+    ) -> list[list[str]]:
+        """
+        Pick the tables most relevant to each question from the schema linking index, building it if needed.
+        """
+        with span("link_tables", questions=len(questions)):
+            key = self._schema_index_key(db_schema)
+            # the tables changed since the index was built, or all of them on the first build
+            stale = self.schema_index.stale_tables(key)
+            await self.schema_index.ensure_built(key, lambda: self.refresh_schema_index(db_schema, stale))
+            embeddings = await self.embeddings.embed_many(self._openai_service, self.embedding_model, questions)
+            return [[table for table, _ in self.schema_index.search(x, limit)] for x in embeddings]
 
     def query_tables_metadata(
             self,
@@ -81,21 +329,64 @@ class Text2SQLBase(BaseModel, abc.ABC, metaclass=abc.ABCMeta):
             db_schema: str = None,
             sample_limit: int = 3,
     ) -> list[Metadata]:
-        tables = tables or sqlalchemy.inspect(self._sqlalchemy_engine).get_table_names()
-        with self._sqlalchemy_engine.connect() as db:
-            return list(map(lambda x: Metadata.query_or_default(db, x, db_schema, sample_limit), tables))
+        with span("query_tables_metadata") as current:
+            tables = tables or sqlalchemy.inspect(self._sqlalchemy_engine).get_table_names(db_schema)
+            if current is not None:
+                current.attributes["tables"] = len(tables)
+            with self._sqlalchemy_engine.connect() as db:
+                return self.catalog.query_many(db, tables, db_schema, sample_limit, self.sample_strategy)
+
+    async def aquery_tables_metadata(
+            self,
+            tables: Iterable[str] = None,
+            db_schema: str = None,
+            sample_limit: int = 3,
+    ) -> list[Metadata]:
+        return await run_blocking(self.query_tables_metadata, tables, db_schema, sample_limit)
+
+    def invalidate_tables_metadata(self, tables: Iterable[str] = None, db_schema: str = None) -> int:
+        url = engine_key(self._sqlalchemy_engine)
+        if tables is None:
+            return self.catalog.invalidate(schema=db_schema, url=url)
+        return sum(self.catalog.invalidate(x, db_schema, url) for x in tables)
+
+    def refresh_tables_metadata(self) -> list[tuple[Optional[str], str]]:
+        """
+        Fetch again the DDL of the cached tables whose schema changed, see `MetadataCatalog.refresh`.
+        """
+        with self._sqlalchemy_engine.connect() as conn:
+            return self.catalog.refresh(conn)
 
     async def query_similar_questions(self, question: str, limit: int = 3, tags: Iterable[str] = None) -> dict:
-        if self.is_references_enabled:
-            references = await query_sql_references_by_similar_question(
-                question,
+        return (await self.query_similar_questions_many([question], limit, tags))[0]
+
+    async def query_similar_questions_many(
+            self,
+            questions: list[str],
+            limit: int = 3,
+            tags: Iterable[str] = None
+    ) -> list[dict]:
+        if not self.is_references_enabled:
+            return [{} for _ in questions]
+        with span("query_similar_questions", questions=len(questions)) as current:
+            search = query_sql_references_by_similar_questions(
+                questions,
                 self._milvus_client, self.collection_name,
                 self._openai_service, self.embedding_model,
-                limit, tags
+                limit, tags,
+                embedding_cache=self.embeddings,
+                reference_store=self.reference_store or self._milvus_store
             )
-        else:
-            references = {}
-        return references
+            if self.reference_timeout is None:
+                return await search
+            try:
+                return await asyncio.wait_for(search, self.reference_timeout)
+            except TimeoutError:
+                if not self.reference_fallback:
+                    raise
+                if current is not None:
+                    current.attributes["timed_out"] = True
+                return [{} for _ in questions]
 
     def is_entity_ambiguous(
             self,
@@ -104,8 +395,34 @@ class Text2SQLBase(BaseModel, abc.ABC, metaclass=abc.ABCMeta):
             ambiguous_at: list[str],
             display_columns: list[str] = None
     ) -> AmbiguousResult:
-        with records.Database(self.db_uri) as db:
-            return find_ambiguous_entities(db, keyword, table, ambiguous_at, display_columns)
+        with self._sqlalchemy_engine.connect() as conn:
+            if self.entity_index is not None and self.entity_index.covers(table, ambiguous_at):
+                return self.entity_index.find(conn, keyword, table, ambiguous_at, display_columns)
+            if self._trigram is None:
+                self._trigram = has_trigram_extension(conn)
+            return find_ambiguous_entities(conn, keyword, table, ambiguous_at, display_columns, self._trigram)
+
+    def guard_sql(self, sql: str) -> CostVerdict:
+        """
+        Check the SQL against the cost guard, everything is allowed without one.
+        """
+        if self.cost_guard is None:
+            return CostVerdict(action=CostAction.ALLOW, sql=sql)
+        with self._sqlalchemy_engine.connect() as conn:
+            return self.cost_guard.check(conn, sql)
+
+    def execute_sql(self, sql: str, fmt: Optional[str] = "markdown") -> str | list[dict] | dict | bytes:
+        with self._sqlalchemy_engine.connect() as conn:
+            return execute_sql(conn, sql, fmt, self.sql_max_rows, self.sql_max_bytes, self.sql_timeout)
+
+    def refresh_entity_index(self, full: bool = False) -> int:
+        """
+        Load the values added since the last refresh into the entity index, `full` also drops removed values.
+        """
+        if self.entity_index is None:
+            return 0
+        with self._sqlalchemy_engine.connect() as conn:
+            return self.entity_index.refresh(conn, full)
 
     @abc.abstractmethod
     async def generate(
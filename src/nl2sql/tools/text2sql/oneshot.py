@@ -146,17 +146,9 @@ class Text2SQL:
         refs = list(map(lambda x: f"Query: {x[0]}\nSQL: {x[1]}\n", references.items()))
         refs_context = f"# References\n{"\n".join(refs)}" if len(refs) > 0 else ""
 
-        schema_info = {}
-        errs = {}
         with self._engine.connect() as db:
-            metadata = sqlalchemy.MetaData()
-            metadata.reflect(bind=self._engine)
-            for table_name in tables:
-                try:
-                    schema_info[table_name] = TableContext.query(db, table_name, sample_limit=sample_limit)
-                except Exception as e:
-                    errs[table_name] = f"Can't get schema info for table {table_name}: {e}"
-        db_ctxt = "\n".join(map(lambda x: str(x), schema_info.values()))
+            schema_info = TableContext.query_many(db, tables, sample_limit=sample_limit)
+        db_ctxt = "\n".join(map(lambda x: str(x), filter(lambda x: x.error is None, schema_info)))
         ref_req = self._ref_req_prompt if references else ""
         return PromptInfo(
             tables=tables,
@@ -0,0 +1,78 @@
+import re
+import math
+from enum import Enum
+
+from typing import (
+    Callable,
+    Iterable
+)
+
+from nl2sql.tools.database.metadata import Metadata
+
+
+class PromptLayout(str, Enum):
+    # the template as written, sections in its order and tables in the caller's order
+    TEMPLATE = "template"
+    # the instructions and the tables sorted by name in the system prompt, the per-question sections
+    # and the question in the user message, so repeated table sets share a byte-identical prefix
+    PREFIX_CACHE = "prefix_cache"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count without a tokenizer: one token per CJK character, four characters per token otherwise.
+    """
+    wide = sum(1 for x in text if ord(x) >= 0x2E80)
+    return wide + math.ceil((len(text) - wide) / 4)
+
+
+def compact_tables_metadata(
+        tables_metadata: list[Metadata],
+        budget: int,
+        columns: Iterable[str] = None,
+        expressions: Iterable[str] = None,
+        count_tokens: Callable[[str], int] = estimate_tokens
+) -> list[Metadata]:
+    """
+    Trim the tables' context until it fits the token budget. Each step is applied to the largest tables first
+    and only as far as needed: sample values, then column comments, then columns that are neither required,
+    keys nor referenced in the expressions. The result may still exceed the budget when nothing is left to trim.
+    """
+    relevant = _relevant_columns(columns, expressions)
+    steps = [
+        lambda x: x.trimmed(drop_samples=True),
+        lambda x: x.trimmed(drop_comments=True),
+        lambda x: x.trimmed(keep_columns=relevant)
+    ]
+    tables_metadata = list(tables_metadata)
+    sizes = [count_tokens(x.doc) for x in tables_metadata]
+    for step in steps:
+        for i in sorted(range(len(tables_metadata)), key=lambda x: -sizes[x]):
+            if sum(sizes) <= budget:
+                return tables_metadata
+            tables_metadata[i] = step(tables_metadata[i])
+            sizes[i] = count_tokens(tables_metadata[i].doc)
+    return tables_metadata
+
+
+def shared_prefix_length(a: bytes, b: bytes) -> int:
+    """
+    Length of the common prefix of two byte strings.
+    """
+    a, b = memoryview(a), memoryview(b)
+    low, high = 0, min(len(a), len(b))
+    # binary search over slice comparisons, which run in C
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _relevant_columns(columns: Iterable[str] = None, expressions: Iterable[str] = None) -> set[str]:
+    relevant = {x.split(".")[-1].strip('"`') for x in columns or []}
+    for expression in expressions or []:
+        relevant.update(re.findall(r"[A-Za-z_][A-Za-z0-9_$]*", expression))
+    return relevant
@@ -0,0 +1,41 @@
+import asyncio
+import functools
+import contextvars
+import threading
+
+from concurrent.futures import (
+    Executor,
+    ThreadPoolExecutor
+)
+from typing import (
+    Any,
+    Callable
+)
+
+MAX_BLOCKING_WORKERS = 16
+MAX_MILVUS_WORKERS = 8
+
+_executors: dict[str, ThreadPoolExecutor] = {}
+_lock = threading.Lock()
+
+
+def shared_executor(name: str = "nl2sql", max_workers: int = MAX_BLOCKING_WORKERS) -> ThreadPoolExecutor:
+    """
+    get the bounded thread pool of the given name, shared by the blocking calls using it,
+    the default one runs database calls, "milvus" runs searches so that a slow Milvus cannot starve them
+    """
+    with _lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        return _executors[name]
+
+
+async def run_blocking(func: Callable[..., Any], *args, executor: Executor = None, **kwargs) -> Any:
+    """
+    run a blocking call in a thread pool without blocking the event loop, in a copy of the caller's context
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        executor or shared_executor(), functools.partial(context.run, func, *args, **kwargs)
+    )
@@ -0,0 +1,191 @@
+import asyncio
+import weakref
+import threading
+import contextlib
+
+import openai
+import pymilvus
+import sqlalchemy
+from pydantic import (
+    BaseModel,
+    ConfigDict,
+    PrivateAttr
+)
+from typing import (
+    Any,
+    Callable,
+    Optional
+)
+
+
+class _Resource(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    value: Any
+    closer: Optional[Callable[[Any], None]] = None
+    refs: int = 0
+
+
+class _Pending(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    done: threading.Event
+    error: Optional[BaseException] = None
+
+
+class ResourceRegistry(BaseModel):
+    """
+    Clients shared by key between the components using the registry: SQLAlchemy engines by URI and pool options,
+    Milvus clients by URI and OpenAI clients by base URL and API key.
+    `acquire` creates a resource on first use and takes a reference, the resource is closed when its last
+    reference is released. `close` shuts everything down regardless of references.
+    Resources are created outside the registry's lock, a slow or unreachable server only holds up the callers
+    acquiring the same key.
+    """
+    _resources: dict[tuple, _Resource] = PrivateAttr(default_factory=dict)
+    _pending: dict[tuple, _Pending] = PrivateAttr(default_factory=dict)
+    _collections: set[tuple[str, str]] = PrivateAttr(default_factory=set)
+    _lock: threading.RLock = PrivateAttr(default_factory=threading.RLock)
+
+    def __len__(self) -> int:
+        return len(self._resources)
+
+    def acquire(self, key: tuple, factory: Callable[[], Any], closer: Callable[[Any], None] = None) -> Any:
+        while True:
+            with self._lock:
+                resource = self._resources.get(key)
+                if resource is not None:
+                    resource.refs += 1
+                    return resource.value
+                pending = self._pending.get(key)
+                creating = pending is None
+                if creating:
+                    pending = _Pending(done=threading.Event())
+                    self._pending[key] = pending
+            if not creating:
+                # another caller creates it, share its outcome
+                pending.done.wait()
+                if pending.error is not None:
+                    raise pending.error
+                continue
+            try:
+                value = factory()
+            except BaseException as e:
+                pending.error = e
+                raise
+            else:
+                with self._lock:
+                    self._resources[key] = _Resource(value=value, closer=closer, refs=1)
+                return value
+            finally:
+                with self._lock:
+                    del self._pending[key]
+                pending.done.set()
+
+    def release(self, value: Any) -> None:
+        """
+        Drop a reference to an acquired resource, closing it if it was the last one.
+        """
+        with self._lock:
+            for key, resource in self._resources.items():
+                if resource.value is value:
+                    resource.refs -= 1
+                    if resource.refs <= 0:
+                        del self._resources[key]
+                        _close(resource)
+                    return
+
+    def engine(self, uri: str, **options: Any) -> sqlalchemy.Engine:
+        return self.acquire(
+            ("engine", uri, tuple(sorted(options.items()))),
+            lambda: create_engine(uri, **options),
+            lambda x: x.dispose()
+        )
+
+    def milvus(
+            self,
+            uri: str,
+            collection_name: str = None,
+            asynchronous: bool = False
+    ) -> pymilvus.MilvusClient | pymilvus.AsyncMilvusClient:
+        """
+        A Milvus client, the collection is checked to exist once per registry.
+        An `AsyncMilvusClient` connects lazily and cannot be checked here, a missing collection fails its searches.
+        """
+        if asynchronous:
+            return self.acquire(("async_milvus", uri), lambda: pymilvus.AsyncMilvusClient(uri), _close_async_client)
+        client = self.acquire(("milvus", uri), lambda: pymilvus.MilvusClient(uri), lambda x: x.close())
+        if collection_name and (uri, collection_name) not in self._collections:
+            if collection_name not in client.list_collections():
+                self.release(client)
+                raise RuntimeError(f"Collection {collection_name} not found in Milvus server.")
+            with self._lock:
+                self._collections.add((uri, collection_name))
+        return client
+
+    def openai(self, base_url: str, api_key: str = "") -> openai.AsyncOpenAI:
+        """
+        An OpenAI client. Its connection pool is bound to the event loop it first runs on, the instances
+        sharing it must run on one long-lived loop; separate `asyncio.run` calls need separate registries.
+        """
+        return self.acquire(
+            ("openai", base_url, api_key),
+            lambda: openai.AsyncOpenAI(base_url=base_url, api_key=api_key),
+            _close_async_client
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            resources = list(self._resources.values())
+            self._resources.clear()
+            self._collections.clear()
+        for resource in resources:
+            _close(resource)
+
+
+_pool_counters: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_closing: set[asyncio.Task] = set()
+
+
+def create_engine(uri: str, **options: Any) -> sqlalchemy.Engine:
+    """
+    Create an engine counting its connects and checkouts, and check that it connects.
+    """
+    engine = sqlalchemy.create_engine(uri, **options)
+    counters = _pool_counters.setdefault(engine, {"connects": 0, "checkouts": 0})
+    lock = threading.Lock()
+
+    def count(counter: str) -> None:
+        # pool events fire on whichever thread connects or checks out
+        with lock:
+            counters[counter] += 1
+
+    sqlalchemy.event.listen(engine, "connect", lambda *_: count("connects"))
+    sqlalchemy.event.listen(engine, "checkout", lambda *_: count("checkouts"))
+    engine.connect().close()
+    return engine
+
+
+def pool_counters(engine: sqlalchemy.Engine) -> dict[str, int]:
+    return dict(_pool_counters.get(engine, {"connects": 0, "checkouts": 0}))
+
+
+def _close(resource: _Resource) -> None:
+    if resource.closer is not None:
+        # closing is best effort, e.g. the server may already be gone
+        with contextlib.suppress(Exception):
+            resource.closer(resource.value)
+
+
+def _close_async_client(client: openai.AsyncOpenAI | pymilvus.AsyncMilvusClient) -> None:
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        asyncio.run(client.close())
+        return
+    task = loop.create_task(client.close())
+    _closing.add(task)
+    task.add_done_callback(_closing.discard)
+
+
+shared_registry = ResourceRegistry()
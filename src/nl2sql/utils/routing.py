@@ -0,0 +1,192 @@
+import time
+import asyncio
+
+import openai
+from pydantic import (
+    BaseModel,
+    ConfigDict,
+    PrivateAttr
+)
+from typing import (
+    Any,
+    Optional
+)
+
+
+class EndpointStats(BaseModel):
+    base_url: str
+    # smoothed latency in seconds of each kind of request, "chat" or "embeddings"
+    latency: dict[str, float]
+    in_flight: int
+    requests: int
+    failures: int
+    open: bool
+
+
+class _Endpoint(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    client: openai.AsyncOpenAI
+    latency: dict[str, float] = {}
+    in_flight: int = 0
+    requests: int = 0
+    failures: int = 0
+    # consecutive failures, the circuit opens at `failure_threshold`
+    errors: int = 0
+    open_until: float = 0.0
+
+    def score(self, kind: str) -> float:
+        # endpoints without samples are tried first, busy ones are penalized by their queue
+        return self.latency.get(kind, 0.0) * (self.in_flight + 1)
+
+
+class EndpointRouter(BaseModel):
+    """
+    Drop-in for the `chat.completions.create` and `embeddings.create` calls of `openai.AsyncOpenAI`
+    over several OpenAI-compatible endpoints serving the same models.
+    Each request goes to the endpoint with the lowest EWMA latency weighted by its requests in flight.
+    With `hedge_delay`, a request unanswered after that many seconds is duplicated to the next endpoint,
+    the first answer wins and the other request is cancelled.
+    An endpoint failing `failure_threshold` times in a row is skipped for `recovery_time` seconds,
+    a failed request is retried on the next endpoint unless the error is the request's own (4xx).
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    clients: list[openai.AsyncOpenAI]
+    hedge_delay: Optional[float] = None
+    alpha: float = 0.3
+    failure_threshold: int = 3
+    recovery_time: float = 30
+
+    _endpoints: list[_Endpoint] = PrivateAttr(default_factory=list)
+    _chat: Any = PrivateAttr(None)
+    _embeddings: Any = PrivateAttr(None)
+
+    def model_post_init(self, context: Any, /) -> None:
+        # failing over to another endpoint replaces the client's own retries
+        self._endpoints = [_Endpoint(client=x.with_options(max_retries=0)) for x in self.clients]
+        self._chat = _Chat(completions=_Requests(self, "chat"))
+        self._embeddings = _Requests(self, "embeddings")
+
+    @property
+    def chat(self) -> "_Chat":
+        return self._chat
+
+    @property
+    def embeddings(self) -> "_Requests":
+        return self._embeddings
+
+    @property
+    def stats(self) -> list[EndpointStats]:
+        now = time.monotonic()
+        return [
+            EndpointStats(
+                base_url=str(x.client.base_url),
+                latency=dict(x.latency),
+                in_flight=x.in_flight,
+                requests=x.requests,
+                failures=x.failures,
+                open=x.open_until > now
+            ) for x in self._endpoints
+        ]
+
+    async def request(self, kind: str, **kwargs: Any) -> Any:
+        candidates = iter(self._ranked(kind))
+        pending, errors, hedged = set(), [], self.hedge_delay is None
+
+        def launch() -> bool:
+            endpoint = next(candidates, None)
+            if endpoint is not None:
+                pending.add(asyncio.ensure_future(self._send(endpoint, kind, kwargs)))
+            return endpoint is not None
+
+        launch()
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=None if hedged else self.hedge_delay, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    hedged = True
+                    launch()
+                    continue
+                results = [x.result() for x in done if x.exception() is None]
+                if results:
+                    for extra in results[1:]:
+                        await _discard(extra)
+                    return results[0]
+                for task in done:
+                    if not _is_endpoint_failure(task.exception()):
+                        raise task.exception()
+                    errors.append(task.exception())
+                if not pending:
+                    launch()
+            raise errors[-1]
+        finally:
+            for task in pending:
+                task.cancel()
+                task.add_done_callback(_discard_done)
+
+    def _ranked(self, kind: str) -> list[_Endpoint]:
+        now = time.monotonic()
+        available = [x for x in self._endpoints if x.open_until <= now]
+        if not available:
+            # every circuit is open, try the one closest to recovery rather than failing outright
+            return sorted(self._endpoints, key=lambda x: x.open_until)
+        return sorted(available, key=lambda x: (x.score(kind), x.in_flight))
+
+    async def _send(self, endpoint: _Endpoint, kind: str, kwargs: dict) -> Any:
+        target = endpoint.client.chat.completions if kind == "chat" else endpoint.client.embeddings
+        start = time.perf_counter()
+        endpoint.in_flight += 1
+        endpoint.requests += 1
+        try:
+            result = await target.create(**kwargs)
+        except Exception as e:
+            if _is_endpoint_failure(e):
+                endpoint.failures += 1
+                endpoint.errors += 1
+                if endpoint.errors >= self.failure_threshold:
+                    endpoint.open_until = time.monotonic() + self.recovery_time
+            raise
+        finally:
+            endpoint.in_flight -= 1
+        latency = time.perf_counter() - start
+        previous = endpoint.latency.get(kind)
+        endpoint.latency[kind] = latency if previous is None else self.alpha * latency + (1 - self.alpha) * previous
+        endpoint.errors = 0
+        endpoint.open_until = 0.0
+        return result
+
+
+class _Requests:
+    def __init__(self, router: EndpointRouter, kind: str):
+        self._router = router
+        self._kind = kind
+
+    async def create(self, **kwargs: Any) -> Any:
+        return await self._router.request(self._kind, **kwargs)
+
+
+class _Chat:
+    def __init__(self, completions: _Requests):
+        self.completions = completions
+
+
+def _is_endpoint_failure(e: BaseException) -> bool:
+    if isinstance(e, openai.APIStatusError):
+        # overloaded or broken servers, not a request the other endpoints would refuse as well
+        return e.status_code >= 500 or e.status_code in (408, 429)
+    return isinstance(e, (openai.APIConnectionError, ConnectionError, TimeoutError))
+
+
+async def _discard(result: Any) -> None:
+    # a losing streamed completion holds its connection until closed
+    close = getattr(result, "close", None)
+    if close is not None and asyncio.iscoroutinefunction(close):
+        await close()
+
+
+def _discard_done(task: asyncio.Future) -> None:
+    if not task.cancelled() and task.exception() is None:
+        asyncio.ensure_future(_discard(task.result()))
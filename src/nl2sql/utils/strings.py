@@ -1,3 +1,62 @@
+import re
+
+_COMMENTS_RE = re.compile(r"(\s+|--[^\n]*(\n|$)|/\*.*?\*/)*", re.DOTALL)
+
+
 def read_file_to_str(filename: str, encoding: str = 'utf-8'):
     with open(filename, 'r', encoding=encoding) as file:
         return file.read()
+
+
+def find_statement_end(sql: str, dialect: str = None) -> int:
+    """
+    index of the first `;` terminating a statement, ignoring quoted text, comments and markdown code fences,
+    -1 if not terminated yet. A backtick quotes identifiers on MySQL only.
+    """
+    quotes = "'\"`" if dialect in ("mysql", "mariadb") else "'\""
+    i, n = 0, len(sql)
+    while i < n:
+        c = sql[i]
+        if sql.startswith("```", i):
+            # a fence and its language tag, e.g. ```sql
+            i = sql.find("\n", i)
+            if i < 0:
+                return -1
+        elif c in quotes:
+            # skip the quoted text, doubled quotes are escapes
+            i += 1
+            while i < n and not (sql[i] == c and sql[i + 1:i + 2] != c):
+                i += 2 if sql[i] == c else 1
+        elif sql.startswith("--", i):
+            i = sql.find("\n", i)
+            if i < 0:
+                return -1
+        elif sql.startswith("/*", i):
+            i = sql.find("*/", i + 2)
+            if i < 0:
+                return -1
+            i += 1
+        elif c == ";":
+            return i
+        i += 1
+    return -1
+
+
+def skip_comments(sql: str, start: int = 0) -> int:
+    """
+    index of the first character from `start` that is neither whitespace nor part of a comment
+    """
+    return _COMMENTS_RE.match(sql, start).end()
+
+
+def strip_code_fence(sql: str) -> str:
+    """
+    The SQL of a markdown code block, e.g. "```sql\nSELECT 1;\n```", other text unchanged.
+    """
+    stripped = sql.strip()
+    if not stripped.startswith("```"):
+        return sql
+    stripped = stripped.split("\n", 1)[1] if "\n" in stripped else ""
+    if stripped.rstrip().endswith("```"):
+        stripped = stripped.rstrip()[:-3]
+    return stripped.strip()
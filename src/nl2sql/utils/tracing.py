@@ -0,0 +1,163 @@
+import time
+import itertools
+import contextlib
+import contextvars
+
+from pydantic import BaseModel
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    Optional
+)
+
+
+class Span(BaseModel):
+    """
+    A timed stage of a generation. `start` and `end` are `time.perf_counter` readings,
+    `started_at` is the wall clock start for exporters such as OpenTelemetry.
+    """
+    name: str
+    span_id: int
+    parent_id: Optional[int] = None
+    started_at: float
+    start: float
+    end: Optional[float] = None
+    attributes: dict[str, Any] = {}
+    error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+
+SpanHook = Callable[[Span], None]
+
+
+class Trace(BaseModel):
+    """
+    Spans finished while the trace is active, each also passed to the hooks.
+    """
+    hooks: list[SpanHook] = []
+    spans: list[Span] = []
+
+    def finish(self, span: Span) -> None:
+        self.spans.append(span)
+        for hook in self.hooks:
+            # a broken exporter must not fail the generation
+            with contextlib.suppress(Exception):
+                hook(span)
+
+    def record(self, name: str, started_at: float, start: float, **attributes: Any) -> Span:
+        """
+        Finish a span that started at `start` and ends now, for stages that cannot be enclosed in `span`,
+        like those spread over the iterations of an async generator.
+        """
+        finished = Span(
+            name=name,
+            span_id=next(_ids),
+            started_at=started_at,
+            start=start,
+            end=time.perf_counter(),
+            attributes=attributes
+        )
+        self.finish(finished)
+        return finished
+
+    def timings(self) -> dict[str, float]:
+        """
+        Seconds spent in each stage, summed over the spans of the same name.
+        """
+        timings = {}
+        for span in self.spans:
+            timings[span.name] = timings.get(span.name, 0.0) + span.duration
+        return timings
+
+    def usage(self) -> dict[str, int]:
+        """
+        Token counts (`*_tokens` attributes) summed over the spans.
+        """
+        usage = {}
+        for span in self.spans:
+            for key, value in span.attributes.items():
+                if key.endswith("_tokens") and isinstance(value, int):
+                    usage[key] = usage.get(key, 0) + value
+        return usage
+
+
+_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("nl2sql_trace", default=None)
+_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("nl2sql_span", default=None)
+_ids = itertools.count(1)
+
+
+@contextlib.contextmanager
+def start_trace(hooks: Iterable[SpanHook] = ()) -> Iterator[Trace]:
+    """
+    Collect the spans of the enclosed calls, including those run by `run_blocking` in other threads.
+    """
+    trace = Trace(hooks=list(hooks))
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _reset(_trace, token)
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    Time the enclosed block as a span of the current trace, nothing is recorded outside a trace.
+    """
+    trace = _trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = _span.get()
+    current = Span(
+        name=name,
+        span_id=next(_ids),
+        parent_id=parent.span_id if parent is not None else None,
+        started_at=time.time(),
+        start=time.perf_counter(),
+        attributes=attributes
+    )
+    token = _span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end = time.perf_counter()
+        _reset(_span, token)
+        trace.finish(current)
+
+
+def usage_attributes(usage: Any, prefix: str = "") -> dict[str, int]:
+    """
+    Token counts of an OpenAI `usage` object.
+    """
+    attributes = {}
+    for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        value = getattr(usage, key, None)
+        if isinstance(value, int):
+            attributes[f"{prefix}{key}"] = value
+    return attributes
+
+
+def record_usage(current: Optional[Span], response: Any, prefix: str = "") -> None:
+    """
+    Copy the token counts of an OpenAI response to the span, compatible servers may leave out the usage.
+    """
+    usage = getattr(response, "usage", None)
+    if current is not None and usage is not None:
+        current.attributes.update(usage_attributes(usage, prefix))
+
+
+def _reset(var: contextvars.ContextVar, token: contextvars.Token) -> None:
+    try:
+        var.reset(token)
+    except ValueError:
+        # an async generator closed from another context, e.g. by the garbage collector
+        pass
@@ -0,0 +1,10 @@
+import numpy as np
+
+
+def normalize(embedding: list[float] | np.ndarray) -> np.ndarray:
+    """
+    l2-normalize an embedding so that dot products are cosine similarities
+    """
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
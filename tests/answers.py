@@ -0,0 +1,38 @@
+from nl2sql.tools.database.metadata import Metadata
+from nl2sql.tools.text2sql.answers import AnswerCache, answer_fingerprint
+from nl2sql.tools.text2sql.base import NL2SQLResult
+
+
+def _result(question: str, sql: str) -> NL2SQLResult:
+    return NL2SQLResult(question=question, tables=["users"], prompt="", sql=sql)
+
+
+def test_answer_cache_hits_similar_questions_only():
+    cache = AnswerCache(threshold=0.9)
+    cache.store([1.0, 0.0, 0.0], "users", _result("all users", "SELECT * FROM users"))
+    assert cache.lookup([0.98, 0.05, 0.0], "users").sql == "SELECT * FROM users"
+    assert cache.lookup([0.0, 1.0, 0.0], "users") is None
+    assert cache.lookup([1.0, 0.0, 0.0], "assets") is None
+    assert cache.stats.hits == 1 and cache.stats.misses == 2
+
+
+def test_answer_cache_evicts_least_recently_used():
+    cache = AnswerCache(max_entries=2)
+    cache.store([1.0, 0.0], "t", _result("a", "1"))
+    cache.store([0.0, 1.0], "t", _result("b", "2"))
+    assert cache.lookup([1.0, 0.0], "t").sql == "1"
+    cache.store([-1.0, 0.0], "t", _result("c", "3"))
+    assert len(cache) == 2
+    assert cache.lookup([0.0, 1.0], "t") is None
+    assert cache.lookup([1.0, 0.0], "t").sql == "1"
+    assert cache.stats.evictions == 1
+
+
+def test_answer_fingerprint_ignores_samples_and_order():
+    users = Metadata(table_name="users", description="", ddl="CREATE TABLE users ();", samples=["(1,)"])
+    assets = Metadata(table_name="assets", description="", ddl="CREATE TABLE assets ();", samples=[])
+    resampled = users.model_copy(update={"samples": ["(2,)"]})
+    assert (answer_fingerprint("db", "qwen", [users, assets], columns=["id"])
+            == answer_fingerprint("db", "qwen", [assets, resampled], columns=["id"]))
+    assert (answer_fingerprint("db", "qwen", [users, assets])
+            != answer_fingerprint("db", "qwen", [users, assets], expressions=["limit 1"]))
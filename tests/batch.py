@@ -0,0 +1,51 @@
+import asyncio
+
+import sqlalchemy
+
+from nl2sql.benchmark import FakeOpenAIServer, create_synthetic_schema
+from nl2sql.tools.text2sql.assembly import NL2SQLRequest, Text2SQLAssembly
+
+
+class _BrokenPromptAssembly(Text2SQLAssembly):
+    def _build_prompt(self, question: str, *args, **kwargs):
+        if question == "broken":
+            raise ValueError("cannot build the prompt")
+        return super()._build_prompt(question, *args, **kwargs)
+
+
+def test_generate_many_keeps_order_and_isolates_failures(tmp_path):
+    db_uri = f"sqlite:///{tmp_path}/batch.db"
+    engine = sqlalchemy.create_engine(db_uri)
+    names = create_synthetic_schema(engine, tables=3, rows=3)
+    engine.dispose()
+    with FakeOpenAIServer(latency=0.01, token_rate=10_000) as server:
+        text2sql = _BrokenPromptAssembly(
+            db_uri=db_uri,
+            openai_baseurl=server.base_url,
+            openai_apikey="batch",
+            llm_model="fake-llm"
+        )
+
+        async def generate():
+            return (
+                await text2sql.generate_many([
+                    NL2SQLRequest(question="first", tables=[names[2]]),
+                    NL2SQLRequest(question="broken", tables=[names[0]]),
+                    NL2SQLRequest(question="last", tables=[names[1]])
+                ]),
+                await text2sql.generate_many([]),
+                await text2sql.generate_many(["nothing"], tables=[])
+            )
+
+        results, empty, untabled = asyncio.run(generate())
+        # the public API keeps describing every table for an empty list
+        assert len(text2sql.query_tables_metadata([], sample_limit=0)) == 3
+        text2sql.close()
+    assert [x.question for x in results] == ["first", "broken", "last"]
+    assert results[0].sql == f"SELECT * FROM {names[2]} LIMIT 10;"
+    assert results[2].sql == f"SELECT * FROM {names[1]} LIMIT 10;"
+    assert results[1].error == "cannot build the prompt" and not results[1].sql
+    assert empty == []
+    # no tables is not every table of the database
+    assert untabled[0].tables == [] and "CREATE TABLE" not in untabled[0].prompt
+    assert server.requests["chat"] == 3
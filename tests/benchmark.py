@@ -0,0 +1,20 @@
+from nl2sql.benchmark import BenchmarkConfig, run_benchmark
+
+
+def test_benchmark_runs_offline():
+    report = run_benchmark(BenchmarkConfig(
+        tables=5,
+        rows=3,
+        references=20,
+        requests=4,
+        concurrency=[1, 2],
+        latency=0,
+        token_rate=10_000,
+        embedding_latency=0
+    ))
+    assert [x.concurrency for x in report.levels] == [1, 2]
+    for level in report.levels:
+        assert level.errors == 0, level.first_error
+        assert {"metadata", "references", "llm", "total"} <= set(level.stages)
+        assert level.stages["total"].count == 4 and level.coalesced == 0
+    assert report.regressions(report) == []
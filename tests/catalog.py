@@ -0,0 +1,152 @@
+import gc
+
+import sqlalchemy
+
+from nl2sql.tools.database.catalog import MetadataCatalog
+from nl2sql.tools.database.data import SampleStrategy
+from nl2sql.tools.database.metadata import Metadata
+
+
+def _fake_query_many(calls: list):
+    def query_many(conn, tables, schema=None, sample_limit=3, include_ddl=True, sample_strategy=None):
+        calls.append((tuple(tables), include_ddl))
+        return [
+            Metadata(
+                table_name=x,
+                description=f"{x} table" if include_ddl else "",
+                ddl=f"CREATE TABLE {x} ();" if include_ddl else "",
+                samples=[f"({len(calls)},)"]
+            ) for x in tables
+        ]
+
+    return query_many
+
+
+def test_catalog_caches_ddl_and_samples(monkeypatch):
+    calls = []
+    monkeypatch.setattr(Metadata, "query_many", _fake_query_many(calls))
+    catalog = MetadataCatalog()
+    with sqlalchemy.create_engine("sqlite://").connect() as conn:
+        first = catalog.query_many(conn, ["users", "assets"])
+        second = catalog.query_many(conn, ["assets", "users"])
+        assert calls == [(("users", "assets"), True)]
+        assert [x.doc for x in first] == [x.doc for x in reversed(second)]
+
+        catalog.sample_ttl = 0
+        catalog.invalidate("users")
+        catalog.query_many(conn, ["users", "assets"])
+        assert calls[-1] == (("users",), True)
+
+
+def test_catalog_refreshes_expired_samples_only(monkeypatch):
+    calls = []
+    monkeypatch.setattr(Metadata, "query_many", _fake_query_many(calls))
+    catalog = MetadataCatalog(sample_ttl=0)
+    with sqlalchemy.create_engine("sqlite://").connect() as conn:
+        catalog.query_many(conn, ["users"])
+        refreshed = catalog.query_many(conn, ["users"])[0]
+        assert calls == [(("users",), True), (("users",), False)]
+        assert refreshed.ddl == "CREATE TABLE users ();"
+        assert refreshed.samples == ["(2,)"]
+
+
+def test_catalog_evicts_least_recently_used(monkeypatch):
+    calls = []
+    monkeypatch.setattr(Metadata, "query_many", _fake_query_many(calls))
+    catalog = MetadataCatalog(max_entries=2)
+    with sqlalchemy.create_engine("sqlite://").connect() as conn:
+        catalog.query_many(conn, ["a", "b"])
+        catalog.query_many(conn, ["a"])
+        catalog.query_many(conn, ["c"])
+        assert len(catalog) == 2
+        catalog.query_many(conn, ["a"])
+        assert calls[-1] == (("c",), True)
+        catalog.query_many(conn, ["b"])
+        assert calls[-1] == (("b",), True)
+
+
+def test_catalog_refresh_rebuilds_changed_tables_only(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path}/catalog.db")
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.text("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT)"))
+        conn.execute(sqlalchemy.text("CREATE TABLE assets (id INTEGER PRIMARY KEY, owner INTEGER)"))
+    catalog = MetadataCatalog(track_schema=True)
+    with engine.connect() as conn:
+        catalog.query_many(conn, ["users", "assets"], sample_limit=0)
+        assert catalog.refresh(conn) == []
+
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.text("ALTER TABLE users ADD COLUMN email TEXT"))
+        conn.execute(sqlalchemy.text("DROP TABLE assets"))
+    with engine.connect() as conn:
+        assert sorted(catalog.refresh(conn)) == [(None, "assets"), (None, "users")]
+        assert len(catalog) == 1
+        assert "email" in catalog.query_many(conn, ["users"], sample_limit=0)[0].ddl
+        assert catalog.refresh(conn) == []
+    engine.dispose()
+
+
+def test_catalog_keys_samples_by_strategy(monkeypatch):
+    calls = []
+    monkeypatch.setattr(Metadata, "query_many", _fake_query_many(calls))
+    catalog = MetadataCatalog()
+    with sqlalchemy.create_engine("sqlite://").connect() as conn:
+        head = catalog.query_many(conn, ["users"], sample_strategy=SampleStrategy.HEAD)[0]
+        pk_range = catalog.query_many(conn, ["users"], sample_strategy=SampleStrategy.PK_RANGE)[0]
+        assert catalog.query_many(conn, ["users"], sample_strategy=SampleStrategy.HEAD)[0].samples == head.samples
+    assert calls == [(("users",), True), (("users",), False)]
+    assert head.samples != pk_range.samples
+
+
+def test_catalog_refresh_seeds_untracked_fingerprints(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path}/seed.db")
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.text("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT)"))
+    catalog = MetadataCatalog()
+    with engine.connect() as conn:
+        catalog.query_many(conn, ["users"], sample_limit=0)
+        # recorded, not re-described
+        assert catalog.refresh(conn) == []
+        assert not catalog.track_schema
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.text("ALTER TABLE users ADD COLUMN email TEXT"))
+    with engine.connect() as conn:
+        assert catalog.refresh(conn) == [(None, "users")]
+    engine.dispose()
+
+
+def test_catalog_drops_listeners_of_collected_objects(tmp_path):
+    class Listener:
+        def __init__(self):
+            self.changes = []
+
+        def __call__(self, url, changed):
+            self.changes.append(changed)
+
+        def on_change(self, url, changed):
+            self.changes.append(changed)
+
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path}/listeners.db")
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.text("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT)"))
+    catalog = MetadataCatalog()
+    kept, dropped, callable_ = Listener(), Listener(), Listener()
+    catalog.add_listener(kept.on_change)
+    catalog.add_listener(dropped.on_change)
+    catalog.add_listener(callable_)
+    with engine.connect() as conn:
+        catalog.query_many(conn, ["users"], sample_limit=0)
+        catalog.refresh(conn)
+    del dropped
+    gc.collect()
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.text("ALTER TABLE users ADD COLUMN email TEXT"))
+    with engine.connect() as conn:
+        assert catalog.refresh(conn) == [(None, "users")]
+    engine.dispose()
+    assert kept.changes == [[(None, "users")]] and callable_.changes == [[(None, "users")]]
+    assert len(catalog._listeners) == 2
+
+    catalog.remove_listener(kept.on_change)
+    catalog.remove_listener(callable_)
+    assert catalog._listeners == []
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+import sqlalchemy
+
+from nl2sql.benchmark import FakeOpenAIServer, create_synthetic_schema
+from nl2sql.tools.text2sql.assembly import Text2SQLAssembly
+
+
+def _assembly(tmp_path, server: FakeOpenAIServer) -> tuple[Text2SQLAssembly, list[str]]:
+    db_uri = f"sqlite:///{tmp_path}/coalesce.db"
+    engine = sqlalchemy.create_engine(db_uri)
+    names = create_synthetic_schema(engine, tables=2, rows=3)
+    engine.dispose()
+    return Text2SQLAssembly(
+        db_uri=db_uri,
+        openai_baseurl=server.base_url,
+        openai_apikey="coalesce",
+        llm_model="fake-llm"
+    ), names
+
+
+def test_identical_generations_are_coalesced(tmp_path):
+    with FakeOpenAIServer(latency=0.2, token_rate=10_000) as server:
+        text2sql, names = _assembly(tmp_path, server)
+
+        async def generate():
+            return await asyncio.gather(
+                *[text2sql.generate("list the customers", names) for _ in range(10)],
+                text2sql.generate("list the orders", names)
+            )
+
+        results = asyncio.run(generate())
+        text2sql.close()
+    assert server.requests["chat"] == 2 and text2sql.coalesced_requests == 9
+    assert len({x.sql for x in results[:10]}) == 1
+    assert len({id(x) for x in results}) == 11
+
+
+def test_cancelled_waiters_do_not_cancel_the_others(tmp_path):
+    with FakeOpenAIServer(latency=0.3, token_rate=10_000) as server:
+        text2sql, names = _assembly(tmp_path, server)
+
+        async def generate():
+            dropped = asyncio.ensure_future(text2sql.generate("list the customers", names))
+            kept = asyncio.ensure_future(text2sql.generate("list the customers", names))
+            await asyncio.sleep(0.1)
+            dropped.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await dropped
+            result = await kept
+
+            abandoned = asyncio.ensure_future(text2sql.generate("list the orders", names))
+            await asyncio.sleep(0.1)
+            flight = next(iter(text2sql._flights.values()))
+            abandoned.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await abandoned
+            await asyncio.sleep(0)
+            return result, flight
+
+        result, flight = asyncio.run(generate())
+        text2sql.close()
+    assert result.sql
+    assert flight.task.cancelled()
+    assert not text2sql._flights
@@ -1,4 +1,5 @@
 import json
+from typing import Optional
 from pydantic import BaseModel
 
 
@@ -45,4 +46,17 @@ class Config(BaseModel):
     llm_model: str
 
 
-context = Config(**json.load(open("test.json")))
+class _Context:
+    """
+    The live services configuration, read from test.json on first use so that the offline tests run without it.
+    """
+    _config: Optional[Config] = None
+
+    def __getattr__(self, name: str):
+        if _Context._config is None:
+            with open("test.json") as f:
+                _Context._config = Config(**json.load(f))
+        return getattr(_Context._config, name)
+
+
+context = _Context()
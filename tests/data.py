@@ -0,0 +1,130 @@
+import pytest
+import records
+import sqlalchemy
+
+from nl2sql.tools.database import data
+from nl2sql.tools.database.data import (
+    TRUNCATED_KEY,
+    CostAction,
+    CostGuard,
+    SampleStrategy,
+    choose_sample_strategy,
+    execute_sql,
+    find_ambiguous_entities,
+    sample_table
+)
+
+
+def test_execute_sql_on_pooled_connection():
+    with sqlalchemy.create_engine("sqlite://").connect() as conn:
+        conn.execute(sqlalchemy.text("CREATE TABLE users (id INTEGER, name TEXT)"))
+        conn.execute(sqlalchemy.text("INSERT INTO users VALUES (1, 'alice'), (2, 'Alina'), (3, 'bob')"))
+        assert execute_sql(conn, "SELECT id FROM users ORDER BY id", "json") == [{"id": 1}, {"id": 2}, {"id": 3}]
+        assert "alice" in execute_sql(conn, "SELECT name FROM users")
+
+        found = find_ambiguous_entities(conn, "ali", "users", ["name"], ["id"])
+        assert found.is_ambiguous and found.results == [{"id": 1}, {"id": 2}]
+        found = find_ambiguous_entities(conn, "x' OR '1'='1", "users", ["name"])
+        assert found.error is None and found.results == []
+
+
+def test_execute_sql_truncates_large_results():
+    with sqlalchemy.create_engine("sqlite://").connect() as conn:
+        conn.execute(sqlalchemy.text("CREATE TABLE facts (id INTEGER, value TEXT)"))
+        conn.execute(
+            sqlalchemy.text("INSERT INTO facts VALUES (:id, :value)"),
+            [{"id": i, "value": "x" * 10} for i in range(2000)]
+        )
+        rows = execute_sql(conn, "SELECT id FROM facts ORDER BY id", "json", max_rows=10)
+        assert rows[:-1] == [{"id": i} for i in range(10)] and rows[-1] == {TRUNCATED_KEY: "more than 10 rows"}
+
+        columnar = execute_sql(conn, "SELECT * FROM facts ORDER BY id", "columnar", max_bytes=120)
+        assert columnar["columns"] == ["id", "value"] and columnar["values"][0] == list(range(10))
+        assert columnar["truncated"] == "more than 120 bytes"
+        assert execute_sql(conn, "SELECT * FROM facts", "markdown", max_rows=3).endswith("truncated, more than 3 rows")
+        assert execute_sql(conn, "SELECT count(*) AS n FROM facts", "columnar", max_rows=1)["truncated"] is None
+
+
+def test_cost_guard_limits_or_rejects(monkeypatch):
+    estimates = {"SELECT * FROM facts": (50_000.0, 2_000_000.0), "SELECT * FROM facts, users": (9e9, 2e9)}
+
+    def explain_cost(conn, sql):
+        if sql.startswith("SELECT * FROM (\n"):
+            return 10.0, 10.0
+        return estimates[sql]
+
+    monkeypatch.setattr(data, "explain_cost", explain_cost)
+    guard = CostGuard(max_cost=1_000_000, max_rows=100_000, limit=10)
+    with sqlalchemy.create_engine("sqlite://").connect() as conn:
+        verdict = guard.check(conn, "SELECT * FROM facts;")
+        assert verdict.action == CostAction.LIMIT and verdict.sql.endswith("LIMIT 10") and verdict.rows == 2_000_000
+        assert guard.check(conn, "SELECT * FROM facts, users").action == CostAction.LIMIT
+
+        guard.limit = None
+        verdict = guard.check(conn, "SELECT * FROM facts, users")
+        assert not verdict.allowed and verdict.reason.startswith("Estimated cost")
+        assert not guard.check(conn, "SELECT * FROM facts; DROP TABLE facts").allowed
+        # a trailing comment is not another statement
+        assert guard.check(conn, "SELECT * FROM facts; -- note\n").sql == "SELECT * FROM facts"
+        assert guard.check(conn, "SELECT * FROM facts; /* a */ -- b").sql == "SELECT * FROM facts"
+
+
+def test_choose_sample_strategy():
+    assert choose_sample_strategy("sqlite", None, "id") == SampleStrategy.PK_RANGE
+    assert choose_sample_strategy("sqlite", None) == SampleStrategy.HEAD
+    assert choose_sample_strategy("postgresql", 500) == SampleStrategy.RANDOM
+    assert choose_sample_strategy("postgresql", 50_000) == SampleStrategy.BERNOULLI
+    assert choose_sample_strategy("postgresql", 5e7, "id") == SampleStrategy.SYSTEM
+    assert choose_sample_strategy("mysql", 5e7, "id") == SampleStrategy.PK_RANGE
+    assert choose_sample_strategy("mysql", 5e7) == SampleStrategy.HEAD
+
+
+def test_sample_table_strategies(monkeypatch):
+    with sqlalchemy.create_engine("sqlite://").connect() as conn:
+        conn.execute(sqlalchemy.text("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)"))
+        conn.execute(sqlalchemy.text("INSERT INTO items VALUES (:id, :name)"), [
+            {"id": i, "name": f"item {i}"} for i in range(1, 11)
+        ])
+        items = sqlalchemy.table("items", sqlalchemy.column("id"), sqlalchemy.column("name"))
+        assert [x.id for x in sample_table(conn, items, 3, SampleStrategy.HEAD)] == [1, 2, 3]
+        assert len(sample_table(conn, items, 3, SampleStrategy.RANDOM)) == 3
+        assert len(sample_table(conn, items, 3, SampleStrategy.BERNOULLI, rows=10)) == 3
+        # without a primary key PK_RANGE reads the head
+        assert [x.id for x in sample_table(conn, items, 2, SampleStrategy.PK_RANGE)] == [1, 2]
+        # AUTO without row estimates on sqlite picks PK_RANGE
+        assert len(sample_table(conn, items, 3, SampleStrategy.AUTO, pk_column="id")) == 3
+
+        monkeypatch.setattr(data.random, "randint", lambda low, high: 5)
+        assert [x.id for x in sample_table(conn, items, 3, SampleStrategy.PK_RANGE, pk_column="id")] == [5, 6, 7]
+        # the range wraps around to the lowest keys
+        monkeypatch.setattr(data.random, "randint", lambda low, high: 9)
+        assert [x.id for x in sample_table(conn, items, 4, SampleStrategy.PK_RANGE, pk_column="id")] == [9, 10, 1, 2]
+        conn.execute(sqlalchemy.text("DELETE FROM items"))
+        assert sample_table(conn, items, 3, SampleStrategy.PK_RANGE, pk_column="id") == []
+
+
+def test_execute_sql_sees_queries_behind_comments():
+    assert data._is_query("-- top customers\n/* generated */ SELECT 1")
+    assert data._is_query("  (WITH x AS (SELECT 1) SELECT * FROM x)")
+    assert not data._is_query("-- cleanup\nDELETE FROM users")
+
+
+def test_execute_sql_reports_the_query_error_over_the_timeout_reset(monkeypatch):
+    def set_statement_timeout(conn, timeout):
+        def reset():
+            raise RuntimeError("current transaction is aborted")
+
+        return reset
+
+    monkeypatch.setattr(data, "_set_statement_timeout", set_statement_timeout)
+    with sqlalchemy.create_engine("sqlite://").connect() as conn:
+        with pytest.raises(sqlalchemy.exc.OperationalError):
+            execute_sql(conn, "SELECT * FROM missing", timeout=1)
+        with pytest.raises(RuntimeError):
+            execute_sql(conn, "SELECT 1", timeout=1)
+
+
+def test_execute_sql_on_records_database():
+    db = records.Database("sqlite://")
+    assert execute_sql(db, "-- one\nSELECT 1 AS n", "json") == [{"n": 1}]
+    db.close()
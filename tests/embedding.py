@@ -0,0 +1,69 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from nl2sql.tools.database.embedding import EmbeddingCache
+
+
+class _FakeEmbeddings:
+    def __init__(self):
+        self.calls = []
+
+    async def create(self, input, model):
+        self.calls.append((input, model))
+        inputs = [input] if isinstance(input, str) else input
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=i, embedding=[float(len(x)), 0.5]) for i, x in enumerate(inputs)
+        ])
+
+
+def test_embedding_cache_memory_tier():
+    service = SimpleNamespace(embeddings=_FakeEmbeddings())
+    cache = EmbeddingCache(max_entries=1)
+    first = asyncio.run(cache.embed(service, "bge-m3", "公司的设备清单"))
+    second = asyncio.run(cache.embed(service, "bge-m3", "  公司的设备清单 "))
+    assert first == second
+    assert len(service.embeddings.calls) == 1
+    asyncio.run(cache.embed(service, "other-model", "公司的设备清单"))
+    assert len(service.embeddings.calls) == 2
+    assert cache.stats.hits == 1 and cache.stats.misses == 2
+
+
+def test_embedding_cache_persistent_tier(tmp_path):
+    service = SimpleNamespace(embeddings=_FakeEmbeddings())
+    path = str(tmp_path / "embeddings.sqlite3")
+    cache = EmbeddingCache(path=path)
+    embedding = asyncio.run(cache.embed(service, "bge-m3", "all users"))
+    cache.close()
+
+    restarted = EmbeddingCache(path=path)
+    assert asyncio.run(restarted.embed(service, "bge-m3", "all users")) == embedding
+    assert len(service.embeddings.calls) == 1
+    assert restarted.stats.persistent_hits == 1
+    restarted.close()
+
+
+def test_embedding_cache_embeds_misses_in_one_batch():
+    service = SimpleNamespace(embeddings=_FakeEmbeddings())
+    cache = EmbeddingCache()
+    asyncio.run(cache.embed(service, "bge-m3", "b"))
+    embeddings = asyncio.run(cache.embed_many(service, "bge-m3", ["a", "b", "ccc", "a"]))
+    assert service.embeddings.calls[-1] == (["a", "ccc"], "bge-m3")
+    assert [x[0] for x in embeddings] == [1.0, 1.0, 3.0, 1.0]
+
+
+def test_embedding_cache_persistent_tier_off_the_event_loop(tmp_path):
+    service = SimpleNamespace(embeddings=_FakeEmbeddings())
+    cache = EmbeddingCache(path=str(tmp_path / "embeddings.sqlite3"))
+    statements = []
+    cache._db.set_trace_callback(lambda x: statements.append((x.split()[0], threading.current_thread())))
+
+    async def embed():
+        return await cache.embed_many(service, "bge-m3", ["a", "bb", "ccc"]), threading.current_thread()
+
+    embeddings, loop_thread = asyncio.run(embed())
+    cache.close()
+    assert [x[0] for x in embeddings] == [1.0, 2.0, 3.0]
+    # one lookup and one commit for the whole batch, none on the event loop's thread
+    assert [x for x, _ in statements].count("SELECT") == 1 and [x for x, _ in statements].count("COMMIT") == 1
+    assert all(thread is not loop_thread for _, thread in statements)
@@ -0,0 +1,58 @@
+import sqlalchemy
+
+from nl2sql.tools.database.entity import EntityIndex, EntityColumn
+
+
+def _users(conn):
+    conn.execute(sqlalchemy.text("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, email TEXT)"))
+    conn.execute(
+        sqlalchemy.text("INSERT INTO users VALUES (:id, :name, :email)"),
+        [{"id": i, "name": f"user{i}", "email": f"u{i}@example.com"} for i in range(1, 31)]
+    )
+
+
+def test_entity_index_matches_like_semantics():
+    index = EntityIndex(columns=[EntityColumn(table="users", column="name"), EntityColumn(table="users", column="email")])
+    with sqlalchemy.create_engine("sqlite://").connect() as conn:
+        _users(conn)
+        assert not index.covers("users", ["name"])
+        assert index.refresh(conn) == 60
+        assert index.covers("users", ["name", "email"])
+        assert sorted(index.match("USER2", "users", "name")) == ["user2"] + [f"user{i}" for i in range(20, 30)]
+        assert sorted(index.match("r3", "users", "name")) == ["user3", "user30"]
+        assert index.match("%", "users", "name") == []
+
+        found = index.find(conn, "u7@", "users", ["name", "email"], ["id"])
+        assert not found.is_ambiguous and found.results == [{"id": 7}]
+        found = index.find(conn, "user1", "users", ["name"], ["id"])
+        assert found.is_ambiguous and len(found.results) == 11
+        assert index.find(conn, "nobody", "users", ["name"]).results == []
+
+
+def test_entity_index_refreshes_incrementally():
+    index = EntityIndex(columns=[EntityColumn(table="users", column="name", watermark="id")])
+    with sqlalchemy.create_engine("sqlite://").connect() as conn:
+        _users(conn)
+        index.refresh(conn)
+        conn.execute(sqlalchemy.text("INSERT INTO users VALUES (31, 'newcomer', 'n@example.com')"))
+        conn.execute(sqlalchemy.text("DELETE FROM users WHERE id = 1"))
+        assert index.refresh(conn) == 1
+        assert index.match("newcomer", "users", "name") == ["newcomer"]
+        assert "user1" in index.match("user1", "users", "name")
+        assert index.refresh(conn, full=True) == 1
+        assert "user1" not in index.match("user1", "users", "name")
+
+
+def test_entity_index_bounds_short_and_frequent_keywords():
+    index = EntityIndex(columns=[EntityColumn(table="users", column="name")], max_matches=5)
+    with sqlalchemy.create_engine("sqlite://").connect() as conn:
+        _users(conn)
+        conn.execute(sqlalchemy.text("INSERT INTO users VALUES (31, 'Al', 'al@example.com')"))
+        index.refresh(conn)
+        # shorter than the n-grams, matched through the grams starting with the keyword
+        assert index.match("al", "users", "name") == ["Al"]
+        assert sorted(index.match("9", "users", "name")) == ["user19", "user29", "user9"]
+        assert len(index.match("u", "users", "name")) == 5
+        assert len(index.match("user", "users", "name")) == 5
+        found = index.find(conn, "user", "users", ["name"], ["id"])
+        assert found.is_ambiguous and len(found.results) == 5
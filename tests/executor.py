@@ -0,0 +1,48 @@
+import time
+import asyncio
+
+import sqlalchemy
+
+from nl2sql.benchmark import FakeOpenAIServer, create_synthetic_schema
+from nl2sql.tools.text2sql.assembly import Text2SQLAssembly
+
+_DELAY = 0.4
+
+
+class _SlowLookupsAssembly(Text2SQLAssembly):
+    def query_tables_metadata(self, *args, **kwargs):
+        # a blocking database round trip, run in the shared executor
+        _SlowLookupsAssembly.calls.append("metadata")
+        time.sleep(_DELAY)
+        return super().query_tables_metadata(*args, **kwargs)
+
+    async def query_similar_questions(self, *args, **kwargs):
+        _SlowLookupsAssembly.calls.append("references")
+        await asyncio.sleep(_DELAY)
+        return await super().query_similar_questions(*args, **kwargs)
+
+
+def test_generate_overlaps_metadata_and_reference_lookups(tmp_path):
+    db_uri = f"sqlite:///{tmp_path}/overlap.db"
+    engine = sqlalchemy.create_engine(db_uri)
+    names = create_synthetic_schema(engine, tables=2, rows=3)
+    engine.dispose()
+    _SlowLookupsAssembly.calls = []
+    with FakeOpenAIServer(latency=0, token_rate=100_000) as server:
+        text2sql = _SlowLookupsAssembly(
+            db_uri=db_uri,
+            openai_baseurl=server.base_url,
+            openai_apikey="overlap",
+            llm_model="fake-llm"
+        )
+
+        async def generate():
+            start = time.perf_counter()
+            result = await text2sql.generate("list the customers", names)
+            return result, time.perf_counter() - start
+
+        result, elapsed = asyncio.run(generate())
+        text2sql.close()
+    assert result.sql and sorted(_SlowLookupsAssembly.calls) == ["metadata", "references"]
+    # the slower of the two lookups, not their sum
+    assert _DELAY <= elapsed < 2 * _DELAY
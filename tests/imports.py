@@ -0,0 +1,26 @@
+import os
+import sys
+import json
+import subprocess
+
+HEAVY_PACKAGES = ["agents", "langchain_core", "langchain_openai", "langchain_ollama"]
+
+
+def _imported_packages(statement: str) -> list[str]:
+    script = (
+        f"import sys, json\n{statement}\n"
+        f"print(json.dumps(sorted({{x.split('.')[0] for x in sys.modules}} & set({HEAVY_PACKAGES!r}))))"
+    )
+    # a fresh interpreter, the test process has already imported everything
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+    output = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def test_assembly_import_skips_langchain_and_agents():
+    assert _imported_packages("from nl2sql.tools.text2sql import Text2SQLAssembly") == []
+    assert _imported_packages("import nl2sql.tools.text2sql") == []
+
+
+def test_lazy_exports_still_resolve():
+    assert _imported_packages("from nl2sql.tools.text2sql import Text2SQLAgent") == ["agents"]
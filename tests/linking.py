@@ -0,0 +1,87 @@
+import asyncio
+
+import sqlalchemy
+
+from nl2sql.benchmark import FakeOpenAIServer
+from nl2sql.tools.database.catalog import MetadataCatalog
+from nl2sql.tools.database.embedding import EmbeddingCache
+from nl2sql.tools.database.linking import SchemaIndex
+from nl2sql.tools.database.metadata import Metadata
+from nl2sql.tools.text2sql.assembly import Text2SQLAssembly
+
+_VOCABULARY = ["user", "asset", "project"]
+
+
+async def _embed(docs: list[str]) -> list[list[float]]:
+    _embed.calls.append(docs)
+    return [[float(x.count(word)) for word in _VOCABULARY] for x in docs]
+
+
+def _metadata(name: str, description: str) -> Metadata:
+    return Metadata(table_name=name, description=description, ddl=f"CREATE TABLE {name} ();", samples=[])
+
+
+def test_schema_index_links_and_refreshes_incrementally(tmp_path):
+    _embed.calls = []
+    path = str(tmp_path / "schema.npz")
+    index = SchemaIndex(path=path, top_k=1)
+    tables = [_metadata("users", "user accounts"), _metadata("assets", "asset inventory")]
+    assert asyncio.run(index.update("db", tables, _embed)) == 2
+    assert index.search([0.0, 1.0, 0.0]) == [("assets", 1.0)]
+
+    tables.append(_metadata("projects", "project list"))
+    assert asyncio.run(index.update("db", tables, _embed)) == 1
+    assert len(_embed.calls[-1]) == 1
+
+    restored = SchemaIndex(path=path)
+    assert restored.is_built_for("db")
+    assert [x for x, _ in restored.search([0.0, 0.0, 1.0], 2)][0] == "projects"
+    assert not restored.is_built_for("other")
+
+
+def test_schema_index_follows_schema_changes(tmp_path, monkeypatch):
+    db_uri = f"sqlite:///{tmp_path}/linking.db"
+    engine = sqlalchemy.create_engine(db_uri)
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.text("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT)"))
+        conn.execute(sqlalchemy.text("CREATE TABLE assets (id INTEGER PRIMARY KEY, owner INTEGER)"))
+    updates = []
+    update = SchemaIndex.update
+
+    async def counted_update(self, *args, **kwargs):
+        updates.append(kwargs.get("partial", False))
+        return await update(self, *args, **kwargs)
+
+    monkeypatch.setattr(SchemaIndex, "update", counted_update)
+    with FakeOpenAIServer() as server:
+        index = SchemaIndex()
+        text2sql = Text2SQLAssembly(
+            db_uri=db_uri,
+            openai_baseurl=server.base_url,
+            openai_apikey="linking",
+            llm_model="fake-llm",
+            embedding_model="fake-embedding",
+            metadata_catalog=MetadataCatalog(),
+            embedding_cache=EmbeddingCache(),
+            schema_index=index
+        )
+
+        async def link():
+            return await asyncio.gather(*[text2sql.link_tables(f"question {i}") for i in range(3)])
+
+        # concurrent first calls share one build
+        asyncio.run(link())
+        assert updates == [False]
+        assert sorted(index.tables) == ["assets", "users"]
+
+        text2sql.query_tables_metadata(["users", "assets"], sample_limit=0)
+        with engine.begin() as conn:
+            conn.execute(sqlalchemy.text("DROP TABLE assets"))
+        assert text2sql.refresh_tables_metadata() == [(None, "assets")]
+        assert index.tables == ["users"] and not index.is_built_for(text2sql._schema_index_key())
+
+        asyncio.run(link())
+        text2sql.close()
+    engine.dispose()
+    assert updates == [False, True]
+    assert index.tables == ["users"] and index.is_built_for(text2sql._schema_index_key())
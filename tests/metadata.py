@@ -0,0 +1,59 @@
+import sqlalchemy
+import sqlalchemy.dialects.mysql
+
+from nl2sql.benchmark import create_synthetic_schema
+from nl2sql.tools.database.data import SampleStrategy
+from nl2sql.tools.database.metadata import (
+    Metadata,
+    _build_ddl_string,
+    _mysql_columns,
+    _mysql_keys
+)
+
+
+def test_mysql_information_schema_rows_build_the_ddl():
+    columns = _mysql_columns(sqlalchemy.dialects.mysql.dialect(), [
+        ("orders", "id", "int", "int unsigned", "NO", None, "auto_increment", ""),
+        ("orders", "status", "enum", "enum('New','Paid')", "NO", "New", "", "order status"),
+        ("orders", "created", "datetime", "datetime", "YES", "CURRENT_TIMESTAMP", "DEFAULT_GENERATED", ""),
+        ("orders", "user_id", "int", "int", "YES", None, "", "")
+    ])
+    pks, fks = _mysql_keys([
+        ("orders", "PRIMARY", "id", None, None),
+        ("orders", "orders_ibfk_1", "user_id", "users", "id")
+    ])
+    assert isinstance(columns["orders"][0]["type"], sqlalchemy.Integer)
+    assert _build_ddl_string("orders", columns["orders"], pks["orders"], fks["orders"], {"status": "order status"}) == (
+        "CREATE TABLE orders (\n"
+        "    id INT UNSIGNED NOT NULL,\n"
+        "    status ENUM('New','Paid') DEFAULT 'New' NOT NULL, -- order status\n"
+        "    created DATETIME DEFAULT CURRENT_TIMESTAMP,\n"
+        "    user_id INT,\n"
+        "    PRIMARY KEY (id),\n"
+        "    FOREIGN KEY (user_id) REFERENCES users (id)\n"
+        ");"
+    )
+
+
+def test_query_many_matches_per_table_queries(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path}/metadata.db")
+    names = create_synthetic_schema(engine, tables=3, columns=6, rows=5)
+    with engine.connect() as conn:
+        described = Metadata.query_many(
+            conn, [names[2], "missing", names[0]], sample_limit=2, sample_strategy=SampleStrategy.HEAD
+        )
+        single = [Metadata.query(conn, x, sample_limit=2, sample_strategy=SampleStrategy.HEAD) for x in names]
+        inspector = sqlalchemy.inspect(conn)
+        # the set-based catalog queries describe what the table by table reflection does
+        reflected = [
+            _build_ddl_string(
+                x, inspector.get_columns(x), inspector.get_pk_constraint(x), inspector.get_foreign_keys(x), {}
+            ) for x in names
+        ]
+    engine.dispose()
+    assert [x.table_name for x in described] == [names[2], "missing", names[0]]
+    assert described[1].error and described[1].ddl == "" and described[1].samples == []
+    assert described[0].doc == single[2].doc and described[2].doc == single[0].doc
+    assert [x.ddl for x in single] == reflected
+    assert f"    FOREIGN KEY (parent_id) REFERENCES {names[1]} (id)" in described[0].ddl
+    assert len(described[0].samples) == 2 and len(described[2].samples) == 2
@@ -0,0 +1,127 @@
+import asyncio
+
+import sqlalchemy
+
+from nl2sql.benchmark import FakeOpenAIServer, create_synthetic_schema
+from nl2sql.tools.database.metadata import Metadata
+from nl2sql.tools.text2sql.assembly import Text2SQLAssembly
+from nl2sql.tools.text2sql.prompt import PromptLayout, compact_tables_metadata, estimate_tokens, shared_prefix_length
+
+_DDL = """CREATE TABLE assets (
+    id INTEGER NOT NULL,
+    owner_id INTEGER, -- owner of the asset
+    asset_type VARCHAR(20), -- kind of asset
+    price NUMERIC, -- purchase price
+    PRIMARY KEY (id),
+    FOREIGN KEY (owner_id) REFERENCES users (id)
+);"""
+
+
+def test_compact_tables_metadata_trims_in_order():
+    assets = Metadata(table_name="assets", description="", ddl=_DDL, samples=["(1, 1, 'pc', 100)"] * 3)
+    full = estimate_tokens(assets.doc)
+
+    unsampled = compact_tables_metadata([assets], full - 1)[0]
+    assert not unsampled.samples and "-- kind of asset" in unsampled.ddl
+
+    uncommented = compact_tables_metadata([assets], estimate_tokens(unsampled.doc) - 1)[0]
+    assert "--" not in uncommented.ddl and "asset_type" in uncommented.ddl
+
+    minimal = compact_tables_metadata([assets], 0, columns=["assets.price"])[0]
+    assert "asset_type" not in minimal.ddl
+    assert all(x in minimal.ddl for x in ("id INTEGER", "owner_id", "price", "FOREIGN KEY"))
+
+
+def test_estimate_tokens_counts_cjk_characters():
+    assert estimate_tokens("公司的设备清单") == 7
+    assert estimate_tokens("select") == 2
+
+
+def test_shared_prefix_length():
+    assert shared_prefix_length(b"CREATE TABLE a", b"CREATE TABLE b") == 13
+    assert shared_prefix_length(b"abc", b"abc") == 3
+    assert shared_prefix_length(b"", b"abc") == 0
+
+
+def test_prefix_cache_layout_keeps_the_system_prompt_stable(tmp_path):
+    db_uri = f"sqlite:///{tmp_path}/prompt.db"
+    engine = sqlalchemy.create_engine(db_uri)
+    names = create_synthetic_schema(engine, tables=3, rows=3)
+    engine.dispose()
+    with FakeOpenAIServer(latency=0.01, token_rate=10_000) as server:
+        results = {}
+        for layout in PromptLayout:
+            text2sql = Text2SQLAssembly(
+                db_uri=db_uri,
+                openai_baseurl=server.base_url,
+                openai_apikey="prompt",
+                llm_model="fake-llm",
+                prompt_layout=layout
+            )
+
+            async def generate():
+                return [
+                    await text2sql.generate("list the customers", names, columns=["name"]),
+                    await text2sql.generate("total amount", names[::-1], expressions=["status = 'active'"])
+                ]
+
+            results[layout] = asyncio.run(generate())
+            text2sql.close()
+    first, second = results[PromptLayout.PREFIX_CACHE]
+    assert first.reused_prefix_bytes == 0
+    assert second.prompt == first.prompt and second.reused_prefix_bytes == len(first.prompt.encode())
+    assert "# Required Columns" not in first.prompt and "-- Example Values" not in first.prompt and first.sql
+    first, second = results[PromptLayout.TEMPLATE]
+    assert first.reused_prefix_bytes is None and second.reused_prefix_bytes is None
+
+
+def test_prompt_prefix_of_an_earlier_prompt(tmp_path):
+    db_uri = f"sqlite:///{tmp_path}/prefix.db"
+    engine = sqlalchemy.create_engine(db_uri)
+    names = create_synthetic_schema(engine, tables=1, rows=3)
+    engine.dispose()
+    for layout in PromptLayout:
+        text2sql = Text2SQLAssembly(
+            db_uri=db_uri,
+            openai_baseurl="http://127.0.0.1:9/v1",
+            openai_apikey="prefix",
+            llm_model="fake-llm",
+            prompt_layout=layout
+        )
+        tables_metadata = text2sql.query_tables_metadata(names)
+        text2sql._build_prompt("q", tables_metadata, references={"similar": "SELECT 1;"})
+        text2sql._build_prompt("q", tables_metadata)
+        text2sql.close()
+    # the template ends with the references, a prompt without them is a strict prefix of one with them
+    assert text2sql._reuse_prefix("abc") == 0
+    assert text2sql._reuse_prefix("abcdef") == 3
+    assert text2sql._reuse_prefix("abc") == 3
+
+
+def test_generate_compacts_the_prompt_to_the_token_budget(tmp_path):
+    db_uri = f"sqlite:///{tmp_path}/budget.db"
+    engine = sqlalchemy.create_engine(db_uri)
+    names = create_synthetic_schema(engine, tables=3, columns=12, rows=3)
+    engine.dispose()
+    with FakeOpenAIServer(latency=0.01, token_rate=10_000) as server:
+        text2sql = Text2SQLAssembly(
+            db_uri=db_uri,
+            openai_baseurl=server.base_url,
+            openai_apikey="budget",
+            llm_model="fake-llm"
+        )
+
+        async def generate():
+            return [
+                await text2sql.generate("total amount", names, columns=[f"{names[0]}.amount"]),
+                await text2sql.generate("total amount", names, columns=[f"{names[0]}.amount"], token_budget=560)
+            ]
+
+        full, compact = asyncio.run(generate())
+        text2sql.close()
+    assert "-- Example Values" in full.prompt and "attr_5" in full.prompt
+    assert "-- Example Values" not in compact.prompt and "attr_5" not in compact.prompt
+    assert f"{names[0]}.amount" in compact.prompt and "amount" in compact.prompt.split("CREATE TABLE")[1]
+    assert compact.prompt_tokens["total"] <= 560 < full.prompt_tokens["total"]
+    assert compact.prompt_tokens["db_ctxt"] < full.prompt_tokens["db_ctxt"]
+    assert compact.sql
@@ -0,0 +1,86 @@
+import json
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from nl2sql.benchmark import FakeOpenAIServer
+from nl2sql.tools.database.references import ReferenceStore, LocalReferenceStore
+from nl2sql.tools.text2sql.assembly import Text2SQLAssembly
+from nl2sql.utils.tracing import start_trace
+from nl2sql.tools.database.vector import query_sql_references_by_similar_questions
+
+_ENTRIES = [
+    {"query": "all users", "sql": "SELECT * FROM users", "tags": [], "vector": [1.0, 0.0, 0.0]},
+    {"query": "user count", "sql": "SELECT count(*) FROM users", "tags": ["hr"], "vector": [0.9, 0.1, 0.0]},
+    {"query": "all assets", "sql": "SELECT * FROM assets", "tags": ["it"], "vector": [0.0, 1.0, 0.0]},
+    {"query": "asset count", "sql": "SELECT count(*) FROM assets", "tags": ["it", "finance"], "vector": [0.0, 0.9, 0.1]},
+]
+
+
+def test_local_reference_store_search_and_tags(tmp_path):
+    store = LocalReferenceStore.build(str(tmp_path / "refs"), _ENTRIES)
+    searched = asyncio.run(store.search([[1.0, 0.0, 0.0], [0.0, 2.0, 0.0]], limit=2))
+    assert list(searched[0]) == ["all users", "user count"]
+    assert list(searched[1]) == ["all assets", "asset count"]
+
+    # entries without tags match any tags, like the Milvus filter
+    searched = asyncio.run(store.search([[0.0, 1.0, 0.0]], limit=4, tags=["finance"]))
+    assert list(searched[0]) == ["asset count", "all users"]
+
+    reloaded = LocalReferenceStore(path=str(tmp_path / "refs"))
+    assert len(reloaded) == 4
+    assert asyncio.run(reloaded.search([[0.0, 0.0, 1.0]], limit=1)) == [{"asset count": "SELECT count(*) FROM assets"}]
+
+
+def test_local_reference_store_from_milvus_export(tmp_path):
+    export = tmp_path / "export.json"
+    export.write_text("\n".join(json.dumps({**x, "embedding": x.pop("vector")}) for x in map(dict, _ENTRIES)))
+    store = LocalReferenceStore.from_milvus_export(str(tmp_path / "refs"), str(export), vector_field="embedding")
+
+    async def create(input, model):
+        return SimpleNamespace(data=[SimpleNamespace(index=0, embedding=[0.0, 1.0, 0.0])])
+
+    service = SimpleNamespace(embeddings=SimpleNamespace(create=create))
+    references = asyncio.run(query_sql_references_by_similar_questions(
+        ["assets"], None, None, service, "bge-m3", limit=1, reference_store=store
+    ))
+    assert references == [{"all assets": "SELECT * FROM assets"}]
+
+
+class _SlowReferenceStore(ReferenceStore):
+    delay: float
+
+    async def search(self, embeddings, limit=3, tags=None):
+        await asyncio.sleep(self.delay)
+        return [{"all users": "SELECT * FROM users"} for _ in embeddings]
+
+
+def test_reference_timeout_falls_back_to_no_references(tmp_path):
+    with FakeOpenAIServer(embedding_latency=0) as server:
+        text2sql = Text2SQLAssembly(
+            db_uri=f"sqlite:///{tmp_path}/references.db",
+            openai_baseurl=server.base_url,
+            openai_apikey="references",
+            llm_model="fake-llm",
+            embedding_model="fake-embedding",
+            reference_store=_SlowReferenceStore(delay=5),
+            reference_timeout=0.2
+        )
+        spans = []
+
+        async def search():
+            with start_trace([spans.append]):
+                return await text2sql.query_similar_questions_many(["all users", "all assets"])
+
+        assert asyncio.run(search()) == [{}, {}]
+        assert [x.attributes.get("timed_out") for x in spans if x.name == "query_similar_questions"] == [True]
+
+        text2sql.reference_store = _SlowReferenceStore(delay=0)
+        assert asyncio.run(text2sql.query_similar_questions("all users")) == {"all users": "SELECT * FROM users"}
+
+        text2sql.reference_store = _SlowReferenceStore(delay=5)
+        text2sql.reference_fallback = False
+        with pytest.raises(TimeoutError):
+            asyncio.run(text2sql.query_similar_questions("all users"))
+        text2sql.close()
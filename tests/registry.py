@@ -0,0 +1,85 @@
+import threading
+
+import pytest
+
+from nl2sql.tools.text2sql.assembly import Text2SQLAssembly
+from nl2sql.utils.registry import ResourceRegistry
+
+
+def test_registry_shares_and_releases_by_reference():
+    closed = []
+    registry = ResourceRegistry()
+    first = registry.acquire(("client", "a"), lambda: object(), closed.append)
+    second = registry.acquire(("client", "a"), lambda: object(), closed.append)
+    assert first is second and len(registry) == 1
+    registry.release(first)
+    assert closed == []
+    registry.release(second)
+    assert closed == [first] and len(registry) == 0
+
+
+def test_assemblies_share_clients_of_a_registry(tmp_path):
+    registry = ResourceRegistry()
+    options = dict(
+        db_uri=f"sqlite:///{tmp_path}/registry.db",
+        openai_baseurl="http://127.0.0.1:9/v1",
+        openai_apikey="registry",
+        llm_model="fake-llm",
+        registry=registry
+    )
+    with Text2SQLAssembly(**options) as first, Text2SQLAssembly(**options) as second:
+        assert first.sqlalchemy_engine is second.sqlalchemy_engine
+        assert len(registry) == 2
+        second.close()
+        assert len(registry) == 2
+    assert len(registry) == 0
+
+
+def test_registry_creates_outside_its_lock():
+    registry = ResourceRegistry()
+    started, release = threading.Event(), threading.Event()
+    created = []
+
+    def slow_factory():
+        started.set()
+        release.wait(5)
+        created.append(object())
+        return created[-1]
+
+    threads = [threading.Thread(target=registry.acquire, args=(("slow",), slow_factory)) for _ in range(2)]
+    threads[0].start()
+    started.wait(5)
+    threads[1].start()
+    # another key is not held up by the slow one
+    assert registry.acquire(("fast",), object) is not None
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(created) == 1 and len(registry) == 2
+
+    def failing_factory():
+        raise ConnectionError("unreachable")
+
+    with pytest.raises(ConnectionError):
+        registry.acquire(("failing",), failing_factory)
+    assert len(registry) == 2
+
+
+def test_pool_stats_count_checkouts_and_checkins(tmp_path):
+    with Text2SQLAssembly(
+            db_uri=f"sqlite:///{tmp_path}/pool.db",
+            openai_baseurl="http://127.0.0.1:9/v1",
+            openai_apikey="pool",
+            llm_model="fake-llm",
+            registry=ResourceRegistry()
+    ) as text2sql:
+        before = text2sql.pool_stats
+        first, second = text2sql.sqlalchemy_engine.connect(), text2sql.sqlalchemy_engine.connect()
+        busy = text2sql.pool_stats
+        first.close()
+        second.close()
+        after = text2sql.pool_stats
+    assert busy.checked_out == before.checked_out + 2
+    assert busy.checkouts == before.checkouts + 2 and busy.connects == before.connects + 1
+    assert after.checked_out == before.checked_out and after.checked_in == busy.checked_in + 2
+    assert after.checkouts == busy.checkouts and after.connects == busy.connects
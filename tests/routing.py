@@ -0,0 +1,76 @@
+import time
+import asyncio
+
+import openai
+import sqlalchemy
+
+from nl2sql.benchmark import FakeOpenAIServer, create_synthetic_schema
+from nl2sql.tools.text2sql.assembly import Text2SQLAssembly
+from nl2sql.utils.routing import EndpointRouter
+
+_MESSAGES = [{"role": "user", "content": "CREATE TABLE customer (id INT);"}]
+
+
+def _router(*base_urls: str, **options) -> EndpointRouter:
+    return EndpointRouter(clients=[openai.AsyncOpenAI(base_url=x, api_key="routing") for x in base_urls], **options)
+
+
+def test_requests_prefer_the_faster_endpoint():
+    with FakeOpenAIServer(latency=0.3) as slow, FakeOpenAIServer(latency=0.01) as fast:
+        router = _router(slow.base_url, fast.base_url)
+
+        async def complete():
+            for _ in range(6):
+                await router.chat.completions.create(model="fake-llm", messages=_MESSAGES)
+
+        asyncio.run(complete())
+    assert slow.requests["chat"] == 1
+    assert fast.requests["chat"] == 5
+    assert router.stats[0].latency["chat"] > router.stats[1].latency["chat"]
+
+
+def test_hedged_request_takes_the_first_answer():
+    with FakeOpenAIServer(latency=1.0) as slow, FakeOpenAIServer(latency=0.01) as fast:
+        router = _router(slow.base_url, fast.base_url, hedge_delay=0.05)
+
+        async def complete():
+            start = time.perf_counter()
+            response = await router.chat.completions.create(model="fake-llm", messages=_MESSAGES)
+            elapsed = time.perf_counter() - start
+            await asyncio.sleep(0.05)
+            return response, elapsed
+
+        response, elapsed = asyncio.run(complete())
+    assert response.choices[0].message.content
+    assert elapsed < 0.5
+    assert slow.requests["chat"] == fast.requests["chat"] == 1
+    assert [x.in_flight for x in router.stats] == [0, 0]
+
+
+def test_failing_endpoint_opens_its_circuit(tmp_path):
+    db_uri = f"sqlite:///{tmp_path}/routing.db"
+    engine = sqlalchemy.create_engine(db_uri)
+    names = create_synthetic_schema(engine, tables=2, rows=3)
+    engine.dispose()
+    with FakeOpenAIServer(latency=0.01, token_rate=10_000) as server:
+        # nothing listens on the discard port
+        text2sql = Text2SQLAssembly(
+            db_uri=db_uri,
+            openai_baseurl="http://127.0.0.1:9/v1",
+            openai_baseurls=[server.base_url],
+            openai_apikey="routing",
+            llm_model="fake-llm",
+            circuit_failures=2,
+            coalesce_requests=False
+        )
+
+        async def generate():
+            return [await text2sql.generate("list the customers", names) for _ in range(4)]
+
+        results = asyncio.run(generate())
+        stats = text2sql.endpoint_stats()
+        text2sql.close()
+    assert all(x.sql and not x.error for x in results)
+    assert server.requests["chat"] == 4
+    assert stats[0].open and stats[0].failures == 2
+    assert not stats[1].open
@@ -0,0 +1,43 @@
+import asyncio
+
+import sqlalchemy
+
+from nl2sql.benchmark import FakeOpenAIServer, create_synthetic_schema
+from nl2sql.tools.text2sql.assembly import SQLStatementComplete, Text2SQLAssembly
+from nl2sql.utils.strings import find_statement_end, skip_comments, strip_code_fence
+
+
+def test_find_statement_end_skips_quotes_comments_and_fences():
+    assert find_statement_end("SELECT ';' -- ;\n FROM t; SELECT 2;") == 23
+    assert find_statement_end("SELECT 1 /* ; */") == -1
+    fenced = "```sql\nSELECT 1;\n```"
+    assert fenced[find_statement_end(fenced)] == ";"
+    assert find_statement_end("```sql") == -1
+    # a backtick quotes identifiers on MySQL only
+    assert find_statement_end("SELECT `a;b` FROM t;", "mysql") == 19
+    assert find_statement_end("SELECT '`'; ", "postgresql") == 10
+    assert strip_code_fence("```sql\nSELECT 1;\n```") == "SELECT 1;"
+    assert strip_code_fence("SELECT 1;") == "SELECT 1;"
+    assert skip_comments("SELECT 1; -- note", 9) == 17
+    assert skip_comments("-- a\n /* b */ SELECT 1") == 14
+
+
+def test_stream_completes_fenced_statement(tmp_path):
+    db_uri = f"sqlite:///{tmp_path}/strings.db"
+    engine = sqlalchemy.create_engine(db_uri)
+    names = create_synthetic_schema(engine, tables=1, rows=3)
+    engine.dispose()
+    with FakeOpenAIServer(latency=0.01, token_rate=10_000, reply="```sql\nSELECT 1;\n```") as server:
+        text2sql = Text2SQLAssembly(
+            db_uri=db_uri,
+            openai_baseurl=server.base_url,
+            openai_apikey="strings",
+            llm_model="fake-llm"
+        )
+
+        async def stream():
+            return [x async for x in text2sql.generate_stream("one", names)]
+
+        events = asyncio.run(stream())
+        text2sql.close()
+    assert [x.sql for x in events if isinstance(x, SQLStatementComplete)] == ["SELECT 1;"]
@@ -2,3 +2,21 @@ from .config import *
 from .fmt import *
 from .text2sql import *
 from .timeout import *
+from .catalog import *
+from .embedding import *
+from .answers import *
+from .linking import *
+from .prompt import *
+from .entity import *
+from .data import *
+from .references import *
+from .benchmark import *
+from .tracing import *
+from .imports import *
+from .registry import *
+from .coalesce import *
+from .routing import *
+from .strings import *
+from .batch import *
+from .metadata import *
+from .executor import *
@@ -0,0 +1,66 @@
+import asyncio
+import tempfile
+
+import pytest
+import sqlalchemy
+
+from nl2sql.benchmark import FakeOpenAIServer, create_synthetic_schema
+from nl2sql.tools.text2sql.assembly import Text2SQLAssembly
+from nl2sql.utils.executor import run_blocking
+from nl2sql.utils.tracing import span, start_trace
+
+
+def test_span_is_noop_outside_a_trace():
+    with span("stage") as current:
+        assert current is None
+
+
+def test_trace_nests_spans_across_threads():
+    finished = []
+
+    def broken_hook(_):
+        raise RuntimeError("exporter down")
+
+    def blocking():
+        with span("inner", table="t"):
+            pass
+
+    async def traced():
+        with start_trace([finished.append, broken_hook]) as trace, span("outer"):
+            await run_blocking(blocking)
+            with pytest.raises(ValueError), span("failed"):
+                raise ValueError("boom")
+        return trace
+
+    trace = asyncio.run(traced())
+    spans = {x.name: x for x in finished}
+    assert [x.name for x in finished] == ["inner", "failed", "outer"]
+    assert spans["inner"].parent_id == spans["outer"].span_id
+    assert spans["inner"].attributes == {"table": "t"}
+    assert spans["failed"].error == "ValueError: boom"
+    assert set(trace.timings()) == {"inner", "failed", "outer"}
+
+
+def test_generate_reports_timings_and_usage():
+    with tempfile.TemporaryDirectory() as workdir, FakeOpenAIServer(latency=0, token_rate=10_000) as server:
+        db_uri = f"sqlite:///{workdir}/tracing.db"
+        engine = sqlalchemy.create_engine(db_uri)
+        names = create_synthetic_schema(engine, tables=2, rows=3)
+        engine.dispose()
+        text2sql = Text2SQLAssembly(
+            db_uri=db_uri,
+            openai_baseurl=server.base_url,
+            openai_apikey="tracing",
+            llm_model="fake-llm"
+        )
+        finished = []
+        text2sql.add_hook(finished.append)
+        result = asyncio.run(text2sql.generate("list the customers", names))
+        text2sql.sqlalchemy_engine.dispose()
+
+    assert {"generate", "query_tables_metadata", "metadata.ddl", "metadata.samples", "chat_completion"} <= set(
+        result.timings
+    )
+    assert result.timings["generate"] >= result.timings["chat_completion"]
+    assert result.usage["prompt_tokens"] > 0 and result.usage["completion_tokens"] > 0
+    assert sorted(x.attributes["table"] for x in finished if x.name == "metadata.samples") == sorted(names)